@@ -0,0 +1,196 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+
+def _atomic_write(path, write_fn, mode="w"):
+    """先写同目录临时文件再 os.replace，读端不会看到写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=directory)
+    try:
+        with os.fdopen(fd, mode) as f:
+            write_fn(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class CalibrationStore:
+    """
+    单应矩阵标定存储：
+    - camera_homography.json 保持原有格式，写入为原子替换，每次写入版本号加一
+    - 同目录生成 .npz 二进制快照（版本号 + 所有 H），读取时若与 JSON 一致则跳过 JSON 解析
+    - 最近 history 个历史版本保存在 .calib_history/ 下，便于回滚；版本号以历史目录中最大的归档版本为下限，
+      快照失效（被删除、git checkout、手工编辑）或其他进程先写入时也不会复用已有的版本号，归档文件只新建不覆盖
+    - changed()/reload_if_changed() 只做一次 os.stat，长期运行的进程可以每帧调用
+    """
+
+    def __init__(self, path="camera_homography.json", history=5):
+        self.path = path
+        self.snapshot_path = os.path.splitext(path)[0] + ".npz"
+        self.history_dir = os.path.join(os.path.dirname(os.path.abspath(path)), ".calib_history")
+        self._history_prefix = os.path.splitext(os.path.basename(path))[0] + ".v"
+        self.history = history
+        self.version = 0
+        self._entries = {}
+        self._Hs = {}
+        self._stat = None
+        if os.path.exists(path):
+            self.load()
+
+    # ---------------- 读取 ----------------
+    def _stat_key(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _load_snapshot(self, stat_key):
+        if not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with np.load(self.snapshot_path) as snap:
+                if (int(snap["json_mtime_ns"]), int(snap["json_size"])) != stat_key:
+                    return False
+                self.version = int(snap["version"])
+                self._Hs = {str(cid): H for cid, H in zip(snap["cam_ids"].tolist(), snap["Hs"])}
+        except (OSError, KeyError, ValueError):
+            return False
+        self._entries = None  # src/dst 等完整条目在需要写入时再从 JSON 读取
+        return True
+
+    def _load_json(self):
+        with open(self.path, "r") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError:
+                data = {}
+        self._entries = data
+        self._Hs = {k: np.array(v["H"], dtype=np.float64).reshape(3, 3) for k, v in data.items()}
+        # JSON 中不含版本号，以已归档的最大版本推算当前版本
+        self.version = max(self.version, self._latest_archived() + 1)
+
+    def load(self):
+        """载入标定，优先使用与 JSON 一致的二进制快照"""
+        stat_key = self._stat_key()
+        if stat_key is None:
+            self._entries, self._Hs, self._stat = {}, {}, None
+            return
+        if not self._load_snapshot(stat_key):
+            self._load_json()
+            self._write_snapshot(self._stat_key())
+        self._stat = stat_key
+
+    def changed(self):
+        """标定文件是否在上次载入后被修改"""
+        return self._stat_key() != self._stat
+
+    def reload_if_changed(self):
+        """文件变化时重新载入，返回是否发生了重新载入"""
+        if not self.changed():
+            return False
+        self.load()
+        return True
+
+    def homographies(self):
+        """返回 {cam_id(str): 3x3 H}"""
+        return dict(self._Hs)
+
+    def entries(self):
+        """返回与 HomographyProjector.homographies 相同结构的 {cam_id(str): {"H": 3x3 H}}"""
+        return {k: {"H": H} for k, H in self._Hs.items()}
+
+    # ---------------- 写入 ----------------
+    def _write_snapshot(self, stat_key):
+        if stat_key is None:
+            return
+        cam_ids = sorted(self._Hs, key=int)
+        Hs = np.stack([self._Hs[k] for k in cam_ids]) if cam_ids else np.zeros((0, 3, 3))
+
+        def write(f):
+            np.savez(f, version=self.version, cam_ids=np.array(cam_ids, dtype=np.int64), Hs=Hs,
+                     json_mtime_ns=stat_key[0], json_size=stat_key[1])
+        try:
+            _atomic_write(self.snapshot_path, write, mode="wb")
+        except OSError as e:
+            print(f"标定快照写入失败: {e}")
+
+    def _archived_versions(self):
+        """历史目录中的归档文件名，按版本升序"""
+        try:
+            names = os.listdir(self.history_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(v for v in names if v.startswith(self._history_prefix) and v.endswith(".json"))
+
+    def _latest_archived(self):
+        """已归档的最大版本号，没有归档时返回 -1"""
+        versions = self._archived_versions()
+        if not versions:
+            return -1
+        try:
+            return int(versions[-1][len(self._history_prefix):-len(".json")])
+        except ValueError:
+            return -1
+
+    def _archive(self):
+        """把当前文件归档为 .v{version}.json；该版本号已被占用时顺延，已有归档文件从不覆盖"""
+        if not self.history or not os.path.exists(self.path):
+            return
+        os.makedirs(self.history_dir, exist_ok=True)
+        with open(self.path, "r") as f:
+            content = f.read()
+        self.version = max(self.version, self._latest_archived() + 1)
+        while True:
+            target = os.path.join(self.history_dir, f"{self._history_prefix}{self.version:06d}.json")
+            try:
+                # O_EXCL 保证多个写入进程不会覆盖同一个归档文件
+                fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+            except FileExistsError:
+                self.version += 1
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+            break
+        for old in self._archived_versions()[:-self.history]:
+            os.remove(os.path.join(self.history_dir, old))
+
+    def save_many(self, calibrations):
+        """
+        原子写入多个摄像头的标定
+        :param calibrations: {cam_id: (src_points, dst_points, H)}
+        """
+        # 其他进程可能已更新文件，先合并磁盘上的最新内容
+        if self.changed() or self._entries is None:
+            if os.path.exists(self.path):
+                self._load_json()
+            self._stat = self._stat_key()
+
+        # 其他进程写入后本进程的版本号可能已过期，至少取已归档的最大版本之后
+        self.version = max(self.version, self._latest_archived() + 1)
+        self._archive()
+        for cam_id, (src, dst, H) in calibrations.items():
+            H = np.asarray(H, dtype=np.float64).reshape(3, 3)
+            self._entries[str(cam_id)] = {
+                "src": np.asarray(src).tolist(),
+                "dst": np.asarray(dst).tolist(),
+                "H": H.flatten().tolist()
+            }
+            self._Hs[str(cam_id)] = H
+
+        self.version += 1
+        _atomic_write(self.path, lambda f: json.dump(self._entries, f, indent=2))
+        self._stat = self._stat_key()
+        self._write_snapshot(self._stat)
+        return self.version
+
+    def save(self, cam_id, src, dst, H):
+        """原子写入单个摄像头的标定，返回新版本号"""
+        return self.save_many({cam_id: (src, dst, H)})
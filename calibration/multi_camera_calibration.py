@@ -3,13 +3,13 @@ from tkinter import simpledialog, messagebox
 from PIL import Image, ImageTk
 import cv2
 import numpy as np
-import json
-import os
+from calibration.calibration_store import CalibrationStore
 
 
 class MultiCameraCalibration:
-    def __init__(self, cam_frames):
+    def __init__(self, cam_frames, store_path="camera_homography.json"):
         self.cam_frames = cam_frames
+        self.store = CalibrationStore(store_path)
         self.cam_ids = list(cam_frames.keys())
         self.index = 0
 
@@ -138,25 +138,10 @@ class MultiCameraCalibration:
 
         self.Hs[cam_id] = H
 
-        file_path = "camera_homography.json"
-        data = {}
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                try:
-                    data = json.load(f)
-                except:
-                    data = {}
-
-        data[str(cam_id)] = {
-            "src": self.clicked_points,
-            "dst": dst_pts.tolist(),
-            "H": H.flatten().tolist()
-        }
-
-        with open(file_path, "w") as f:
-            json.dump(data, f, indent=2)
-
-        messagebox.showinfo("提示", f"摄像头 {cam_id} 标定保存成功！")
+        # 原子写入，正在运行的投影/拼接进程会在下一帧自动载入新标定
+        version = self.store.save(cam_id, self.clicked_points, dst_pts, H)
+
+        messagebox.showinfo("提示", f"摄像头 {cam_id} 标定保存成功！（版本 {version}）")
         return True
 
     def next_camera(self):
@@ -0,0 +1,172 @@
+import atexit
+import threading
+import time
+
+import cv2
+
+
+class CameraHandle:
+    """
+    常驻的摄像头句柄：后台线程持续读帧，调用方总是拿到最新一帧
+    设备读帧失败时自动释放并重新打开
+    """
+
+    def __init__(self, cam_id, warmup_frames=5, reopen_delay=1.0):
+        self.cam_id = cam_id
+        self.warmup_frames = warmup_frames
+        self.reopen_delay = reopen_delay
+
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_time = 0.0
+        self._seq = 0
+        self._running = False
+        self._thread = None
+        self.reopen_count = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._reader, name=f"camera-{self.cam_id}", daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.cam_id)
+        if not cap.isOpened():
+            cap.release()
+            return None
+        # 刚打开时的若干帧曝光往往不稳定，直接丢弃
+        for _ in range(self.warmup_frames):
+            cap.grab()
+        return cap
+
+    def _reader(self):
+        cap = None
+        while self._running:
+            if cap is None:
+                cap = self._open()
+                if cap is None:
+                    print(f"摄像头 {self.cam_id} 打开失败，{self.reopen_delay}s 后重试")
+                    time.sleep(self.reopen_delay)
+                    continue
+
+            ret, frame = cap.read()
+            if not ret:
+                print(f"摄像头 {self.cam_id} 读帧失败，重新打开设备")
+                cap.release()
+                cap = None
+                self.reopen_count += 1
+                time.sleep(self.reopen_delay)
+                continue
+
+            with self._cond:
+                self._frame = frame
+                self._frame_time = time.time()
+                self._seq += 1
+                self._cond.notify_all()
+
+        if cap is not None:
+            cap.release()
+
+    def read(self, timeout=2.0, copy=True, after_seq=None):
+        """
+        获取最新一帧
+        :param timeout: 等待首帧（或新帧）的最长时间，超时返回 None
+        :param copy: 是否返回副本，调用方需要在图像上绘制时应保持 True
+        :param after_seq: 只接受序号大于该值的帧，用于避免重复处理同一帧
+        :return: (frame, seq)
+        """
+        with self._cond:
+            ok = self._cond.wait_for(
+                lambda: self._frame is not None and (after_seq is None or self._seq > after_seq),
+                timeout)
+            if not ok:
+                return None, self._seq
+            frame = self._frame.copy() if copy else self._frame
+            return frame, self._seq
+
+    @property
+    def frame_age(self):
+        """最新一帧距今的秒数"""
+        with self._cond:
+            return time.time() - self._frame_time if self._frame is not None else float("inf")
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+
+class CameraPool:
+    """
+    摄像头句柄池：同一设备在进程内只打开一次，多个调用方共享
+    通过 acquire/release 引用计数管理句柄生命周期，read() 会按需打开并常驻
+    """
+
+    def __init__(self, warmup_frames=5, reopen_delay=1.0):
+        self.warmup_frames = warmup_frames
+        self.reopen_delay = reopen_delay
+        self._handles = {}
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, cam_id):
+        with self._lock:
+            handle = self._handles.get(cam_id)
+            if handle is None:
+                handle = CameraHandle(cam_id, self.warmup_frames, self.reopen_delay)
+                handle.start()
+                self._handles[cam_id] = handle
+                self._refs[cam_id] = 0
+            self._refs[cam_id] += 1
+            return handle
+
+    def release(self, cam_id):
+        with self._lock:
+            if cam_id not in self._refs:
+                return
+            self._refs[cam_id] -= 1
+            if self._refs[cam_id] > 0:
+                return
+            handle = self._handles.pop(cam_id)
+            del self._refs[cam_id]
+        handle.stop()
+
+    def read(self, cam_id, timeout=2.0, copy=True):
+        """读取某摄像头的最新一帧，设备未打开时自动打开并保持常驻，失败返回 None"""
+        with self._lock:
+            handle = self._handles.get(cam_id)
+        if handle is None:
+            handle = self.acquire(cam_id)
+        frame, _ = handle.read(timeout=timeout, copy=copy)
+        return frame
+
+    def close(self):
+        with self._lock:
+            handles = list(self._handles.values())
+            self._handles.clear()
+            self._refs.clear()
+        for handle in handles:
+            handle.stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """进程级共享的摄像头句柄池"""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = CameraPool()
+            atexit.register(_default_pool.close)
+        return _default_pool
@@ -1,4 +1,5 @@
 import cv2
+from camera.camera_pool import get_default_pool
 
 def list_cameras(max_tested=5):
     available = []
@@ -9,7 +10,19 @@ def list_cameras(max_tested=5):
             cap.release()
     return available
 
-def capture_frame(cam_id):
+def capture_frame(cam_id, pool=None, timeout=2.0):
+    """
+    获取摄像头当前帧
+    :param pool: CameraPool 实例，传入 True 使用进程级共享句柄池；为 None 时单次打开设备
+    """
+    if pool is not None:
+        if pool is True:
+            pool = get_default_pool()
+        frame = pool.read(cam_id, timeout=timeout)
+        if frame is None:
+            raise RuntimeError(f"摄像头 {cam_id} 获取图像失败")
+        return frame
+
     cap = cv2.VideoCapture(cam_id)
     ret, frame = cap.read()
     cap.release()
@@ -2,7 +2,14 @@ import cv2
 import os
 import argparse
 import threading
-from utils.data_proc_utils import get_timestamp
+import time
+from utils.data_proc_utils import get_timestamp, parse_timestamp
+from utils.frame_store import FrameStoreWriter, CODECS
+from utils import metrics
+from utils.cache_cleaner import CacheRetentionDaemon, parse_size, parse_duration
+from camera.frame_pipeline import (
+    CaptureStats, FrameRingBuffer, FrameWriterPool, encode_jpeg, DROP_OLDEST, BLOCK
+)
 import json
 
 
@@ -24,14 +31,17 @@ def capture_camera_thread(cam_id, save_dir, max_frames, interval, show_window=Tr
         if not ret:
             print(f"摄像头 {cam_id} 采集失败")
             break
+        metrics.inc("frames_grabbed", camera=cam_id)
 
         frame_count += 1
         if frame_count % interval == 0:
             timestamp = get_timestamp()
             filename = f"{timestamp}_cam{cam_id}.jpg"
             filepath = os.path.join(save_dir, filename)
-            cv2.imwrite(filepath, frame)
+            with metrics.timer("stage_seconds", stage="capture_write"):
+                cv2.imwrite(filepath, frame)
             saved_count += 1
+            metrics.inc("frames_saved", camera=cam_id)
 
             # 收集元数据
             metadata.append({
@@ -82,6 +92,151 @@ def capture_from_cameras_threaded(
 
     print("所有摄像头采集线程完成")
 
+def grab_camera_thread(cam_id, buffer, max_frames, interval, show_window=True, put_timeout=1.0):
+    """
+    流水线模式下的采集线程：只负责读帧并放入缓冲区，编码与写盘由 FrameWriterPool 完成
+    """
+    cap = cv2.VideoCapture(cam_id)
+    if not cap.isOpened():
+        print(f"摄像头 {cam_id} 打开失败")
+        buffer.close()
+        return
+
+    frame_count = 0
+    queued_count = 0
+    print(f"摄像头 {cam_id} 开始采集（流水线模式）")
+
+    while queued_count < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            print(f"摄像头 {cam_id} 采集失败")
+            break
+        buffer.stats.incr("grabbed")
+        metrics.inc("frames_grabbed", camera=cam_id)
+
+        frame_count += 1
+        if frame_count % interval == 0:
+            timestamp = get_timestamp()
+            if buffer.put((frame, cam_id, timestamp), timeout=put_timeout):
+                queued_count += 1
+            metrics.set_gauge("capture_queue_depth", len(buffer), camera=cam_id)
+
+        if show_window:
+            cv2.imshow(f"Camera {cam_id}", frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                print(f"摄像头 {cam_id} 手动终止")
+                break
+
+    cap.release()
+    if show_window:
+        cv2.destroyWindow(f"Camera {cam_id}")
+    print(f"摄像头 {cam_id} 采集结束，共入队 {queued_count} 帧")
+
+
+def _make_jpeg_writer(save_dir, metadata, lock):
+    def write(item, data):
+        _, cam_id, timestamp = item
+        filename = f"{timestamp}_cam{cam_id}.jpg"
+        with open(os.path.join(save_dir, filename), "wb") as f:
+            f.write(data)
+        with lock:
+            metadata.append({
+                "timestamp": timestamp,
+                "camera_id": cam_id,
+                "filename": filename
+            })
+    return write
+
+
+def _make_store_writer(store):
+    def write(item, data):
+        frame, cam_id, timestamp = item
+        store.append(cam_id, frame, parse_timestamp(timestamp), encoded=data)
+    return write
+
+
+def capture_from_cameras_pipelined(
+    camera_ids=[0],
+    max_frames=100,
+    interval=1,
+    save_root=None,
+    show_window=True,
+    buffer_size=8,
+    drop_policy=DROP_OLDEST,
+    num_writers=2,
+    jpeg_quality=95,
+    stats_interval=5.0,
+    store_dir=None,
+    store_codec="jpeg"
+):
+    """
+    采集/编码/写盘解耦的多摄像头采集：
+    每个摄像头一个采集线程写入有界缓冲区，共享的编码写盘线程池负责落盘
+    :param store_dir: 指定后写入分段帧存储（utils.frame_store），不再逐帧生成 JPEG 文件
+    :param store_codec: 帧存储的编码格式 raw / jpeg / png
+    :return: {cam_id: 计数器字典}
+    """
+    if save_root is None:
+        save_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '../Cache'))
+    os.makedirs(save_root, exist_ok=True)
+
+    store = None
+    if store_dir is not None:
+        store = FrameStoreWriter(store_dir, codec=store_codec, jpeg_quality=jpeg_quality)
+        pool = FrameWriterPool(num_workers=num_writers, encode=store.encode)
+    else:
+        pool = FrameWriterPool(num_workers=num_writers,
+                               encode=lambda frame: encode_jpeg(frame, jpeg_quality))
+    buffers, metadata, save_dirs = {}, {}, {}
+    lock = threading.Lock()
+    for cam_id in camera_ids:
+        metadata[cam_id] = []
+        buffers[cam_id] = FrameRingBuffer(buffer_size, drop_policy, CaptureStats())
+        if store is not None:
+            pool.register(buffers[cam_id], _make_store_writer(store))
+        else:
+            save_dirs[cam_id] = os.path.join(save_root, f"camera_{cam_id}")
+            os.makedirs(save_dirs[cam_id], exist_ok=True)
+            pool.register(buffers[cam_id], _make_jpeg_writer(save_dirs[cam_id], metadata[cam_id], lock))
+    pool.start()
+
+    threads = []
+    for cam_id in camera_ids:
+        t = threading.Thread(target=grab_camera_thread, args=(
+            cam_id, buffers[cam_id], max_frames, interval, show_window))
+        t.start()
+        threads.append(t)
+
+    last_report = time.monotonic()
+    while any(t.is_alive() for t in threads):
+        for t in threads:
+            t.join(timeout=0.2)
+        if stats_interval and time.monotonic() - last_report >= stats_interval:
+            last_report = time.monotonic()
+            for cam_id, buffer in buffers.items():
+                print(f"摄像头 {cam_id}: 缓冲 {len(buffer)}/{buffer.capacity} {buffer.stats}")
+
+    pool.close()
+
+    stats = {}
+    if store is not None:
+        store.close()
+        for cam_id in camera_ids:
+            stats[cam_id] = buffers[cam_id].stats.snapshot()
+            print(f"摄像头 {cam_id} 采集完成: {buffers[cam_id].stats}")
+        print(f"所有摄像头采集线程完成，帧存储目录：{store_dir}")
+        return stats
+
+    for cam_id in camera_ids:
+        records = sorted(metadata[cam_id], key=lambda r: r["timestamp"])
+        with open(os.path.join(save_dirs[cam_id], "metadata.json"), "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+        stats[cam_id] = buffers[cam_id].stats.snapshot()
+        print(f"摄像头 {cam_id} 采集完成: {buffers[cam_id].stats}")
+
+    print("所有摄像头采集线程完成")
+    return stats
+
 # -------------------------------
 # CLI 入口
 # -------------------------------
@@ -92,7 +247,54 @@ def main():
     parser.add_argument('--interval', type=int, default=1)
     parser.add_argument('--save_dir', type=str, default=None)
     parser.add_argument('--no_window', action='store_true')
+    parser.add_argument('--pipeline', action='store_true', help='采集与编码写盘解耦的流水线模式')
+    parser.add_argument('--buffer_size', type=int, default=8, help='每个摄像头的帧缓冲区大小')
+    parser.add_argument('--drop_policy', type=str, default=DROP_OLDEST, choices=[DROP_OLDEST, BLOCK],
+                        help='缓冲区满时的丢帧策略')
+    parser.add_argument('--writers', type=int, default=2, help='编码写盘线程数')
+    parser.add_argument('--jpeg_quality', type=int, default=95)
+    parser.add_argument('--store_dir', type=str, default=None, help='写入分段帧存储目录（需配合 --pipeline）')
+    parser.add_argument('--store_codec', type=str, default='jpeg', choices=list(CODECS), help='帧存储编码格式')
+    parser.add_argument('--max_cache_size', type=str, default=None, help='采集期间后台保持缓存低于该容量，如 20G')
+    parser.add_argument('--max_cache_age', type=str, default=None, help='采集期间后台删除超过该时长的帧，如 12h')
     args = parser.parse_args()
+    metrics.configure_from_env()
+
+    retention = None
+    if args.max_cache_size or args.max_cache_age:
+        # 采集按当前工作目录解析相对路径，这里同样转成绝对路径，保证清理的就是采集写入的目录
+        cache_dir = args.store_dir if args.pipeline and args.store_dir else (
+            args.save_dir or os.path.join(os.path.dirname(__file__), '../Cache'))
+        cache_dir = os.path.abspath(cache_dir)
+        retention = CacheRetentionDaemon(
+            cache_dir,
+            max_bytes=parse_size(args.max_cache_size) if args.max_cache_size else None,
+            max_age=parse_duration(args.max_cache_age) if args.max_cache_age else None
+        ).start()
+
+    try:
+        _run_capture(args)
+    finally:
+        if retention is not None:
+            retention.stop()
+
+
+def _run_capture(args):
+    if args.pipeline:
+        capture_from_cameras_pipelined(
+            camera_ids=args.camera_ids,
+            max_frames=args.max_frames,
+            interval=args.interval,
+            save_root=args.save_dir,
+            show_window=not args.no_window,
+            buffer_size=args.buffer_size,
+            drop_policy=args.drop_policy,
+            num_writers=args.writers,
+            jpeg_quality=args.jpeg_quality,
+            store_dir=args.store_dir,
+            store_codec=args.store_codec
+        )
+        return
 
     capture_from_cameras_threaded(
         camera_ids=args.camera_ids,
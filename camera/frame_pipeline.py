@@ -0,0 +1,178 @@
+import threading
+from collections import deque
+
+import cv2
+
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+
+class CaptureStats:
+    """单个摄像头采集流水线的计数器（线程安全）"""
+
+    FIELDS = ("grabbed", "queued", "dropped", "encoded", "written", "failed")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in self.FIELDS}
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self._counts[name] += n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def __repr__(self):
+        return " ".join(f"{k}={v}" for k, v in self.snapshot().items())
+
+
+class FrameRingBuffer:
+    """
+    有界帧缓冲区，采集线程写入，编码/写盘线程池读取
+    drop_policy:
+        drop_oldest —— 缓冲区满时丢弃最旧的一帧，采集线程永不阻塞
+        block       —— 缓冲区满时等待空位，超时后丢弃当前帧
+    """
+
+    def __init__(self, capacity=8, drop_policy=DROP_OLDEST, stats=None):
+        if drop_policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError(f"未知的丢帧策略: {drop_policy}")
+        self.capacity = max(1, int(capacity))
+        self.drop_policy = drop_policy
+        self.stats = stats or CaptureStats()
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._closed = False
+
+    def add_listener(self, semaphore):
+        """注册一个信号量，每新增一帧可用数据时 release 一次"""
+        self._listeners.append(semaphore)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item, timeout=None):
+        """写入一帧，返回该帧是否进入缓冲区"""
+        replaced = False
+        with self._cond:
+            if self._closed:
+                return False
+            if len(self._items) >= self.capacity:
+                if self.drop_policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.stats.incr("dropped")
+                    replaced = True
+                else:
+                    ok = self._cond.wait_for(
+                        lambda: len(self._items) < self.capacity or self._closed, timeout)
+                    if not ok or self._closed:
+                        self.stats.incr("dropped")
+                        return False
+            self._items.append(item)
+            self.stats.incr("queued")
+            self._cond.notify_all()
+
+        # 替换旧帧时可用帧数不变，无需通知消费者
+        if not replaced:
+            for sem in self._listeners:
+                sem.release()
+        return True
+
+    def pop_nowait(self):
+        """取出最旧的一帧，缓冲区为空时返回 None"""
+        with self._cond:
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def encode_jpeg(frame, quality=95):
+    """将 BGR 图像编码为 JPEG 字节串"""
+    ok, buf = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    if not ok:
+        raise RuntimeError("JPEG 编码失败")
+    return buf.tobytes()
+
+
+class FrameWriterPool:
+    """
+    编码/写盘线程池，从多个 FrameRingBuffer 中取帧
+    每个缓冲区注册一个 writer(item, data)，encode(item[0]) 的返回值作为 data 传入
+    缓冲区中的元素约定为 (frame, ...)，第一个字段为图像
+    """
+
+    def __init__(self, num_workers=2, encode=encode_jpeg):
+        self.num_workers = max(1, int(num_workers))
+        self.encode = encode
+        self._sources = []
+        self._available = threading.Semaphore(0)
+        self._stop = threading.Event()
+        self._threads = []
+        self._cursor = 0
+        self._cursor_lock = threading.Lock()
+
+    def register(self, buffer, writer):
+        buffer.add_listener(self._available)
+        self._sources.append((buffer, writer))
+
+    def start(self):
+        for i in range(self.num_workers):
+            t = threading.Thread(target=self._worker, name=f"frame-writer-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _next_item(self):
+        # 轮询各缓冲区，避免某个摄像头长期占用线程池
+        with self._cursor_lock:
+            start = self._cursor
+            self._cursor = (self._cursor + 1) % max(1, len(self._sources))
+        for k in range(len(self._sources)):
+            buffer, writer = self._sources[(start + k) % len(self._sources)]
+            item = buffer.pop_nowait()
+            if item is not None:
+                return buffer, writer, item
+        return None
+
+    def _process(self, buffer, writer, item):
+        try:
+            data = self.encode(item[0])
+            buffer.stats.incr("encoded")
+            writer(item, data)
+            buffer.stats.incr("written")
+        except Exception as e:
+            buffer.stats.incr("failed")
+            print(f"帧写入失败: {e}")
+
+    def _worker(self):
+        while True:
+            self._available.acquire()
+            picked = self._next_item()
+            if picked is not None:
+                self._process(*picked)
+                continue
+            if self._stop.is_set():
+                # 退出前把剩余帧写完
+                while (picked := self._next_item()) is not None:
+                    self._process(*picked)
+                return
+
+    def close(self):
+        """关闭所有缓冲区，写完剩余帧后停止线程池"""
+        for buffer, _ in self._sources:
+            buffer.close()
+        self._stop.set()
+        for _ in self._threads:
+            self._available.release()
+        for t in self._threads:
+            t.join()
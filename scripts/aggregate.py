@@ -1,7 +1,10 @@
+import time
+from collections import deque
 import numpy as np
 from sklearn.cluster import DBSCAN
 import matplotlib.pyplot as plt
 from generate import HomographyProjector
+from utils.metrics import configure_from_env, timed
 
 class PointMerger:
     def __init__(self, distance_dict=None, default_thresh=10):
@@ -9,6 +12,7 @@ class PointMerger:
         self.default_thresh = default_thresh
         self.merged_array = None  # 保存 merge 的结果以供可视化使用
 
+    @timed("merge")
     def merge(self, arr):
         merged_results = []
         classes = np.unique(arr[:, 0].astype(int))
@@ -46,19 +50,36 @@ class PointMerger:
         self.merged_array = np.array(merged_results)
         return self.merged_array
 
-    def show(self):
+    def merge_store(self, reader, projector, start_ms=None, end_ms=None, conf_thresh=0.4):
+        """
+        合并检测结果存储中时间范围 [start_ms, end_ms) 内的检测
+        :param reader: utils.detection_store.DetectionStoreReader
+        :param projector: 提供单应矩阵的 HomographyProjector
+        """
+        return self.merge(projector.project_store(reader, start_ms, end_ms, conf_thresh))
+
+    def show(self, save_path=None):
+        """
+        可视化合并结果，每个类别一个散点图层
+        :param save_path: 指定时保存为图片而不弹出窗口（适用于无显示器环境）
+        """
         if self.merged_array is None:
             raise RuntimeError("请先调用 merge() 方法生成数据。")
 
         plt.figure(figsize=(8, 8))
-        for cls, x, y, conf in self.merged_array:
-            plt.scatter(x, y, label=f'class {int(cls)} ({conf:.2f})', alpha=0.6)
+        for cls in np.unique(self.merged_array[:, 0]):
+            pts = self.merged_array[self.merged_array[:, 0] == cls]
+            plt.scatter(pts[:, 1], pts[:, 2], label=f'class {int(cls)} ({len(pts)})', alpha=0.6)
         plt.title("Merged Points After Clustering")
         plt.xlabel("X (World)")
         plt.ylabel("Y (World)")
         plt.grid(True)
         plt.legend()
-        plt.show()
+        if save_path:
+            plt.savefig(save_path, dpi=150)
+            plt.close()
+        else:
+            plt.show()
 
     def write(self, filename="merged_points.npy"):
         """
@@ -74,10 +95,11 @@ class PointMerger:
             np.savetxt(filename, self.merged_array, delimiter=",", fmt="%.4f", header="class,x,y,confidence", comments='')
         else:
             raise ValueError("仅支持 .npy 或 .csv 格式的文件")
-    def export_json(self, filename="merged_points.json"):
+    def export_json(self, filename="merged_points.json", indent=2):
         """
         将合并后的结果保存为 JSON 格式。
         每个目标是一个 dict，字段为 class, x, y, confidence。
+        indent 为 None 时输出紧凑格式（无缩进与多余空格），适合大量点或机器读取。
         """
         if self.merged_array is None:
             raise RuntimeError("请先调用 merge() 方法生成数据。")
@@ -94,14 +116,256 @@ class PointMerger:
             output.append(obj)
 
         with open(filename, "w", encoding="utf-8") as f:
-            json.dump(output, f, ensure_ascii=False, indent=2)
+            json.dump(output, f, ensure_ascii=False, indent=indent,
+                      separators=None if indent is not None else (",", ":"))
+
+
+
+class _Cluster:
+    """增量合并中的一个簇，维护成员与加权质心所需的累加量"""
+    __slots__ = ("members", "min_id", "n", "sw", "swx", "swy", "sx", "sy")
+
+    def __init__(self):
+        self.members = set()
+        self.min_id = None
+        self.n = 0
+        self.sw = self.swx = self.swy = self.sx = self.sy = 0.0
+
+    def add(self, pid, x, y, w):
+        self.members.add(pid)
+        if self.min_id is None or pid < self.min_id:
+            self.min_id = pid
+        self.n += 1
+        self.sw += w
+        self.swx += w * x
+        self.swy += w * y
+        self.sx += x
+        self.sy += y
+
+    def discard(self, pid, x, y, w):
+        self.members.discard(pid)
+        self.n -= 1
+        self.sw -= w
+        self.swx -= w * x
+        self.swy -= w * y
+        self.sx -= x
+        self.sy -= y
+        if pid == self.min_id:
+            self.min_id = min(self.members) if self.members else None
+
+    def centroid(self):
+        """与 PointMerger.merge 相同的合并规则"""
+        if self.sw == 0:
+            return self.sx / self.n, self.sy / self.n, 0.0
+        return self.swx / self.sw, self.swy / self.sw, self.sw / self.n
+
+
+class _ClassGrid:
+    """
+    单个类别的空间哈希网格，格子边长等于该类别的合并距离阈值，
+    因此任意点的邻居只可能落在周围 3x3 个格子内
+    """
+
+    def __init__(self, eps):
+        self.eps = float(eps)
+        self.eps2 = self.eps ** 2
+        self.cells = {}
+        self.labels = {}
+        self.clusters = {}
+
+    def cell_of(self, x, y):
+        return int(np.floor(x / self.eps)), int(np.floor(y / self.eps))
+
+    def neighbors(self, points, pid, x, y):
+        cx, cy = self.cell_of(x, y)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for other in self.cells.get((cx + dx, cy + dy), ()):
+                    if other == pid:
+                        continue
+                    ox, oy = points[other][1], points[other][2]
+                    if (ox - x) ** 2 + (oy - y) ** 2 <= self.eps2:
+                        yield other
+
+
+class IncrementalPointMerger(PointMerger):
+    """
+    支持增量插入/删除的点合并器，结果与 PointMerger.merge 一致（DBSCAN, min_samples=1 即 eps 邻接图的连通分量）。
+    每个类别维护一个空间哈希网格，插入只检查周围格子并合并相邻簇；
+    删除时仅在原簇内部重新做连通性检查，不会对全量数据重新聚类。
+    """
+
+    def __init__(self, distance_dict=None, default_thresh=10, max_age=None):
+        """
+        :param max_age: 点的最长保留时间（秒），配合 expire() 使用；None 表示不过期
+        """
+        super().__init__(distance_dict, default_thresh)
+        self.max_age = max_age
+        self._points = {}      # pid -> (cls, x, y, conf, timestamp)
+        self._grids = {}       # cls -> _ClassGrid
+        self._timeline = deque()
+        self._next_pid = 0
+        self._next_cid = 0
+
+    def __len__(self):
+        return len(self._points)
+
+    def _grid(self, cls):
+        grid = self._grids.get(cls)
+        if grid is None:
+            grid = _ClassGrid(self.distance_dict.get(cls, self.default_thresh))
+            self._grids[cls] = grid
+        return grid
+
+    def _new_cluster(self, grid):
+        cid = self._next_cid
+        self._next_cid += 1
+        grid.clusters[cid] = _Cluster()
+        return cid
+
+    def reset(self):
+        self._points.clear()
+        self._grids.clear()
+        self._timeline.clear()
+        self.merged_array = None
+
+    def insert(self, cls, x, y, conf, timestamp=None):
+        """插入一个点，返回其 id"""
+        cls = int(cls)
+        x, y, conf = float(x), float(y), float(conf)
+        timestamp = time.time() if timestamp is None else timestamp
+        pid = self._next_pid
+        self._next_pid += 1
+        self._points[pid] = (cls, x, y, conf, timestamp)
+        self._timeline.append((timestamp, pid))
+
+        grid = self._grid(cls)
+        touched = {grid.labels[other] for other in grid.neighbors(self._points, pid, x, y)}
+        if not touched:
+            cid = self._new_cluster(grid)
+        else:
+            # 小簇并入大簇，均摊代价与点数成对数关系
+            cid = max(touched, key=lambda c: grid.clusters[c].n)
+            target = grid.clusters[cid]
+            for other_cid in touched:
+                if other_cid == cid:
+                    continue
+                for member in grid.clusters.pop(other_cid).members:
+                    _, mx, my, mconf, _ = self._points[member]
+                    target.add(member, mx, my, mconf)
+                    grid.labels[member] = cid
+
+        grid.clusters[cid].add(pid, x, y, conf)
+        grid.labels[pid] = cid
+        grid.cells.setdefault(grid.cell_of(x, y), set()).add(pid)
+        return pid
+
+    def insert_array(self, arr, timestamp=None):
+        """批量插入 (N, 4) 数组 [cls, x, y, conf]，返回 id 列表"""
+        return [self.insert(row[0], row[1], row[2], row[3], timestamp) for row in np.asarray(arr)]
+
+    def remove(self, pid):
+        """删除一个点，若其所在簇因此断开则拆分为多个簇"""
+        if pid not in self._points:
+            return False
+        cls, x, y, conf, _ = self._points[pid]
+        grid = self._grids[cls]
+        cell = grid.cell_of(x, y)
+        grid.cells[cell].discard(pid)
+        if not grid.cells[cell]:
+            del grid.cells[cell]
+
+        cid = grid.labels.pop(pid)
+        cluster = grid.clusters[cid]
+        degree = sum(1 for _ in grid.neighbors(self._points, pid, x, y))
+        del self._points[pid]
+        cluster.discard(pid, x, y, conf)
+
+        if not cluster.members:
+            del grid.clusters[cid]
+            return True
+
+        # 只有一个邻居的点被删除不会破坏连通性，从累加量中扣除即可
+        if degree > 1:
+            self._split_cluster(grid, cid, cluster.members)
+        return True
+
+    def _rebuild_cluster(self, grid, cid, members):
+        cluster = _Cluster()
+        for member in members:
+            _, mx, my, mconf, _ = self._points[member]
+            cluster.add(member, mx, my, mconf)
+            grid.labels[member] = cid
+        grid.clusters[cid] = cluster
+
+    def _split_cluster(self, grid, cid, members):
+        remaining = set(members)
+        first = True
+        while remaining:
+            seed = remaining.pop()
+            component = {seed}
+            stack = [seed]
+            while stack:
+                cur = stack.pop()
+                _, cx, cy, _, _ = self._points[cur]
+                for other in grid.neighbors(self._points, cur, cx, cy):
+                    if other in remaining:
+                        remaining.discard(other)
+                        component.add(other)
+                        stack.append(other)
+            target = cid if first else self._new_cluster(grid)
+            self._rebuild_cluster(grid, target, component)
+            first = False
+
+    def expire(self, now=None):
+        """删除早于 now - max_age 的点，返回删除数量"""
+        if self.max_age is None:
+            return 0
+        now = time.time() if now is None else now
+        return self.expire_before(now - self.max_age)
+
+    def expire_before(self, timestamp):
+        """删除时间戳早于 timestamp 的点（按插入顺序扫描），返回删除数量"""
+        removed = 0
+        while self._timeline and self._timeline[0][0] < timestamp:
+            _, pid = self._timeline.popleft()
+            if self.remove(pid):
+                removed += 1
+        return removed
+
+    def snapshot(self):
+        """输出当前合并结果，格式与 merge() 相同"""
+        merged_results = []
+        for cls in sorted(self._grids):
+            clusters = sorted(self._grids[cls].clusters.values(), key=lambda c: c.min_id)
+            for cluster in clusters:
+                weighted_x, weighted_y, total_conf = cluster.centroid()
+                merged_results.append([cls, weighted_x, weighted_y, total_conf])
+        self.merged_array = np.array(merged_results)
+        return self.merged_array
+
+    @timed("merge")
+    def merge(self, arr):
+        """与 PointMerger.merge 接口一致：清空后整体插入"""
+        self.reset()
+        self.insert_array(arr)
+        return self.snapshot()
 
 
 
 # ✅ 示例用法
 if __name__ == "__main__":
-    projector = HomographyProjector()
-    projector.run(conf_thresh=0.4)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="投影并合并多摄像头检测结果")
+    parser.add_argument('--conf', type=float, default=0.4, help='置信度阈值')
+    parser.add_argument('--inference_cache', type=str, default=None,
+                        help='推理结果缓存目录（如 ../.inference_cache），指定时调整阈值或合并距离重复运行时无需重新推理')
+    args = parser.parse_args()
+    configure_from_env()
+
+    projector = HomographyProjector(inference_cache=args.inference_cache)
+    projector.run(conf_thresh=args.conf)
     final_array = projector.final_array
 
     distance_dict = {
@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 from calibration import calibrate_homography
+from camera.camera_pool import CameraPool
 
 
 def detect_cameras(max_test=5):
@@ -22,13 +23,12 @@ def main():
         print("未检测到摄像头")
         return
 
-    # 采集一帧
+    # 采集一帧（设备保持打开，标定结束后的实时显示无需重新打开）
+    pool = CameraPool()
     cam_frames = {}
     for cam_id in camera_indices:
-        cap = cv2.VideoCapture(cam_id)
-        ret, frame = cap.read()
-        cap.release()
-        if ret:
+        frame = pool.read(cam_id)
+        if frame is not None:
             cam_frames[cam_id] = frame
         else:
             print(f"摄像头 {cam_id} 采集帧失败")
@@ -38,33 +38,36 @@ def main():
         Hs = calibrate_homography.calibrate_camera(cam_frames)
     except Exception as e:
         print("标定失败:", e)
+        pool.close()
         return
 
     # 打开摄像头，实时显示世界坐标
-    caps = {cid: cv2.VideoCapture(cid) for cid in Hs.keys()}
+    for cid in Hs.keys():
+        pool.acquire(cid)
+
+    # ======== 显示绝对坐标系下的参考点 ========
+    ref_world_pts = np.array([
+        [[0, 0]],
+        [[100, 0]],
+        [[0, 100]],
+        [[100, 100]]
+    ], dtype=np.float32)  # (4, 1, 2)
+
+    # 将世界坐标点映射到图像坐标系中（使用逆H），每个摄像头只计算一次
+    ref_img_pts_by_cam = {cid: cv2.perspectiveTransform(ref_world_pts, np.linalg.inv(H))
+                          for cid, H in Hs.items()}
 
     print("按 q 键退出")
     while True:
-        for cid, cap in caps.items():
-            ret, frame = cap.read()
-            if not ret:
+        for cid in Hs.keys():
+            frame = pool.read(cid, timeout=0.5)
+            if frame is None:
                 continue
 
             h, w = frame.shape[:2]
 
-            # 获取当前摄像头对应的单应矩阵
-            H = Hs[cid]
-
-            # ======== 显示绝对坐标系下的参考点 ========
-            ref_world_pts = np.array([
-                [[0, 0]],
-                [[100, 0]],
-                [[0, 100]],
-                [[100, 100]]
-            ], dtype=np.float32)  # (4, 1, 2)
-
-            # 将世界坐标点映射到图像坐标系中（使用逆H）
-            ref_img_pts = cv2.perspectiveTransform(ref_world_pts, np.linalg.inv(H))
+            # 参考点在图像中的位置只取决于单应矩阵，已在循环外预先计算
+            ref_img_pts = ref_img_pts_by_cam[cid]
 
             labels = ["O", "X", "Y", "M"]
             for i, pt in enumerate(ref_img_pts):
@@ -80,8 +83,7 @@ def main():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    for cap in caps.values():
-        cap.release()
+    pool.close()
     cv2.destroyAllWindows()
 
 
@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 from calibration import calibrate_homography
+from camera.camera_pool import CameraPool
 
 
 def detect_cameras(max_test=5):
@@ -57,30 +58,33 @@ def main():
         return
 
     # 打开摄像头，实时显示世界坐标
-    caps = {cid: cv2.VideoCapture(cid) for cid in Hs.keys()}
+    pool = CameraPool()
+    for cid in Hs.keys():
+        pool.acquire(cid)
+
+    # ======== 显示绝对坐标系下的参考点 ========
+    ref_world_pts = np.array([
+        [[0, 0]],
+        [[100, 0]],
+        [[0, 100]],
+        [[50, 500]]
+    ], dtype=np.float32)  # (4, 1, 2)
+
+    # 将世界坐标点映射到图像坐标系中（使用逆H），每个摄像头只计算一次
+    ref_img_pts_by_cam = {cid: cv2.perspectiveTransform(ref_world_pts, np.linalg.inv(H))
+                          for cid, H in Hs.items()}
 
     print("按 q 键退出")
     while True:
-        for cid, cap in caps.items():
-            ret, frame = cap.read()
-            if not ret:
+        for cid in Hs.keys():
+            frame = pool.read(cid, timeout=0.5)
+            if frame is None:
                 continue
 
             h, w = frame.shape[:2]
 
-            # 获取当前摄像头对应的单应矩阵
-            H = Hs[cid]
-
-            # ======== 显示绝对坐标系下的参考点 ========
-            ref_world_pts = np.array([
-                [[0, 0]],
-                [[100, 0]],
-                [[0, 100]],
-                [[50, 500]]
-            ], dtype=np.float32)  # (4, 1, 2)
-
-            # 将世界坐标点映射到图像坐标系中（使用逆H）
-            ref_img_pts = cv2.perspectiveTransform(ref_world_pts, np.linalg.inv(H))
+            # 参考点在图像中的位置只取决于单应矩阵，已在循环外预先计算
+            ref_img_pts = ref_img_pts_by_cam[cid]
 
             labels = ["O", "X", "Y", "M"]
             for i, pt in enumerate(ref_img_pts):
@@ -96,8 +100,7 @@ def main():
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
-    for cap in caps.values():
-        cap.release()
+    pool.close()
     cv2.destroyAllWindows()
 
 
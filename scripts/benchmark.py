@@ -0,0 +1,362 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from utils.projector import project_points
+from utils.cache_cleaner import clean_cache
+from utils.frame_store import FrameStoreWriter
+from camera.frame_pipeline import encode_jpeg
+from generate import HomographyProjector
+from aggregate import PointMerger
+from patrol import solve_tsp_fixed_end
+
+
+# -------------------------------
+# 合成数据
+# -------------------------------
+def synthetic_homography(rng):
+    """生成一个数值稳定的单应矩阵：缩放 + 旋转 + 平移 + 轻微透视"""
+    angle = rng.uniform(-np.pi, np.pi)
+    scale = rng.uniform(0.2, 1.0)
+    c, s = np.cos(angle) * scale, np.sin(angle) * scale
+    H = np.array([
+        [c, -s, rng.uniform(-100, 100)],
+        [s, c, rng.uniform(-100, 100)],
+        [rng.uniform(-1e-4, 1e-4), rng.uniform(-1e-4, 1e-4), 1.0]
+    ])
+    return H
+
+
+def synthetic_frames(rng, n, height=480, width=640):
+    frames = []
+    for _ in range(n):
+        # 低频噪声 + 随机矩形，JPEG 压缩比接近真实场景
+        frame = cv2.resize(rng.integers(0, 255, (height // 16, width // 16, 3), dtype=np.uint8),
+                           (width, height), interpolation=cv2.INTER_LINEAR)
+        for _ in range(5):
+            x, y = int(rng.integers(0, width - 50)), int(rng.integers(0, height - 50))
+            cv2.rectangle(frame, (x, y), (x + 50, y + 50), rng.integers(0, 255, 3).tolist(), -1)
+        frames.append(frame)
+    return frames
+
+
+def synthetic_xyxy(rng, n, width=640, height=480):
+    x1 = rng.uniform(0, width - 40, n)
+    y1 = rng.uniform(0, height - 40, n)
+    w = rng.uniform(10, 40, n)
+    h = rng.uniform(10, 40, n)
+    return np.column_stack([x1, y1, x1 + w, y1 + h])
+
+
+def synthetic_point_cloud(rng, n, num_classes=5, extent=1000.0, cluster_size=4):
+    """合成多摄像头重复观测的世界坐标点 [cls, x, y, conf]"""
+    centers = rng.uniform(0, extent, (max(1, n // cluster_size), 2))
+    idx = rng.integers(0, len(centers), n)
+    xy = centers[idx] + rng.normal(0, 2.0, (n, 2))
+    cls = idx % num_classes
+    conf = rng.uniform(0.3, 1.0, n)
+    return np.column_stack([cls, xy, conf])
+
+
+class _StubBoxes:
+    """模拟 ultralytics Boxes 的 numpy 版本"""
+
+    def __init__(self, cls, conf, xyxy):
+        self.cls, self.conf, self.xyxy = cls, conf, xyxy
+
+    def __len__(self):
+        return len(self.cls)
+
+
+class _StubResult:
+    def __init__(self, boxes, frame):
+        self.boxes = boxes
+        self._frame = frame
+
+    def plot(self):
+        return self._frame
+
+
+class StubDetector:
+    """
+    桩检测器：不加载 .pt 权重，按固定数量为每帧生成随机检测框，
+    用于在没有模型的环境下测量推理之外的各阶段
+    """
+
+    def __init__(self, boxes_per_frame=50, num_classes=5, seed=0):
+        self.boxes_per_frame = boxes_per_frame
+        self.num_classes = num_classes
+        self.rng = np.random.default_rng(seed)
+
+    def __call__(self, source, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        results = []
+        for frame in frames:
+            n = self.boxes_per_frame
+            h, w = frame.shape[:2]
+            boxes = _StubBoxes(self.rng.integers(0, self.num_classes, n).astype(np.float32),
+                               self.rng.uniform(0, 1, n).astype(np.float32),
+                               synthetic_xyxy(self.rng, n, w, h).astype(np.float32))
+            results.append(_StubResult(boxes, frame))
+        return results
+
+
+# -------------------------------
+# 计时
+# -------------------------------
+def measure(fn, repeats, warmup=1, items=1):
+    """
+    重复执行 fn 并统计耗时
+    :param items: 单次调用处理的条目数，用于计算吞吐量
+    """
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return {
+        "repeats": repeats,
+        "items": items,
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p90_ms": float(np.percentile(samples, 90)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+        "throughput": float(items / (samples.mean() / 1000)) if samples.mean() > 0 else 0.0,
+    }
+
+
+# -------------------------------
+# 各阶段基准
+# -------------------------------
+def bench_project_points(rng, cfg):
+    H = synthetic_homography(rng)
+    pts = rng.uniform(0, 640, (cfg["points"], 2))
+    return measure(lambda: project_points(H, pts), cfg["repeats"], items=len(pts))
+
+
+def bench_projector(rng, cfg, workdir):
+    cams = cfg["cameras"]
+    homographies = {str(c): {"src": [], "dst": [], "H": synthetic_homography(rng).flatten().tolist()}
+                    for c in range(cams)}
+    path = os.path.join(workdir, "camera_homography.json")
+    with open(path, "w") as f:
+        json.dump(homographies, f)
+
+    detector = StubDetector(cfg["boxes_per_camera"], seed=int(rng.integers(1 << 31)))
+    projector = HomographyProjector(homography_path=path, cache_dir=workdir,
+                                    batch_size=cfg["batch_size"], model=detector)
+    frames = {str(c): f for c, f in enumerate(synthetic_frames(rng, cams, 240, 320))}
+    boxes_by_cam = projector.detect(frames)
+
+    n = cams * cfg["boxes_per_camera"]
+    return {
+        "project_boxes": measure(lambda: projector.project_boxes(boxes_by_cam, 0.4),
+                                 cfg["repeats"], items=n),
+        "detect_stub": measure(lambda: projector.detect(frames), cfg["repeats"], items=cams),
+    }
+
+
+def bench_merge(rng, cfg):
+    arr = synthetic_point_cloud(rng, cfg["merge_points"])
+    merger = PointMerger(distance_dict={0: 10, 1: 10, 2: 20, 3: 10, 4: 20}, default_thresh=10)
+    return measure(lambda: merger.merge(arr), cfg["repeats"], items=len(arr))
+
+
+def bench_tsp(rng, cfg):
+    pts = rng.uniform(0, 1000, (cfg["tsp_points"], 2))
+    lengths = []
+
+    def run():
+        _, stats = solve_tsp_fixed_end(pts, 0, len(pts) - 1, time_limit=cfg["tsp_time_limit"],
+                                       return_stats=True)
+        lengths.append(stats["length"])
+
+    result = measure(run, max(1, cfg["repeats"] // 10), warmup=0, items=len(pts))
+    result["route_length"] = float(np.mean(lengths))
+    return result
+
+
+def bench_capture_writes(rng, cfg, workdir):
+    frames = synthetic_frames(rng, cfg["frames"])
+    jpeg_dir = os.path.join(workdir, "jpeg")
+    os.makedirs(jpeg_dir, exist_ok=True)
+    counter = [0]
+
+    def write_jpeg_files():
+        for frame in frames:
+            counter[0] += 1
+            with open(os.path.join(jpeg_dir, f"{counter[0]:08d}_cam0.jpg"), "wb") as f:
+                f.write(encode_jpeg(frame))
+
+    results = {"jpeg_files": measure(write_jpeg_files, cfg["repeats"] // 10 or 1, items=len(frames))}
+
+    for codec in ("jpeg", "raw"):
+        store = FrameStoreWriter(os.path.join(workdir, f"store_{codec}"), codec=codec)
+
+        def write_store():
+            for i, frame in enumerate(frames):
+                store.append(i % 4, frame)
+
+        results[f"frame_store_{codec}"] = measure(write_store, cfg["repeats"] // 10 or 1, items=len(frames))
+        store.close()
+    return results
+
+
+def bench_clean_cache(rng, cfg, workdir):
+    cache = os.path.join(workdir, "Cache")
+    payload = rng.integers(0, 255, 20 * 1024, dtype=np.uint8).tobytes()
+
+    def populate():
+        for cam in range(4):
+            cam_dir = os.path.join(cache, f"camera_{cam}")
+            os.makedirs(cam_dir, exist_ok=True)
+            for i in range(cfg["cache_files"] // 4):
+                with open(os.path.join(cam_dir, f"{i:08d}_cam{cam}.jpg"), "wb") as f:
+                    f.write(payload)
+
+    samples = []
+    for _ in range(max(1, cfg["repeats"] // 10)):
+        populate()
+        start = time.perf_counter()
+        clean_cache(cache_dir=cache, verbose=False)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return {
+        "repeats": len(samples),
+        "items": cfg["cache_files"],
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p90_ms": float(np.percentile(samples, 90)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "max_ms": float(samples.max()),
+        "throughput": float(cfg["cache_files"] / (samples.mean() / 1000)),
+    }
+
+
+BENCHMARKS = ["project_points", "projector", "merge", "tsp", "capture", "clean_cache"]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict) and "mean_ms" not in value:
+            flat.update(_flatten(value, f"{prefix}{name}."))
+        else:
+            flat[f"{prefix}{name}"] = value
+    return flat
+
+
+def run_benchmarks(cfg, only=None, seed=0):
+    rng = np.random.default_rng(seed)
+    selected = only or BENCHMARKS
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="smsp_bench_")
+    try:
+        for name in selected:
+            print(f"运行基准：{name}")
+            if name == "project_points":
+                results[name] = bench_project_points(rng, cfg)
+            elif name == "projector":
+                results[name] = bench_projector(rng, cfg, workdir)
+            elif name == "merge":
+                results[name] = bench_merge(rng, cfg)
+            elif name == "tsp":
+                results[name] = bench_tsp(rng, cfg)
+            elif name == "capture":
+                results[name] = bench_capture_writes(rng, cfg, workdir)
+            elif name == "clean_cache":
+                results[name] = bench_clean_cache(rng, cfg, workdir)
+            else:
+                raise ValueError(f"未知的基准：{name}，可选 {BENCHMARKS}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "config": cfg,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline):
+    """对比两次基准结果的 p50 延迟，返回 {名称: 当前/基准}"""
+    cur, base = _flatten(current["results"]), _flatten(baseline["results"])
+    print(f"\n{'benchmark':<36}{'baseline p50':>14}{'current p50':>14}{'ratio':>8}")
+    ratios = {}
+    for name in sorted(cur):
+        if name not in base:
+            continue
+        b, c = base[name]["p50_ms"], cur[name]["p50_ms"]
+        ratios[name] = c / b if b > 0 else float("inf")
+        print(f"{name:<36}{b:>12.3f}ms{c:>12.3f}ms{ratios[name]:>8.2f}")
+    return ratios
+
+
+# -------------------------------
+# CLI 入口
+# -------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="SMSP 各阶段性能基准（合成数据，无需模型权重）")
+    parser.add_argument('--only', type=str, nargs='+', default=None, choices=BENCHMARKS, help='只运行指定基准')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--points', type=int, default=10000, help='project_points 点数')
+    parser.add_argument('--cameras', type=int, default=12)
+    parser.add_argument('--boxes_per_camera', type=int, default=200)
+    parser.add_argument('--batch_size', type=int, default=8)
+    parser.add_argument('--merge_points', type=int, default=5000)
+    parser.add_argument('--tsp_points', type=int, default=200)
+    parser.add_argument('--tsp_time_limit', type=float, default=2.0)
+    parser.add_argument('--frames', type=int, default=40, help='写盘基准的帧数')
+    parser.add_argument('--cache_files', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 保存路径')
+    parser.add_argument('--compare', type=str, default=None, help='与之前保存的结果 JSON 对比')
+    args = parser.parse_args()
+
+    cfg = {k: getattr(args, k) for k in (
+        "repeats", "points", "cameras", "boxes_per_camera", "batch_size", "merge_points",
+        "tsp_points", "tsp_time_limit", "frames", "cache_files")}
+    report = run_benchmarks(cfg, args.only, args.seed)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"结果已保存到 {args.output}")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
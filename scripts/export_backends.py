@@ -0,0 +1,180 @@
+import argparse
+import itertools
+import json
+import os
+
+import cv2
+import numpy as np
+
+from benchmark import measure
+from utils.inference_backends import load_backend, export_model, list_images
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+
+
+# -------------------------------
+# 精度评估
+# -------------------------------
+def load_labels(label_path, shape):
+    """读取 YOLO 格式标注（归一化 cls cx cy w h），返回 cls (N,), xyxy (N, 4) 像素坐标"""
+    if not os.path.exists(label_path):
+        return np.empty(0), np.empty((0, 4))
+    rows = np.loadtxt(label_path, ndmin=2)
+    if rows.size == 0:
+        return np.empty(0), np.empty((0, 4))
+    h, w = shape[:2]
+    cx, cy, bw, bh = rows[:, 1] * w, rows[:, 2] * h, rows[:, 3] * w, rows[:, 4] * h
+    return rows[:, 0], np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+
+def box_iou(a, b):
+    """(N, 4) 与 (M, 4) 两组框的 IoU 矩阵"""
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(rb - lt, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_predictions(pred_cls, pred_xyxy, gt_cls, gt_xyxy):
+    """按 IoU 从高到低贪心匹配同类别的预测与标注，返回 (N_pred, 10) 的 TP 矩阵"""
+    tp = np.zeros((len(pred_cls), len(IOU_THRESHOLDS)), dtype=bool)
+    if not len(pred_cls) or not len(gt_cls):
+        return tp
+    iou = box_iou(gt_xyxy, pred_xyxy) * (gt_cls[:, None] == pred_cls[None, :])
+    for k, t in enumerate(IOU_THRESHOLDS):
+        gi, pi = np.nonzero(iou >= t)
+        if not len(gi):
+            continue
+        order = np.argsort(-iou[gi, pi])
+        gi, pi = gi[order], pi[order]
+        _, first_p = np.unique(pi, return_index=True)
+        gi, pi = gi[first_p], pi[first_p]
+        order = np.argsort(-iou[gi, pi])
+        _, first_g = np.unique(gi[order], return_index=True)
+        tp[pi[order][first_g], k] = True
+    return tp
+
+
+def average_precision(tp, conf, pred_cls, gt_counts):
+    """按类别计算各 IoU 阈值下的 AP（101 点插值），返回 {cls: (10,)}"""
+    aps = {}
+    for c, n_gt in gt_counts.items():
+        mask = pred_cls == c
+        if n_gt == 0:
+            continue
+        if not mask.any():
+            aps[c] = np.zeros(len(IOU_THRESHOLDS))
+            continue
+        order = np.argsort(-conf[mask])
+        tpc = np.cumsum(tp[mask][order], axis=0)
+        fpc = np.cumsum(~tp[mask][order], axis=0)
+        recall = tpc / n_gt
+        precision = tpc / (tpc + fpc)
+        ap = np.zeros(len(IOU_THRESHOLDS))
+        grid = np.linspace(0, 1, 101)
+        for k in range(len(IOU_THRESHOLDS)):
+            # 精度包络：每个召回率处取其右侧的最大精度
+            envelope = np.maximum.accumulate(precision[::-1, k])[::-1]
+            idx = np.searchsorted(recall[:, k], grid, side="left")
+            ap[k] = np.mean(np.where(idx < len(envelope), envelope[np.minimum(idx, len(envelope) - 1)], 0.0))
+        aps[c] = ap
+    return aps
+
+
+def evaluate_map(backend, image_dir, label_dir, conf=0.001):
+    """在测试集上计算 mAP50 与 mAP50-95"""
+    all_tp, all_conf, all_cls = [], [], []
+    gt_counts = {}
+    for path in list_images(image_dir):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        label_path = os.path.join(label_dir, os.path.splitext(os.path.basename(path))[0] + ".txt")
+        gt_cls, gt_xyxy = load_labels(label_path, img.shape)
+        for c in gt_cls.astype(int):
+            gt_counts[c] = gt_counts.get(c, 0) + 1
+        det = backend(img, conf=conf)[0]
+        all_tp.append(match_predictions(det.cls.astype(int), det.xyxy.astype(np.float64),
+                                        gt_cls.astype(int), gt_xyxy))
+        all_conf.append(det.conf)
+        all_cls.append(det.cls.astype(int))
+
+    tp = np.concatenate(all_tp) if all_tp else np.zeros((0, len(IOU_THRESHOLDS)), dtype=bool)
+    aps = average_precision(tp, np.concatenate(all_conf) if all_conf else np.empty(0),
+                            np.concatenate(all_cls) if all_cls else np.empty(0, dtype=int), gt_counts)
+    if not aps:
+        return {"map50": 0.0, "map50_95": 0.0, "images": len(all_tp)}
+    ap = np.stack(list(aps.values()))
+    return {"map50": float(ap[:, 0].mean()), "map50_95": float(ap.mean()), "images": len(all_tp)}
+
+
+# -------------------------------
+# 导出与对比
+# -------------------------------
+def benchmark_backend(name, path, images, label_dir, imgsz, repeats, threads=None):
+    frames = [cv2.imread(p) for p in images[:repeats]]
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise ValueError(f"没有可读取的评估图像（共 {len(images)} 个路径），无法测量 {name} 的延迟")
+    kwargs = {"threads": threads} if threads and not path.endswith(".pt") else {}
+    backend = load_backend(path, imgsz=imgsz, **kwargs)
+    # 预热调用同样消耗帧，循环取帧保证不会耗尽
+    it = itertools.cycle(frames)
+    latency = measure(lambda: backend(next(it), conf=0.25), repeats, warmup=3)
+    accuracy = evaluate_map(backend, os.path.dirname(images[0]), label_dir)
+    print(f"{name:<18} p50 {latency['p50_ms']:8.2f}ms  p90 {latency['p90_ms']:8.2f}ms  "
+          f"mAP50 {accuracy['map50']:.4f}  mAP50-95 {accuracy['map50_95']:.4f}")
+    return {"name": name, "path": path, "latency": latency, "accuracy": accuracy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出 ONNX / OpenVINO（可选 INT8）模型并与 .pt 基线对比延迟和精度")
+    parser.add_argument('--weights', type=str, default='../models/yolov11/cmp_best.pt', help='.pt 权重')
+    parser.add_argument('--formats', type=str, nargs='+', default=['onnx', 'openvino'],
+                        choices=['onnx', 'openvino'], help='导出格式')
+    parser.add_argument('--int8', action='store_true', default=False, help='同时导出 INT8 量化模型')
+    parser.add_argument('--dataset', type=str, default='../datasets/cmp_dataset', help='数据集根目录（校准与评估）')
+    parser.add_argument('--split', type=str, default='test', help='评估使用的数据集划分')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--num_calib', type=int, default=100, help='INT8 校准图像数')
+    parser.add_argument('--repeats', type=int, default=50, help='延迟测量次数')
+    parser.add_argument('--threads', type=int, default=None, help='ONNX Runtime / OpenVINO 推理线程数')
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 保存路径')
+    args = parser.parse_args()
+
+    image_dir = os.path.join(args.dataset, "images", args.split)
+    label_dir = os.path.join(args.dataset, "labels", args.split)
+    images = list_images(image_dir)
+    if not images:
+        raise SystemExit(f"未找到评估图像：{image_dir}")
+
+    models = [("pytorch", args.weights)]
+    for fmt in args.formats:
+        models.append((fmt, export_model(args.weights, fmt, args.imgsz)))
+        if args.int8:
+            models.append((f"{fmt}-int8", export_model(args.weights, fmt, args.imgsz, int8=True,
+                                                       dataset_root=args.dataset, num_calib=args.num_calib)))
+
+    print(f"评估集：{image_dir}（{len(images)} 张），输入尺寸 {args.imgsz}")
+    results = [benchmark_backend(name, path, images, label_dir, args.imgsz, args.repeats, args.threads)
+               for name, path in models]
+
+    base = results[0]
+    print(f"\n{'backend':<18}{'p50 ms':>10}{'speedup':>10}{'mAP50-95':>10}{'ΔmAP':>10}")
+    for r in results:
+        speedup = base["latency"]["p50_ms"] / r["latency"]["p50_ms"] if r["latency"]["p50_ms"] > 0 else 0.0
+        r["speedup"] = speedup
+        r["map_delta"] = r["accuracy"]["map50_95"] - base["accuracy"]["map50_95"]
+        print(f"{r['name']:<18}{r['latency']['p50_ms']:>10.2f}{speedup:>9.2f}x"
+              f"{r['accuracy']['map50_95']:>10.4f}{r['map_delta']:>+10.4f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,82 +1,259 @@
-import json
 import numpy as np
 import cv2
 import matplotlib.pyplot as plt
-from ultralytics import YOLO
 import os
+from utils.projector import boxes_to_arrays, project_detections
+from calibration.calibration_store import CalibrationStore
+from utils.metrics import configure_from_env, timed
+from utils.frame_sync import FrameSynchronizer
+from utils.roi import CameraROI
+from utils.birdseye import world_bounds_from_calibration
+from utils.detection_store import project_records
+from utils.inference_cache import CachedModel
+from utils.inference_backends import load_backend
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 class HomographyProjector:
-    def __init__(self):
+    def __init__(self, homography_path="camera_homography.json", model_path=None,
+                 cache_dir=None, batch_size=8, model=None, sync_tolerance_ms=None,
+                 roi=False, world_bounds=None, roi_imgsz=None, inference_cache=None, backend="auto"):
+        """
+        :param homography_path: 单应矩阵标定文件
+        :param model_path: 模型路径（.pt / .onnx / OpenVINO 导出目录），默认使用 models/yolov11/cmp_best.pt
+        :param model: 已加载的模型（如 ModelServer 或基准测试用的桩检测器），传入时忽略 model_path
+        :param cache_dir: 图像缓存目录，默认使用项目根目录下的 Cache
+        :param batch_size: 单次送入模型的最大图像数
+        :param sync_tolerance_ms: 指定时各摄像头取时间差在该范围内的最新一组帧，而不是各自的最新帧
+        :param roi: 只对巡检区域在各摄像头画面中对应的像素区域（外扩 margin 像素）做推理，
+                    裁剪区域内检测到的目标全部保留，不再按 world_bounds 过滤投影点
+        :param world_bounds: 巡检区域的世界坐标范围 (xmin, ymin, xmax, ymax)，默认由标定参考点推算
+        :param roi_imgsz: 指定时把 ROI letterbox 为该尺寸后再送入模型
+        :param backend: 推理后端，见 utils.inference_backends.load_backend
+        :param inference_cache: utils.inference_cache.InferenceCache 或缓存目录，
+                                指定时相同图像、权重与参数的推理结果直接从缓存读取
+        """
         # 加载单应矩阵
-        with open("camera_homography.json", "r") as f:
-            self.homographies = json.load(f)
-        for k in self.homographies:
-            H = self.homographies[k]["H"]
-            self.homographies[k]["H"] = np.array(H).reshape(3, 3)
+        self.calibration = CalibrationStore(homography_path)
+        self.homographies = self.calibration.entries()
 
         # 获取路径
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.project_root = os.path.abspath(os.path.join(current_dir, os.pardir))
+        self.cache_dir = cache_dir or os.path.join(self.project_root, "Cache")
+        self.batch_size = max(1, int(batch_size))
+
+        # 推理感兴趣区域
+        self.roi = roi
+        self.world_bounds = world_bounds
+        if roi and world_bounds is None:
+            self.world_bounds = world_bounds_from_calibration(homography_path)
+        self.roi_imgsz = roi_imgsz
+        self._rois = {}
 
         # 加载模型
-        model_path = os.path.join(self.project_root, "models", "yolov11", "cmp_best.pt")
-        self.model = YOLO(model_path)
+        if model is None:
+            if model_path is None:
+                model_path = os.path.join(self.project_root, "models", "yolov11", "cmp_best.pt")
+            # 使用缓存时延迟到首次未命中再加载模型
+            model = model_path if inference_cache is not None else load_backend(model_path, backend)
+        if inference_cache is not None:
+            model = CachedModel(model, inference_cache, weights=model_path)
+        self.model = model
+
+        self.synchronizer = None
+        if sync_tolerance_ms is not None:
+            self.synchronizer = FrameSynchronizer(
+                self.cache_dir, cam_ids=[int(k) for k in self.homographies], tolerance_ms=sync_tolerance_ms)
 
-        # 图像路径
-        self.image_paths = [os.path.join(self.project_root, "Cache", "cam0.jpg")]
-        # print(self.image_paths)
+        # 所有已标定摄像头的图像路径 {cam_id: path}
+        self.image_paths = {}
+        self.refresh_image_paths()
         self.final_array = None
 
-    def run(self, conf_thresh=0.4):
-        all_results = []
+    def _latest_frame_path(self, cam_id):
+        """
+        查找某摄像头的最新帧：
+        优先使用 capture_to_cache 写入的 Cache/camera_{id}/ 下时间戳最新的图像，
+        否则退回 Cache/cam{id}.jpg
+        """
+        cam_dir = os.path.join(self.cache_dir, f"camera_{cam_id}")
+        if os.path.isdir(cam_dir):
+            # 文件名以时间戳开头，按名称取最大值即为最新帧
+            names = [e.name for e in os.scandir(cam_dir)
+                     if e.is_file() and e.name.lower().endswith(".jpg")]
+            if names:
+                return os.path.join(cam_dir, max(names))
 
-        for idx, path in enumerate(self.image_paths):
-            img = cv2.imread(path)
-            results = self.model(img)[0]
-            H = self.homographies.get(str(idx), {}).get("H", None)
+        path = os.path.join(self.cache_dir, f"cam{cam_id}.jpg")
+        return path if os.path.exists(path) else None
+
+    def refresh_image_paths(self):
+        """为 camera_homography.json 中的每个摄像头定位最新帧"""
+        if self.synchronizer is not None:
+            self.synchronizer.refresh()
+            snapshot = self.synchronizer.latest()
+            if snapshot is not None:
+                self.image_paths = {str(cid): path for cid, path in snapshot.paths.items()}
+                return self.image_paths
+            print("没有时间差在容差内的多摄像头帧，退回使用各摄像头最新帧")
+
+        self.image_paths = {}
+        for cam_id in sorted(self.homographies, key=int):
+            path = self._latest_frame_path(cam_id)
+            if path is None:
+                print(f"摄像头 {cam_id} 未找到缓存图像，跳过")
+                continue
+            self.image_paths[cam_id] = path
+        return self.image_paths
+
+    def _camera_roi(self, cam_id):
+        H = self.homographies[str(cam_id)]["H"]
+        roi = self._rois.get(str(cam_id))
+        if roi is None:
+            roi = CameraROI(H, self.world_bounds, imgsz=self.roi_imgsz)
+            self._rois[str(cam_id)] = roi
+        else:
+            roi.update(H)
+        return roi
+
+    @timed("inference_batch")
+    def detect(self, frames_by_cam):
+        """
+        将多个摄像头的图像按 batch_size 分批送入模型
+        :param frames_by_cam: {cam_id: BGR 图像}
+        :return: {cam_id: Boxes}；ROI 模式下为 {cam_id: (cls, conf, 整帧坐标 xyxy)}
+        """
+        transforms = {}
+        if self.roi:
+            inputs = {}
+            for cam_id, frame in frames_by_cam.items():
+                if str(cam_id) not in self.homographies:
+                    continue
+                patch, transform = self._camera_roi(cam_id).crop(frame)
+                if patch is not None:
+                    inputs[cam_id] = patch
+                    transforms[cam_id] = transform
+            frames_by_cam = inputs
+
+        cam_ids = list(frames_by_cam.keys())
+        boxes_by_cam = {}
+        for start in range(0, len(cam_ids), self.batch_size):
+            batch_ids = cam_ids[start:start + self.batch_size]
+            results = self.model([frames_by_cam[cid] for cid in batch_ids], verbose=False)
+            for cam_id, result in zip(batch_ids, results):
+                if cam_id in transforms:
+                    cls, conf, xyxy = boxes_to_arrays(result.boxes)
+                    boxes_by_cam[cam_id] = (cls, conf, CameraROI.to_full(xyxy, transforms[cam_id]))
+                else:
+                    boxes_by_cam[cam_id] = result.boxes
+        return boxes_by_cam
+
+    @timed("projection")
+    def project_boxes(self, boxes_by_cam, conf_thresh=0.4):
+        """
+        批量投影多个摄像头的检测结果
+        :param boxes_by_cam: {cam_id: Boxes 或 (cls, conf, xyxy)}，cam_id 与 camera_homography.json 中的键对应
+        :param conf_thresh: 置信度阈值
+        :return: (N, 4) 数组，每行为 [cls, x, y, conf]
+        """
+        projected = []
+        for cam_id, boxes in boxes_by_cam.items():
+            H = self.homographies.get(str(cam_id), {}).get("H", None)
             if H is None:
                 continue
+            cls, conf, xyxy = boxes if isinstance(boxes, tuple) else boxes_to_arrays(boxes)
+            projected.append(project_detections(H, cls, conf, xyxy, conf_thresh))
 
-            for box in results.boxes:
-                cls = int(box.cls.item())
-                conf = float(box.conf.item())
+        if not projected:
+            return np.empty((0, 4))
+        return np.concatenate(projected, axis=0)
 
-                if conf < conf_thresh:
-                    continue  # 👈 排除低置信度
+    def reload_calibration(self):
+        """标定文件被修改时重新载入单应矩阵，无需重启进程或重新加载模型"""
+        if not self.calibration.reload_if_changed():
+            return False
+        self.homographies = self.calibration.entries()
+        print(f"单应矩阵已更新至版本 {self.calibration.version}")
+        return True
 
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                ground_cx = (x1 + x2) / 2
-                ground_cy = (y1 + y2) / 2
+    @timed("projector_run")
+    def run(self, conf_thresh=0.4, refresh=True, image_paths=None):
+        """
+        :param image_paths: {cam_id: 图像路径}，如 FrameSynchronizer 给出的同步快照；None 时使用各摄像头最新帧
+        :return: (N, 4) 投影结果，末行为原点
+        """
+        if refresh:
+            self.reload_calibration()
+            if image_paths is None:
+                self.refresh_image_paths()
+        if image_paths is not None:
+            self.image_paths = {str(cid): path for cid, path in image_paths.items()}
 
-                pt = np.array([ground_cx, ground_cy, 1.0])
-                proj = H @ pt
-                proj /= proj[2]
+        frames_by_cam = {}
+        for cam_id, path in self.image_paths.items():
+            img = cv2.imread(path)
+            if img is None:
+                print(f"摄像头 {cam_id} 图像读取失败，路径：{path}")
+                continue
+            frames_by_cam[cam_id] = img
 
-                all_results.append([cls, proj[0], proj[1], conf])
+        boxes_by_cam = self.detect(frames_by_cam)
+        all_results = self.project_boxes(boxes_by_cam, conf_thresh)
+        origin = np.array([[-1, 0, 0, 1.0]])  # 添加一个原点
+        self.final_array = np.concatenate([all_results, origin], axis=0)
+        return self.final_array
 
-        all_results.append([-1, 0, 0, 1.0]) # 添加一个原点
-        self.final_array = np.array(all_results)
+    def project_store(self, reader, start_ms=None, end_ms=None, conf_thresh=0.4):
+        """
+        从检测结果存储读取时间范围 [start_ms, end_ms) 内的检测并投影，无需重新推理
+        :param reader: utils.detection_store.DetectionStoreReader
+        :return: (N, 4) 投影结果，末行为原点（与 run() 一致）
+        """
+        self.reload_calibration()
+        cam_ids = [int(cid) for cid in self.homographies]
+        records = reader.query(start_ms, end_ms, cam_ids)
+        all_results = project_records(records, self.homographies, conf_thresh)
+        origin = np.array([[-1, 0, 0, 1.0]])
+        self.final_array = np.concatenate([all_results, origin], axis=0)
+        return self.final_array
 
 
-    def show(self, conf_thresh=0.0):
+    def show(self, conf_thresh=0.0, save_path=None):
+        """
+        可视化投影结果，每个类别一个散点图层
+        :param save_path: 指定时保存为图片而不弹出窗口（适用于无显示器环境）
+        """
         if self.final_array is None:
             raise RuntimeError("请先调用 run() 方法处理图像。")
 
+        points = self.final_array[self.final_array[:, 3] >= conf_thresh]
         plt.figure(figsize=(8, 8))
-        for cls, x, y, conf in self.final_array:
-            if conf >= conf_thresh:
-                plt.scatter(x, y, label=f'class {int(cls)} ({conf:.2f})', alpha=0.6)
+        for cls in np.unique(points[:, 0]):
+            pts = points[points[:, 0] == cls]
+            plt.scatter(pts[:, 1], pts[:, 2], label=f'class {int(cls)} ({len(pts)})', alpha=0.6)
         plt.title(f"Unified 2D Map (conf > {conf_thresh})")
         plt.xlabel("X")
         plt.ylabel("Y")
         plt.grid(True)
         plt.legend()
-        plt.show()
+        if save_path:
+            plt.savefig(save_path, dpi=150)
+            plt.close()
+        else:
+            plt.show()
 
 if __name__ == "__main__":
-    projector = HomographyProjector()
-    projector.run(conf_thresh=0.4)  # 只处理置信度大于 0.5 的目标
+    import argparse
+
+    parser = argparse.ArgumentParser(description="多摄像头检测结果投影到统一世界坐标")
+    parser.add_argument('--conf', type=float, default=0.4, help='置信度阈值')
+    parser.add_argument('--inference_cache', type=str, default=None,
+                        help='推理结果缓存目录（如 ../.inference_cache），指定时调整阈值重复运行时无需重新推理')
+    args = parser.parse_args()
+    configure_from_env()
+
+    projector = HomographyProjector(inference_cache=args.inference_cache)
+    projector.run(conf_thresh=args.conf)  # 只处理置信度大于阈值的目标
     print(projector.final_array)
-    projector.show(conf_thresh=0.4)
+    projector.show(conf_thresh=args.conf)
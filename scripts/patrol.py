@@ -1,47 +1,69 @@
 import matplotlib
-matplotlib.use('TkAgg')      # 指定可交互后端
+try:
+    matplotlib.use('TkAgg')      # 指定可交互后端
+except ImportError:
+    pass                         # 无图形界面时（基准测试、后台进程）保留默认后端
 matplotlib.rcParams['font.family'] = 'SimHei'
 matplotlib.rcParams['axes.unicode_minus'] = False
 
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import matplotlib.pyplot as plt
 from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+from utils.metrics import configure_from_env, timed
 
-# ---------- 省略 solve_tsp_fixed_end 与 plot_and_save_route ----------
-def solve_tsp_fixed_end(points, start_index, end_index):
-    """points: (N, 2) ndarray  |  start_index / end_index: 节点下标"""
-    n = len(points)
+DIST_SCALE = 1000  # OR-tools 只接受整数代价，距离放大后取整
 
-    def distance(p1, p2):
-        return int(np.linalg.norm(p1 - p2) * 1000)
+METAHEURISTICS = {
+    "automatic": routing_enums_pb2.LocalSearchMetaheuristic.AUTOMATIC,
+    "greedy_descent": routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT,
+    "guided_local_search": routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH,
+    "simulated_annealing": routing_enums_pb2.LocalSearchMetaheuristic.SIMULATED_ANNEALING,
+    "tabu_search": routing_enums_pb2.LocalSearchMetaheuristic.TABU_SEARCH,
+}
 
-    # 距离矩阵
-    dist_matrix = np.zeros((n, n), dtype=int)
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                dist_matrix[i, j] = distance(points[i], points[j])
 
-    # 关键行：起终点要用列表包裹
-    manager = pywrapcp.RoutingIndexManager(n, 1, [start_index], [end_index])
-    routing = pywrapcp.RoutingModel(manager)
+def build_distance_matrix(points, scale=DIST_SCALE):
+    """向量化构造整数距离矩阵，points: (N, 2)"""
+    points = np.asarray(points, dtype=np.float64)
+    x, y = points[:, 0], points[:, 1]
+    dist = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+    dist *= scale
+    return dist.astype(np.int64)
 
-    transit_cb_idx = routing.RegisterTransitCallback(
-        lambda i, j: dist_matrix[manager.IndexToNode(i)][manager.IndexToNode(j)]
-    )
-    routing.SetArcCostEvaluatorOfAllVehicles(transit_cb_idx)
 
-    params = pywrapcp.DefaultRoutingSearchParameters()
-    params.first_solution_strategy = (
-        routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
-    )
+def _create_routing_model(dist_matrix, starts, ends):
+    """根据距离矩阵构造 RoutingModel，starts/ends 为各车辆的起终点节点下标"""
+    n = len(dist_matrix)
+    manager = pywrapcp.RoutingIndexManager(n, len(starts), list(starts), list(ends))
+    routing = pywrapcp.RoutingModel(manager)
 
-    solution = routing.SolveWithParameters(params)
-    if not solution:
-        raise RuntimeError("TSP 求解失败：无可行路径")
+    # 代价矩阵直接交给 C++ 层，避免每次弧代价评估都回调 Python
+    transit_idx = routing.RegisterTransitMatrix(dist_matrix.tolist())
+    routing.SetArcCostEvaluatorOfAllVehicles(transit_idx)
+    return manager, routing
 
-    # 解析路径
-    idx = routing.Start(0)
+
+def _search_parameters(time_limit=None, metaheuristic=None):
+    params = pywrapcp.DefaultRoutingSearchParameters()
+    params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+    if metaheuristic is not None:
+        if metaheuristic not in METAHEURISTICS:
+            raise ValueError(f"未知的局部搜索策略: {metaheuristic}，可选 {list(METAHEURISTICS)}")
+        params.local_search_metaheuristic = METAHEURISTICS[metaheuristic]
+    if time_limit is not None:
+        params.time_limit.FromMilliseconds(int(time_limit * 1000))
+    elif metaheuristic in ("guided_local_search", "simulated_annealing", "tabu_search"):
+        # 元启发式搜索没有时间上限会一直运行
+        raise ValueError("使用元启发式搜索时必须指定 time_limit")
+    return params
+
+
+def _extract_route(manager, routing, solution, vehicle=0):
+    idx = routing.Start(vehicle)
     route = []
     while not routing.IsEnd(idx):
         route.append(manager.IndexToNode(idx))
@@ -49,6 +71,305 @@ def solve_tsp_fixed_end(points, start_index, end_index):
     route.append(manager.IndexToNode(idx))
     return route
 
+
+def route_length(points, route):
+    """路径在世界坐标下的总长度"""
+    pts = np.asarray(points, dtype=np.float64)[route]
+    return float(np.sum(np.linalg.norm(np.diff(pts, axis=0), axis=1)))
+
+
+@timed("routing")
+def solve_tsp_fixed_end(points, start_index, end_index, time_limit=None,
+                        metaheuristic=None, return_stats=False):
+    """
+    points: (N, 2) ndarray  |  start_index / end_index: 节点下标
+    time_limit: 求解时间预算（秒），None 表示只做首解 + 贪心下降直至局部最优
+    metaheuristic: 局部搜索策略，见 METAHEURISTICS，需配合 time_limit 使用
+    return_stats: 为 True 时返回 (route, stats)，stats 包含路径代价与各阶段耗时
+    """
+    n = len(points)
+    t0 = time.perf_counter()
+    dist_matrix = build_distance_matrix(points)
+    t1 = time.perf_counter()
+
+    # 关键行：起终点要用列表包裹
+    manager, routing = _create_routing_model(dist_matrix, [start_index], [end_index])
+    solution = routing.SolveWithParameters(_search_parameters(time_limit, metaheuristic))
+    t2 = time.perf_counter()
+
+    if not solution:
+        raise RuntimeError("TSP 求解失败：无可行路径")
+
+    # 解析路径
+    route = _extract_route(manager, routing, solution)
+    if not return_stats:
+        return route
+
+    stats = {
+        "num_points": n,
+        "cost": solution.ObjectiveValue() / DIST_SCALE,
+        "length": route_length(points, route),
+        "matrix_time": t1 - t0,
+        "solve_time": t2 - t1,
+        "time_limit": time_limit,
+        "metaheuristic": metaheuristic,
+    }
+    return route, stats
+
+
+def match_points(old_points, new_points, radius):
+    """
+    按类别与距离把新点集与旧点集一一对应（贪心：距离最近的点对优先匹配）
+    old_points / new_points: (N, 4) [cls, x, y, conf]
+    :return: (M,) 数组，new 中每个点对应的旧点下标，无匹配为 -1
+    """
+    matched = np.full(len(new_points), -1, dtype=np.int64)
+    if len(old_points) == 0 or len(new_points) == 0:
+        return matched
+    d = np.hypot(new_points[:, None, 1] - old_points[None, :, 1],
+                 new_points[:, None, 2] - old_points[None, :, 2])
+    d[new_points[:, None, 0] != old_points[None, :, 0]] = np.inf
+    new_idx, old_idx = np.nonzero(d <= radius)
+    order = np.argsort(d[new_idx, old_idx], kind="stable")
+    used_old = np.zeros(len(old_points), dtype=bool)
+    for i, j in zip(new_idx[order], old_idx[order]):
+        if matched[i] < 0 and not used_old[j]:
+            matched[i] = j
+            used_old[j] = True
+    return matched
+
+
+def cheapest_insertion(dist_matrix, route, nodes):
+    """把 nodes 逐个插入 route 中代价增量最小的位置（不插在起点之前、终点之后）"""
+    route = list(route)
+    for node in nodes:
+        a = np.asarray(route[:-1])
+        b = np.asarray(route[1:])
+        delta = dist_matrix[a, node] + dist_matrix[node, b] - dist_matrix[a, b]
+        route.insert(int(np.argmin(delta)) + 1, int(node))
+    return route
+
+
+class RouteReplanner:
+    """
+    增量重规划：
+    保留上一次的路径与点编号，地图变化时先把新出现的点按最小代价插入旧路径、删去消失的点，
+    再以此为初始解交给 OR-tools 做短时间局部改进，避免每次从零求解。
+    """
+
+    def __init__(self, match_radius=5.0, time_limit=0.1, metaheuristic=None):
+        """
+        :param match_radius: 新旧点视为同一目标的最大距离（同类别）
+        :param time_limit: 局部改进的时间上限（秒）
+        :param metaheuristic: 局部搜索策略，None 为贪心下降，到达局部最优即停止
+        """
+        self.match_radius = match_radius
+        self.time_limit = time_limit
+        self.metaheuristic = metaheuristic
+        self.points_array = None
+        self.point_ids = None   # 每个点的稳定编号，跨多次重规划保持不变
+        self.route = None
+        self._next_id = 0
+
+    @property
+    def route_ids(self):
+        """以稳定编号表示的当前路径"""
+        return [int(self.point_ids[i]) for i in self.route]
+
+    def _assign_ids(self, matched):
+        ids = np.empty(len(matched), dtype=np.int64)
+        new = matched < 0
+        if not new.all():
+            ids[~new] = self.point_ids[matched[~new]]
+        ids[new] = np.arange(self._next_id, self._next_id + int(new.sum()))
+        self._next_id += int(new.sum())
+        return ids
+
+    def plan(self, points_array, start_index, end_index, time_limit=None, return_stats=False):
+        """从零求解并记录路径，points_array: (N, 4) [cls, x, y, conf]"""
+        points_array = np.asarray(points_array, dtype=np.float64)
+        route, stats = solve_tsp_fixed_end(points_array[:, 1:3], start_index, end_index,
+                                           time_limit=time_limit, return_stats=True)
+        self.points_array = points_array
+        self.point_ids = self._assign_ids(np.full(len(points_array), -1, dtype=np.int64))
+        self.route = route
+        return (route, stats) if return_stats else route
+
+    def replan(self, points_array, start_index=None, end_index=None, return_stats=False):
+        """
+        地图更新后重规划
+        :param start_index / end_index: 新点集中的起终点下标，None 时沿用上次起终点对应的点
+        :return: 新点集下标表示的路径（return_stats 为 True 时返回 (route, stats)）
+        """
+        points_array = np.asarray(points_array, dtype=np.float64)
+        if self.route is None:
+            if start_index is None or end_index is None:
+                raise ValueError("首次规划必须指定起点和终点")
+            return self.plan(points_array, start_index, end_index, return_stats=return_stats)
+
+        t0 = time.perf_counter()
+        matched = match_points(self.points_array, points_array, self.match_radius)
+        old_to_new = np.full(len(self.points_array), -1, dtype=np.int64)
+        old_to_new[matched[matched >= 0]] = np.nonzero(matched >= 0)[0]
+
+        if start_index is None:
+            start_index = int(old_to_new[self.route[0]])
+        if end_index is None:
+            end_index = int(old_to_new[self.route[-1]])
+        if start_index < 0 or end_index < 0:
+            raise ValueError("上次的起点或终点已从地图中消失，请重新指定")
+
+        # 旧路径删去消失的点，保持原有顺序；起终点固定在两端
+        kept = [int(old_to_new[i]) for i in self.route if old_to_new[i] >= 0]
+        inner = [n for n in kept if n not in (start_index, end_index)]
+        base = [start_index] + inner + [end_index]
+        in_route = set(base)
+        added = [n for n in range(len(points_array)) if n not in in_route]
+
+        dist_matrix = build_distance_matrix(points_array[:, 1:3])
+        initial_route = cheapest_insertion(dist_matrix, base, added)
+        t1 = time.perf_counter()
+
+        manager, routing = _create_routing_model(dist_matrix, [start_index], [end_index])
+        params = _search_parameters(self.time_limit, self.metaheuristic)
+        routing.CloseModelWithParameters(params)
+        initial = routing.ReadAssignmentFromRoutes(
+            [[manager.NodeToIndex(n) for n in initial_route[1:-1]]], True)
+        solution = routing.SolveFromAssignmentWithParameters(initial, params) if initial else None
+        if solution:
+            route = _extract_route(manager, routing, solution)
+        else:
+            route = initial_route
+        t2 = time.perf_counter()
+
+        self.point_ids = self._assign_ids(matched)
+        self.points_array = points_array
+        self.route = route
+        if not return_stats:
+            return route
+
+        pts = points_array[:, 1:3]
+        stats = {
+            "num_points": len(points_array),
+            "matched": int((matched >= 0).sum()),
+            "added": len(added),
+            "removed": int((old_to_new < 0).sum()),
+            "initial_length": route_length(pts, initial_route),
+            "length": route_length(pts, route),
+            "insert_time": t1 - t0,
+            "solve_time": t2 - t1,
+        }
+        return route, stats
+
+# ----------- 多巡检单元分区求解 -----------
+BALANCE_MODES = ("count", "length", "time")
+
+
+def _point_weights(points, balance, speed=1.0, service_time=0.0, k=2):
+    """
+    各点的分区权重：
+    count  每点计 1
+    length 以到最近 k 个邻居的平均距离估计该点对路径长度的贡献
+    time   length 估计换算为行驶时间，再加上每点的停留时间
+    """
+    n = len(points)
+    if balance == "count" or n < 2:
+        return np.ones(n)
+    k = min(k, n - 1)
+    d = build_distance_matrix(points, scale=1).astype(np.float64)
+    np.fill_diagonal(d, np.inf)
+    local = np.partition(d, k - 1, axis=1)[:, :k].mean(axis=1)
+    if balance == "length":
+        return local
+    return local / speed + service_time
+
+
+def partition_points(points, num_units, balance="count", speed=1.0, service_time=0.0):
+    """
+    递归二分：沿点集主方向排序，按累计权重切成 num_units 个权重接近的连续区域
+    points: (N, 2)
+    :return: list[np.ndarray]，每个区域包含的点下标
+    """
+    if balance not in BALANCE_MODES:
+        raise ValueError(f"未知的均衡方式: {balance}，可选 {BALANCE_MODES}")
+    points = np.asarray(points, dtype=np.float64)
+    weights = _point_weights(points, balance, speed, service_time)
+
+    def split(idx, units):
+        if units <= 1 or len(idx) <= 1:
+            return [idx]
+        pts = points[idx]
+        centered = pts - pts.mean(axis=0)
+        # 主成分方向
+        _, _, vt = np.linalg.svd(centered, full_matrices=False)
+        order = idx[np.argsort(centered @ vt[0], kind="stable")]
+        left_units = units // 2
+        cum = np.cumsum(weights[order])
+        cut = int(np.searchsorted(cum, cum[-1] * left_units / units)) + 1
+        cut = min(max(cut, 1), len(order) - 1)
+        return split(order[:cut], left_units) + split(order[cut:], units - left_units)
+
+    return split(np.arange(len(points)), num_units)
+
+
+def _solve_region(args):
+    """子进程入口：求解单个区域 起点 -> 区域内各点 -> 终点 的路径"""
+    points, nodes, start_index, end_index, time_limit, metaheuristic = args
+    same_end = start_index == end_index
+    sub_nodes = [start_index] + list(nodes) + ([] if same_end else [end_index])
+    sub_end = 0 if same_end else len(sub_nodes) - 1
+    if len(sub_nodes) == 1:
+        return [start_index, end_index], {"num_points": 0, "length": 0.0, "solve_time": 0.0}
+    route, stats = solve_tsp_fixed_end(points[sub_nodes], 0, sub_end, time_limit=time_limit,
+                                       metaheuristic=metaheuristic, return_stats=True)
+    return [sub_nodes[i] for i in route], stats
+
+
+def solve_multi_unit(points, num_units, start_index, end_index, balance="count",
+                     time_limit=None, metaheuristic=None, speed=1.0, service_time=0.0,
+                     max_workers=None):
+    """
+    多巡检单元规划：所有单元从同一起点出发、到同一终点结束，
+    其余点按 balance 分成 num_units 个区域后在进程池中并行求解
+    points: (N, 2) ndarray
+    speed / service_time: balance="time" 时的行驶速度与每点停留时间
+    :return: (routes, summary)，routes[k] 为第 k 个单元的路径（全局点下标）
+    """
+    points = np.asarray(points, dtype=np.float64)
+    t0 = time.perf_counter()
+    others = np.array([i for i in range(len(points)) if i not in (start_index, end_index)], dtype=np.int64)
+    regions = [others[r] for r in partition_points(points[others], num_units, balance, speed, service_time)]
+    tasks = [(points, r.tolist(), start_index, end_index, time_limit, metaheuristic) for r in regions]
+
+    workers = min(len(tasks), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_solve_region, tasks))
+    else:
+        results = [_solve_region(t) for t in tasks]
+
+    routes = [route for route, _ in results]
+    units = []
+    for k, (route, stats) in enumerate(results):
+        length = route_length(points, route)
+        units.append({
+            "unit": k,
+            "num_points": len(regions[k]),
+            "length": length,
+            "est_time": length / speed + service_time * len(regions[k]),
+            "solve_time": stats["solve_time"],
+        })
+    summary = {
+        "num_units": len(routes),
+        "balance": balance,
+        "total_length": float(sum(u["length"] for u in units)),
+        "max_length": float(max(u["length"] for u in units)),
+        "max_est_time": float(max(u["est_time"] for u in units)),
+        "wall_time": time.perf_counter() - t0,
+        "units": units,
+    }
+    return routes, summary
+
 # ----------- 可视化并点击选点 -----------
 def interactive_select_start_end(points_array):
     fig, ax = plt.subplots(figsize=(10, 10))
@@ -125,6 +446,36 @@ def plot_and_save_route(points_array, route, filename="smart_patrol_path.txt"):
     print(f"路径已保存到 {filename}")
 
 
+def plot_and_save_routes(points_array, routes, filename="smart_patrol_path.txt"):
+    """多巡检单元的路径可视化与保存，文件中额外记录单元编号"""
+    plt.figure(figsize=(10, 10))
+    colors = plt.cm.tab10(np.linspace(0, 1, 10))
+    for k, route in enumerate(routes):
+        pts = points_array[route, 1:3]
+        plt.plot(pts[:, 0], pts[:, 1], '--', color=colors[k % 10], label=f'Unit {k}')
+        plt.scatter(pts[1:-1, 0], pts[1:-1, 1], color=colors[k % 10], s=50, edgecolors='k')
+
+    sx, sy = points_array[routes[0][0], 1:3]
+    ex, ey = points_array[routes[0][-1], 1:3]
+    plt.scatter(sx, sy, color='green', s=150, edgecolors='black', label='Start')
+    plt.scatter(ex, ey, color='red', s=150, edgecolors='black', label='End')
+
+    plt.title("多单元巡检路径")
+    plt.xlabel("X")
+    plt.ylabel("Y")
+    plt.grid(True)
+    plt.legend()
+    plt.show()
+
+    with open(filename, 'w') as f:
+        f.write("unit,index,cls,x,y,confidence\n")
+        for k, route in enumerate(routes):
+            for i in route:
+                cls, x, y, conf = points_array[i]
+                f.write(f"{k},{i},{int(cls)},{x:.2f},{y:.2f},{conf:.4f}\n")
+    print(f"路径已保存到 {filename}")
+
+
 
 def interactive_select_start_end(points_array):
     fig, ax = plt.subplots(figsize=(10, 10))
@@ -172,7 +523,32 @@ def interactive_select_start_end(points_array):
 
 # ------------ 主程序调用 ------------
 if __name__ == "__main__":
-    points_array = np.load("merged_points.npy") # 你的点
+    parser = argparse.ArgumentParser(description="巡检路径规划")
+    parser.add_argument('--points', type=str, default='merged_points.npy', help='合并后的点集 (N, 4)')
+    parser.add_argument('--units', type=int, default=1, help='巡检单元数量，大于 1 时分区并行求解')
+    parser.add_argument('--balance', type=str, default='count', choices=BALANCE_MODES, help='分区均衡方式')
+    parser.add_argument('--speed', type=float, default=1.0, help='巡检速度（balance=time 时使用）')
+    parser.add_argument('--service_time', type=float, default=0.0, help='每个点的停留时间（balance=time 时使用）')
+    parser.add_argument('--time_limit', type=float, default=None, help='每个区域的求解时间上限（秒）')
+    parser.add_argument('--workers', type=int, default=None, help='并行求解的进程数')
+    parser.add_argument('--output', type=str, default='final_path.txt')
+    args = parser.parse_args()
+    configure_from_env()
+
+    points_array = np.load(args.points) # 你的点
     s, e = interactive_select_start_end(points_array)
-    route = solve_tsp_fixed_end(points_array[:, 1:3], s, e)
-    plot_and_save_route(points_array, route, "final_path.txt")
\ No newline at end of file
+    if args.units > 1:
+        routes, summary = solve_multi_unit(points_array[:, 1:3], args.units, s, e, balance=args.balance,
+                                           time_limit=args.time_limit, speed=args.speed,
+                                           service_time=args.service_time, max_workers=args.workers)
+        for u in summary["units"]:
+            print(f"单元 {u['unit']}: {u['num_points']} 个点，路径长度 {u['length']:.2f}，"
+                  f"预计耗时 {u['est_time']:.1f}，求解耗时 {u['solve_time']:.3f}s")
+        print(f"总长度 {summary['total_length']:.2f}，最长单元 {summary['max_length']:.2f}，"
+              f"总耗时 {summary['wall_time']:.3f}s")
+        plot_and_save_routes(points_array, routes, args.output)
+    else:
+        route, stats = solve_tsp_fixed_end(points_array[:, 1:3], s, e, time_limit=args.time_limit,
+                                           return_stats=True)
+        print(f"路径长度 {stats['length']:.2f}，求解耗时 {stats['solve_time']:.3f}s")
+        plot_and_save_route(points_array, route, args.output)
\ No newline at end of file
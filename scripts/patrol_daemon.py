@@ -0,0 +1,440 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from camera.camera_pool import CameraPool
+from generate import HomographyProjector
+from aggregate import IncrementalPointMerger
+from patrol import RouteReplanner, route_length
+from utils import metrics
+from utils.detection_store import parse_frame_name
+from utils.map_server import MapServer
+
+
+class FrameSet:
+    """同一轮采集的多摄像头图像"""
+    __slots__ = ("timestamp", "frames", "captured_at")
+
+    def __init__(self, timestamp, frames):
+        self.timestamp = timestamp          # 帧时间（秒）
+        self.frames = frames                # {cam_id(str): BGR 图像}
+        self.captured_at = time.monotonic()  # 进入流水线的时刻，用于统计端到端延迟
+
+
+class PatrolState:
+    """
+    各阶段的最新结果：合并后的点、路径及统计
+    每次路径更新 version 加一，可通过 wait_update() 等待下一次更新
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.timestamp = None
+        self.merged = np.empty((0, 4))
+        self.route_points = np.empty((0, 4))
+        self.route = []
+        self.route_ids = []
+        self.point_ids = np.empty(0, dtype=np.int64)
+        self.stats = {}
+        self._cond = asyncio.Condition()
+
+    async def update(self, timestamp, merged, route_points, route, route_ids, stats, point_ids=None):
+        async with self._cond:
+            self.timestamp = timestamp
+            self.merged = merged
+            self.route_points = route_points
+            self.route = route
+            self.route_ids = route_ids
+            if point_ids is not None:
+                self.point_ids = point_ids
+            self.stats = stats
+            self.version += 1
+            self._cond.notify_all()
+
+    async def wait_update(self, after_version, timeout=None):
+        """等待 version 大于 after_version，超时返回 False"""
+        async with self._cond:
+            try:
+                await asyncio.wait_for(self._cond.wait_for(lambda: self.version > after_version), timeout)
+            except asyncio.TimeoutError:
+                return False
+            return True
+
+
+def _put_latest(queue, item):
+    """只保留最新一项的队列：满时丢弃旧项"""
+    while queue.full():
+        queue.get_nowait()
+    queue.put_nowait(item)
+
+
+def _atomic_write_text(path, text):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_snapshot(snapshot_dir, merged, route_points, route, stats):
+    """把一次快照写入目录：merged_points.npy / merged_points.json / final_path.txt / status.json"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    npy = os.path.join(snapshot_dir, "merged_points.npy")
+    with open(npy + ".tmp", "wb") as f:
+        np.save(f, merged)
+    os.replace(npy + ".tmp", npy)
+
+    points = [{"class": int(r[0]), "x": float(r[1]), "y": float(r[2]), "confidence": float(r[3])}
+              for r in merged]
+    _atomic_write_text(os.path.join(snapshot_dir, "merged_points.json"),
+                       json.dumps(points, ensure_ascii=False, indent=2))
+
+    lines = ["index,cls,x,y,confidence"]
+    for i in route:
+        cls, x, y, conf = route_points[i]
+        lines.append(f"{i},{int(cls)},{x:.2f},{y:.2f},{conf:.4f}")
+    _atomic_write_text(os.path.join(snapshot_dir, "final_path.txt"), "\n".join(lines) + "\n")
+    _atomic_write_text(os.path.join(snapshot_dir, "status.json"),
+                       json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+class PatrolDaemon:
+    """
+    常驻巡检守护进程：采集 -> 检测 -> 投影 -> 合并 -> 路径规划，
+    各阶段为 asyncio 协程，通过有界队列衔接，下游处理不过来时上游在 put 处等待（背压），
+    采集阶段因此总是读取最新一帧而不是积压旧帧。
+    推理、读帧与路径求解等阻塞操作放到线程池中执行；结果只保存在内存，按需写出快照。
+    """
+
+    def __init__(self, projector, merger, replanner, source="live", cam_ids=None, interval=0.5,
+                 conf_thresh=0.4, start=(0.0, 0.0), end=(0.0, 0.0), queue_size=2,
+                 snapshot_dir="patrol_snapshot", snapshot_trigger=None, status_interval=5.0,
+                 http_host="127.0.0.1", http_port=None):
+        """
+        :param source: live 直接读取摄像头；cache 读取 capture_to_cache 写入缓存目录的最新帧
+        :param interval: 两轮采集的最小间隔（秒）
+        :param start / end: 路径起终点的世界坐标
+        :param queue_size: 各阶段之间的队列长度
+        :param snapshot_trigger: 该文件出现时写出一次快照并删除该文件（各平台通用的按需快照方式）
+        :param http_port: 指定时在同一事件循环中启动 utils.map_server.MapServer，直接提供内存中的地图与路径
+        """
+        self.projector = projector
+        self.merger = merger
+        self.replanner = replanner
+        self.source = source
+        self.cam_ids = [str(c) for c in (cam_ids or sorted(projector.homographies, key=int))]
+        self.interval = interval
+        self.conf_thresh = conf_thresh
+        self.start = np.array([-1, start[0], start[1], 1.0])
+        self.end = np.array([-1, end[0], end[1], 1.0])
+        self.queue_size = queue_size
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_trigger = snapshot_trigger
+        self.status_interval = status_interval
+        self.http_host = http_host
+        self.http_port = http_port
+        self.map_server = None
+
+        self.state = None
+        self.pool = CameraPool() if source == "live" else None
+        self._handles = {}
+        self._last_seq = {}
+        self._last_paths = None
+        self._io = ThreadPoolExecutor(max_workers=max(2, len(self.cam_ids)), thread_name_prefix="patrol-io")
+        # 模型与 OR-tools 求解各用一个线程，保证同一时刻只有一个调用
+        self._infer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="patrol-infer")
+        self._solve = ThreadPoolExecutor(max_workers=1, thread_name_prefix="patrol-solve")
+        self._stop = None
+        self._snapshot_requested = None
+        self.counts = {"frames": 0, "detections": 0, "routes": 0, "dropped": 0, "errors": 0}
+
+    # ---------------- 各阶段 ----------------
+    def _stage_error(self, stage, error):
+        """单项处理出错：记录并丢弃该轮数据，阶段继续运行"""
+        self.counts["errors"] += 1
+        metrics.inc("daemon_errors", stage=stage)
+        print(f"[{stage}] 处理出错，丢弃本轮数据：{type(error).__name__}: {error}")
+
+    def _read_live(self, cam_id):
+        handle = self._handles.get(cam_id)
+        if handle is None:
+            handle = self._handles[cam_id] = self.pool.acquire(int(cam_id))
+        frame, seq = handle.read(timeout=2.0, copy=False, after_seq=self._last_seq.get(cam_id))
+        if frame is not None:
+            self._last_seq[cam_id] = seq
+        return frame
+
+    def _read_cache(self):
+        paths = self.projector.refresh_image_paths()
+        if paths == self._last_paths:
+            return None, {}
+        self._last_paths = dict(paths)
+        stamps = [parse_frame_name(p)[0] for p in paths.values()]
+        stamps = [t for t in stamps if t is not None]
+        frames = {cid: cv2.imread(p) for cid, p in paths.items() if cid in self.cam_ids}
+        return (min(stamps) / 1000 if stamps else time.time()), frames
+
+    async def _capture(self, out_queue):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                with metrics.timer("stage_seconds", stage="daemon_capture"):
+                    if self.source == "live":
+                        frames = await asyncio.gather(
+                            *(loop.run_in_executor(self._io, self._read_live, cid) for cid in self.cam_ids))
+                        timestamp = time.time()
+                        frames = dict(zip(self.cam_ids, frames))
+                    else:
+                        timestamp, frames = await loop.run_in_executor(self._io, self._read_cache)
+            except Exception as e:
+                self._stage_error("capture", e)
+                frames = {}
+            frames = {cid: f for cid, f in frames.items() if f is not None}
+            if frames:
+                await out_queue.put(FrameSet(timestamp, frames))
+                self.counts["frames"] += 1
+                metrics.set_gauge("daemon_queue_depth", out_queue.qsize(), queue="frames")
+            delay = self.interval - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _detect(self, in_queue, out_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame_set = await in_queue.get()
+            try:
+                with metrics.timer("stage_seconds", stage="daemon_detect"):
+                    boxes = await loop.run_in_executor(self._infer, self.projector.detect, frame_set.frames)
+            except Exception as e:
+                self._stage_error("detect", e)
+                continue
+            await out_queue.put((frame_set, boxes))
+            metrics.set_gauge("daemon_queue_depth", out_queue.qsize(), queue="detections")
+
+    async def _project(self, in_queue, out_queue):
+        while True:
+            frame_set, boxes = await in_queue.get()
+            # 纯 numpy 运算，耗时在毫秒以内，直接在事件循环中执行
+            try:
+                with metrics.timer("stage_seconds", stage="daemon_project"):
+                    points = self.projector.project_boxes(boxes, self.conf_thresh)
+            except Exception as e:
+                self._stage_error("project", e)
+                continue
+            self.counts["detections"] += len(points)
+            await out_queue.put((frame_set, points))
+
+    async def _merge(self, in_queue, out_queue):
+        while True:
+            frame_set, points = await in_queue.get()
+            try:
+                with metrics.timer("stage_seconds", stage="daemon_merge"):
+                    self.merger.insert_array(points, frame_set.timestamp)
+                    self.merger.expire(frame_set.timestamp)
+                    merged = self.merger.snapshot()
+            except Exception as e:
+                self._stage_error("merge", e)
+                continue
+            if out_queue.full():
+                self.counts["dropped"] += 1
+            # 路径只需要基于最新地图，求解跟不上时丢弃过期的地图
+            _put_latest(out_queue, (frame_set, merged))
+
+    def _plan(self, merged):
+        route_points = np.vstack([self.start, merged.reshape(-1, 4), self.end])
+        start_index, end_index = 0, len(route_points) - 1
+        if self.replanner.route is None:
+            route, stats = self.replanner.plan(route_points, start_index, end_index, return_stats=True)
+        else:
+            route, stats = self.replanner.replan(route_points, start_index, end_index, return_stats=True)
+        stats.setdefault("length", route_length(route_points[:, 1:3], route))
+        return route_points, route, stats
+
+    async def _route(self, in_queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            frame_set, merged = await in_queue.get()
+            try:
+                with metrics.timer("stage_seconds", stage="daemon_route"):
+                    route_points, route, stats = await loop.run_in_executor(self._solve, self._plan, merged)
+            except Exception as e:
+                self._stage_error("route", e)
+                continue
+            latency = time.monotonic() - frame_set.captured_at
+            metrics.observe("daemon_latency_seconds", latency)
+            self.counts["routes"] += 1
+            stats = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in stats.items()}
+            stats.update({"timestamp": frame_set.timestamp, "latency": latency,
+                          "num_merged": len(merged), "cameras": sorted(frame_set.frames, key=int)})
+            await self.state.update(frame_set.timestamp, merged, route_points, route,
+                                    self.replanner.route_ids, stats, self.replanner.point_ids.copy())
+
+    # ---------------- 快照与状态 ----------------
+    def request_snapshot(self):
+        """请求写出一次快照（可在信号处理函数中调用）"""
+        if self._snapshot_requested is not None:
+            self._snapshot_requested.set()
+
+    async def snapshot(self):
+        state = self.state
+        if state.version == 0:
+            print("尚未生成路径，跳过快照")
+            return False
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._io, write_snapshot, self.snapshot_dir, state.merged.copy(),
+                                   state.route_points.copy(), list(state.route),
+                                   {**state.stats, "version": state.version, "counts": dict(self.counts)})
+        print(f"快照已写入 {self.snapshot_dir}（版本 {state.version}）")
+        return True
+
+    async def _supervise(self):
+        last_status = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._snapshot_requested.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+            if self.snapshot_trigger and os.path.exists(self.snapshot_trigger):
+                os.remove(self.snapshot_trigger)
+                self._snapshot_requested.set()
+            if self._snapshot_requested.is_set():
+                self._snapshot_requested.clear()
+                await self.snapshot()
+            if self.status_interval and time.monotonic() - last_status >= self.status_interval:
+                last_status = time.monotonic()
+                s = self.state.stats
+                print(f"[版本 {self.state.version}] 采集 {self.counts['frames']} 轮，路径 {self.counts['routes']} 次，"
+                      f"丢弃过期地图 {self.counts['dropped']} 次，出错 {self.counts['errors']} 次，合并点 {s.get('num_merged', 0)}，"
+                      f"端到端延迟 {s.get('latency', 0.0):.2f}s")
+
+    async def run(self, duration=None):
+        """运行直到 stop() 或 duration 秒后，返回最终状态"""
+        self.state = PatrolState()
+        self._stop = asyncio.Event()
+        self._snapshot_requested = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig, handler in ((getattr(signal, "SIGINT", None), self.stop),
+                             (getattr(signal, "SIGTERM", None), self.stop),
+                             (getattr(signal, "SIGUSR1", None), self.request_snapshot)):
+            if sig is not None:
+                try:
+                    loop.add_signal_handler(sig, handler)
+                except (NotImplementedError, RuntimeError):
+                    pass  # Windows 不支持，依赖 KeyboardInterrupt 与触发文件
+
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(3)] + [asyncio.Queue(maxsize=1)]
+        tasks = [
+            asyncio.create_task(self._detect(queues[0], queues[1])),
+            asyncio.create_task(self._project(queues[1], queues[2])),
+            asyncio.create_task(self._merge(queues[2], queues[3])),
+            asyncio.create_task(self._route(queues[3])),
+            asyncio.create_task(self._supervise()),
+        ]
+        tasks.append(asyncio.create_task(self._capture(queues[0])))
+        if self.http_port is not None:
+            self.map_server = await MapServer(self.state, self.http_host, self.http_port).start()
+        stop_task = asyncio.create_task(self._stop.wait())
+        failed = None
+        try:
+            # 各阶段自行处理单项错误、不会正常结束；任一阶段提前结束说明出现了无法恢复的错误，停止守护进程
+            done, _ = await asyncio.wait([stop_task, *tasks], timeout=duration,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            failed = next((t for t in done if t is not stop_task), None)
+        finally:
+            self._stop.set()
+            for task in (stop_task, *tasks):
+                task.cancel()
+            await asyncio.gather(stop_task, *tasks, return_exceptions=True)
+            if self.map_server is not None:
+                await self.map_server.close()
+            self.close()
+        if failed is not None and not failed.cancelled():
+            error = failed.exception()
+            raise RuntimeError(f"巡检守护进程的阶段异常退出：{error!r}") from error
+        return self.state
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def close(self):
+        for cam_id in self._handles:
+            self.pool.release(int(cam_id))
+        self._handles.clear()
+        if self.pool is not None:
+            self.pool.close()
+        for executor in (self._io, self._infer, self._solve):
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _main(args):
+    projector = HomographyProjector(homography_path=args.homography, model_path=args.model,
+                                    cache_dir=args.cache_dir, batch_size=args.batch,
+                                    roi=args.roi, inference_cache=args.inference_cache)
+    distance_dict = json.loads(args.distance) if args.distance else None
+    merger = IncrementalPointMerger(distance_dict=distance_dict and {int(k): v for k, v in distance_dict.items()},
+                                    default_thresh=args.merge_dist, max_age=args.max_age)
+    replanner = RouteReplanner(match_radius=args.match_radius, time_limit=args.time_limit)
+    daemon = PatrolDaemon(projector, merger, replanner, source=args.source, cam_ids=args.cam_ids,
+                          interval=args.interval, conf_thresh=args.conf, start=args.start, end=args.end,
+                          queue_size=args.queue, snapshot_dir=args.snapshot_dir,
+                          snapshot_trigger=args.snapshot_trigger, status_interval=args.status_interval,
+                          http_host=args.http_host, http_port=args.http_port)
+    print(f"巡检守护进程已启动（{args.source}，摄像头 {daemon.cam_ids}），"
+          f"按 Ctrl+C 退出，创建 {args.snapshot_trigger} 或发送 SIGUSR1 写出快照")
+    await daemon.run(args.duration)
+    if not args.no_snapshot_on_exit:
+        # 线程池已关闭，退出时同步写出
+        state = daemon.state
+        if state.version:
+            write_snapshot(args.snapshot_dir, state.merged, state.route_points, state.route,
+                           {**state.stats, "version": state.version, "counts": daemon.counts})
+            print(f"快照已写入 {args.snapshot_dir}（版本 {state.version}）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻巡检守护进程：采集、检测、投影、合并、路径规划一体运行")
+    parser.add_argument('--source', type=str, default='live', choices=['live', 'cache'],
+                        help='live 直接读取摄像头，cache 读取 capture_to_cache 写入的最新帧')
+    parser.add_argument('--cam_ids', type=int, nargs='+', default=None, help='摄像头编号，默认使用标定文件中的全部摄像头')
+    parser.add_argument('--homography', type=str, default='camera_homography.json')
+    parser.add_argument('--model', type=str, default=None, help='模型路径：.pt / .onnx / OpenVINO 导出目录')
+    parser.add_argument('--cache_dir', type=str, default=None)
+    parser.add_argument('--batch', type=int, default=8, help='单次推理的最大图像数')
+    parser.add_argument('--roi', action='store_true', default=False, help='只对巡检区域对应的像素区域推理')
+    parser.add_argument('--inference_cache', type=str, default=None, help='推理结果缓存目录')
+    parser.add_argument('--interval', type=float, default=0.5, help='两轮采集的最小间隔（秒）')
+    parser.add_argument('--conf', type=float, default=0.4, help='置信度阈值')
+    parser.add_argument('--merge_dist', type=float, default=10, help='默认合并距离')
+    parser.add_argument('--distance', type=str, default=None, help='各类别合并距离（JSON），如 {"2": 20}')
+    parser.add_argument('--max_age', type=float, default=10.0, help='观测点保留时间（秒）')
+    parser.add_argument('--match_radius', type=float, default=5.0, help='重规划时新旧点视为同一目标的距离')
+    parser.add_argument('--time_limit', type=float, default=0.1, help='每次重规划的求解时间上限（秒）')
+    parser.add_argument('--start', type=float, nargs=2, default=[0.0, 0.0], metavar=('X', 'Y'), help='路径起点')
+    parser.add_argument('--end', type=float, nargs=2, default=[0.0, 0.0], metavar=('X', 'Y'), help='路径终点')
+    parser.add_argument('--queue', type=int, default=2, help='阶段之间的队列长度')
+    parser.add_argument('--snapshot_dir', type=str, default='patrol_snapshot')
+    parser.add_argument('--snapshot_trigger', type=str, default='snapshot.request', help='按需快照的触发文件')
+    parser.add_argument('--no_snapshot_on_exit', action='store_true', default=False, help='退出时不写快照')
+    parser.add_argument('--status_interval', type=float, default=5.0, help='状态输出间隔（秒），0 不输出')
+    parser.add_argument('--http_host', type=str, default='127.0.0.1', help='地图查询服务监听地址')
+    parser.add_argument('--http_port', type=int, default=None, help='地图查询服务端口（HTTP / WebSocket），默认不启动')
+    parser.add_argument('--duration', type=float, default=None, help='运行时长（秒），默认一直运行')
+    args = parser.parse_args()
+    metrics.configure_from_env()
+
+    try:
+        asyncio.run(_main(args))
+    except KeyboardInterrupt:
+        print("巡检守护进程已退出")
+
+
+if __name__ == "__main__":
+    main()
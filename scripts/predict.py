@@ -1,13 +1,25 @@
 import argparse
+import os
 import cv2
 from ultralytics import YOLO
+from utils.inference_cache import CachedModel
 
 
-def predict(model, source, save_dir, imgsz = 640):
+def predict(model, source, save_dir, imgsz = 640, inference_cache=None):
+    """
+    :param inference_cache: 推理结果缓存目录，指定时同一图像、权重与参数只推理一次
+    """
     img = cv2.imread(source)
+    if inference_cache is not None:
+        # 命中缓存时不加载模型
+        result = CachedModel(model, inference_cache, imgsz=imgsz)(img, conf=0.3)[0]
+        os.makedirs(save_dir, exist_ok=True)
+        cv2.imwrite(os.path.join(save_dir, os.path.basename(source)), result.plot())
+        return result
     model = YOLO(model)
     model.predict(source=source, save=True, imgsz=imgsz, conf=0.3, project=save_dir)
     results = model(img)[0]
+    return results
 
 
 # -----------------------
@@ -19,12 +31,14 @@ def main():
     parser.add_argument('--model', type=str, default='../models/yolov11/cmp_best.pt')
     parser.add_argument('--source', type=str, default='../datasets/normal.jpg')
     parser.add_argument('--save_dir', type=str, default='../runs/detect')
+    parser.add_argument('--inference_cache', type=str, default=None, help='推理结果缓存目录')
     args = parser.parse_args()
 
     predict(model=args.model,
             source='D:\\Github\\SMSP-SmartMobileSensingPatrol\\Cache\\cam0.jpg',
             save_dir=args.save_dir,
-            imgsz=640)
+            imgsz=640,
+            inference_cache=args.inference_cache)
 
 
 if __name__ == "__main__":
@@ -1,94 +1,324 @@
 import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import cv2
-from ultralytics import YOLO
 
 from utils.predict_utils import (
     get_all_frames_from_directory,
     predict_single_frame,
     save_frame_as_image,
-    initialize_video_writer
+    initialize_video_writer,
+    AsyncFrameSink
 )
+from utils import metrics
+from utils.model_server import ModelServer
+from utils.inference_backends import load_backend
+from utils.motion_gate import GatedPredictor, MotionGate, reuse_result
+from utils.frame_store import FrameStoreReader
+from utils.data_proc_utils import format_timestamp
+from utils.detection_store import DetectionStoreWriter, parse_frame_name
 
-def process_camera_directory(cam_dir, model, save_dir=None, save_video=False,
-                              show_window=True, conf=0.25, fps=20):
+def _process_frames(cam_name, frames, model, save_dir=None, save_video=False,
+                    show_window=True, conf=0.25, fps=20, motion_gate=None, detection_store=None):
     """
-    处理某个摄像头目录下的所有帧：推理、显示、保存图像或视频
+    对一个摄像头的帧序列执行推理、显示、保存图像或视频
+    :param frames: 可迭代对象，逐个产出 (文件名, 图像)
+    :param motion_gate: MotionGate 参数字典，指定时画面无明显变化的帧复用上一次的检测结果
+    :param detection_store: DetectionStoreWriter，指定时按文件名中的时间戳与摄像头编号记录检测结果
     """
-    print(f"\n正在处理目录：{cam_dir}")
-    image_paths = get_all_frames_from_directory(cam_dir)
-    cam_name = os.path.basename(cam_dir)
-
+    if motion_gate is not None:
+        model = GatedPredictor(model, **motion_gate)
+    image_save_dir = None
+    video_path = None
     if save_dir:
-        os.makedirs(save_dir, exist_ok=True)
         image_save_dir = os.path.join(save_dir, cam_name)
         os.makedirs(image_save_dir, exist_ok=True)
         if save_video:
             video_path = os.path.join(save_dir, f"{cam_name}.mp4")
-            example = cv2.imread(image_paths[0])
-            writer = initialize_video_writer(example, video_path, fps)
-        else:
-            writer = None
-    else:
-        writer = None
 
-    for img_path in image_paths:
-        frame = cv2.imread(img_path)
+    writer = None
+    for filename, frame in frames:
         if frame is None:
             continue
-        result_frame = predict_single_frame(model, frame, conf)
+        timestamp_ms, cam_id = parse_frame_name(filename)
+        store = detection_store if timestamp_ms is not None else None
+        result_frame = predict_single_frame(model, frame, conf, detection_store=store,
+                                            cam_id=cam_id, timestamp_ms=timestamp_ms)
 
         if show_window:
             cv2.imshow(f"{cam_name}", result_frame)
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
 
-        if save_dir:
-            filename = os.path.basename(img_path)
+        if image_save_dir:
             save_path = os.path.join(image_save_dir, filename)
             save_frame_as_image(result_frame, save_path)
 
-        if writer:
+        if video_path:
+            if writer is None:
+                writer = initialize_video_writer(result_frame, video_path, fps)
             writer.write(result_frame)
 
     if writer:
         writer.release()
     cv2.destroyAllWindows()
+    if isinstance(model, GatedPredictor):
+        print(f"摄像头 {cam_name} 运动门控：{model.summary()}")
     print(f"摄像头 {cam_name} 图像处理完成")
 
+def process_camera_directory(cam_dir, model, save_dir=None, save_video=False,
+                              show_window=True, conf=0.25, fps=20, motion_gate=None, detection_store=None):
+    """
+    处理某个摄像头目录下的所有帧：推理、显示、保存图像或视频
+    """
+    print(f"\n正在处理目录：{cam_dir}")
+    image_paths = get_all_frames_from_directory(cam_dir)
+    cam_name = os.path.basename(cam_dir)
+    frames = ((os.path.basename(p), cv2.imread(p)) for p in image_paths)
+    _process_frames(cam_name, frames, model, save_dir, save_video, show_window, conf, fps,
+                    motion_gate, detection_store)
+
+def process_frame_store(store_dir, model, save_dir=None, save_video=False,
+                        show_window=True, conf=0.25, fps=20, start_ms=None, end_ms=None,
+                        motion_gate=None, detection_store=None):
+    """
+    处理分段帧存储（utils.frame_store）中指定时间范围内的帧，按摄像头分别输出
+    """
+    print(f"\n正在处理帧存储：{store_dir}")
+    reader = FrameStoreReader(store_dir)
+    for cam_id in reader.cameras():
+        frames = ((f"{format_timestamp(ts)}_cam{cid}.jpg", frame)
+                  for ts, cid, frame in reader.iter_frames(start_ms, end_ms, [cam_id]))
+        _process_frames(f"camera_{cam_id}", frames, model, save_dir, save_video,
+                        show_window, conf, fps, motion_gate, detection_store)
+    reader.close()
+
 def predict_from_cache(model_path, cache_dir, save_dir=None, save_video=False,
-                        show_window=True, conf=0.25, fps=20):
+                        show_window=True, conf=0.25, fps=20, store_dir=None, motion_gate=None,
+                        detection_dir=None):
     """
     从缓存目录读取各摄像头图像序列并执行 YOLO 推理
+    :param store_dir: 指定时改为读取分段帧存储，忽略 cache_dir
+    :param motion_gate: MotionGate 参数字典，每个摄像头独立门控
+    :param detection_dir: 检测结果存储目录，指定时记录每帧的检测结果，之后的投影与合并无需重新推理
+    """
+    model = load_backend(model_path)
+    detection_store = DetectionStoreWriter(detection_dir) if detection_dir else None
+
+    if store_dir:
+        process_frame_store(store_dir, model, save_dir, save_video, show_window, conf, fps,
+                            motion_gate=motion_gate, detection_store=detection_store)
+    else:
+        cam_dirs = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir)
+                    if os.path.isdir(os.path.join(cache_dir, d))]
+
+        for cam_dir in cam_dirs:
+            process_camera_directory(cam_dir, model, save_dir, save_video, show_window, conf, fps,
+                                     motion_gate, detection_store)
+
+    if detection_store is not None:
+        detection_store.close()
+        print(f"检测结果已写入：{detection_dir}，共 {detection_store.written} 条记录")
+
+def _camera_sources(cache_dir, store_dir=None, start_ms=None, end_ms=None):
+    """
+    枚举各摄像头的帧来源，返回 ([(cam_name, [(文件名, 读取函数), ...])], reader)
+    读取函数在解码线程池中调用，返回 BGR 图像；reader 为打开的 FrameStoreReader
+    （读取目录时为 None），读取函数全部用完后由调用方关闭
     """
-    model = YOLO(model_path)
+    sources = []
+    if store_dir:
+        reader = FrameStoreReader(store_dir)
+        for cam_id in reader.cameras():
+            rows = reader.query(start_ms, end_ms, [cam_id])
+            items = [(f"{format_timestamp(int(reader.index['timestamp'][r]))}_cam{cam_id}.jpg",
+                      lambda r=r: reader.read(r)) for r in rows]
+            sources.append((f"camera_{cam_id}", items))
+        return sources, reader
 
     cam_dirs = [os.path.join(cache_dir, d) for d in os.listdir(cache_dir)
                 if os.path.isdir(os.path.join(cache_dir, d))]
-
     for cam_dir in cam_dirs:
-        process_camera_directory(cam_dir, model, save_dir, save_video, show_window, conf, fps)
+        items = [(os.path.basename(p), lambda p=p: cv2.imread(p))
+                 for p in get_all_frames_from_directory(cam_dir)]
+        sources.append((os.path.basename(cam_dir), items))
+    return sources, None
+
+def _process_frames_pipelined(cam_name, items, server, decoder, save_dir=None, save_video=False,
+                              conf=0.25, fps=20, prefetch=16, motion_gate=None, detection_store=None):
+    """
+    单个摄像头的流水线：解码线程池预取 -> 共享推理服务合批 -> 异步写出
+    解码与推理各自保持最多 prefetch 帧在途，输出顺序与输入一致
+    :param motion_gate: MotionGate 参数字典，被门控跳过的帧复用最近一次提交的推理结果
+    :param detection_store: DetectionStoreWriter，指定时记录每帧的检测结果
+    """
+    gate = MotionGate(**motion_gate) if motion_gate is not None else None
+    last_future = None
+    sink = None
+    if save_dir:
+        sink = AsyncFrameSink(image_dir=os.path.join(save_dir, cam_name),
+                              video_path=os.path.join(save_dir, f"{cam_name}.mp4") if save_video else None,
+                              fps=fps)
+
+    decoding = deque()
+    inferring = deque()
+    items = iter(items)
+    processed = 0
+
+    def drain_one():
+        nonlocal processed
+        filename, future, frame = inferring.popleft()
+        result = future.result()
+        if detection_store is not None:
+            timestamp_ms, cam_id = parse_frame_name(filename)
+            if timestamp_ms is not None:
+                detection_store.append_result(cam_id, result, timestamp_ms)
+        result_frame = (reuse_result(result, frame) if frame is not None else result).plot()
+        processed += 1
+        if sink:
+            sink.put(filename, result_frame)
+
+    try:
+        while True:
+            while len(decoding) < prefetch:
+                nxt = next(items, None)
+                if nxt is None:
+                    break
+                filename, load = nxt
+                decoding.append((filename, decoder.submit(load)))
+            if not decoding:
+                break
+
+            filename, decode_future = decoding.popleft()
+            frame = decode_future.result()
+            if frame is None:
+                continue
+            if gate is None or last_future is None or gate.should_infer(frame):
+                if gate is not None and last_future is None:
+                    gate.should_infer(frame)
+                last_future = server.submit(frame, conf)
+                inferring.append((filename, last_future, None))
+            else:
+                inferring.append((filename, last_future, frame))
+            if len(inferring) >= prefetch:
+                drain_one()
+
+        while inferring:
+            drain_one()
+    finally:
+        if sink:
+            sink.close()
+    if gate is not None:
+        s = gate.stats()
+        print(f"摄像头 {cam_name} 运动门控：推理 {s['inferred']} 帧，跳过 {s['skipped']} 帧（{s['skip_ratio']:.1%}）")
+    print(f"摄像头 {cam_name} 图像处理完成，共 {processed} 帧")
+    return processed
+
+def predict_from_cache_pipelined(model_path, cache_dir, save_dir=None, save_video=False,
+                                 conf=0.25, fps=20, store_dir=None, decode_workers=4,
+                                 batch_size=8, max_latency=0.02, prefetch=16, motion_gate=None,
+                                 detection_dir=None):
+    """
+    流水线模式的缓存推理：各摄像头目录并发处理，解码、推理、写盘相互重叠
+    所有摄像头共享一个合批推理服务（utils.model_server），不显示窗口
+    :param detection_dir: 检测结果存储目录，各摄像头线程共享同一个写入端
+    :return: 整体处理帧率
+    :raises: 任一摄像头线程出错时，在所有线程结束后重新抛出第一个异常
+    """
+    server = ModelServer(model_path, max_batch_size=batch_size, max_latency=max_latency)
+    detection_store = DetectionStoreWriter(detection_dir) if detection_dir else None
+    counts, errors = {}, []
+    reader = None
+
+    try:
+        sources, reader = _camera_sources(cache_dir, store_dir)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=decode_workers) as decoder:
+            def run(cam_name, items):
+                try:
+                    counts[cam_name] = _process_frames_pipelined(
+                        cam_name, items, server, decoder, save_dir, save_video, conf, fps, prefetch,
+                        motion_gate, detection_store)
+                except BaseException as e:
+                    print(f"摄像头 {cam_name} 处理出错：{type(e).__name__}: {e}")
+                    errors.append(e)
+
+            threads = [threading.Thread(target=run, args=src) for src in sources]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        server.close()
+        if reader is not None:
+            reader.close()
+        if detection_store is not None:
+            detection_store.close()
+    if errors:
+        raise errors[0]
+    if detection_store is not None:
+        print(f"检测结果已写入：{detection_dir}，共 {detection_store.written} 条记录")
+
+    total = sum(counts.values())
+    overall_fps = total / elapsed if elapsed > 0 else 0.0
+    print(f"共处理 {total} 帧，耗时 {elapsed:.2f}s，整体 {overall_fps:.2f} FPS")
+    print(f"推理服务统计：{server.stats()}")
+    return overall_fps
 
 if __name__ == '__main__':
     import argparse
 
     parser = argparse.ArgumentParser(description="从缓存图像序列中运行YOLO预测")
-    parser.add_argument('--model', type=str, default='../models/yolov11/cmp_best.pt', help='YOLO模型路径')
+    parser.add_argument('--model', type=str, default='../models/yolov11/cmp_best.pt', help='模型路径：.pt 权重、.onnx 文件或 OpenVINO 导出目录')
     parser.add_argument('--cache_dir', type=str, default='../Cache/camera_1', help='缓存图像目录')
     parser.add_argument('--save_dir', type=str, default='../runs/detect/video_proc', help='推理结果保存目录')
     parser.add_argument('--save_video', action='store_true', default=True, help='是否保存推理结果为视频')
     parser.add_argument('--no_window', action='store_true', default=False, help='是否不显示窗口')
     parser.add_argument('--conf', type=float, default=0.25, help='YOLO置信度阈值')
     parser.add_argument('--fps', type=int, default=1, help='视频保存帧率')
+    parser.add_argument('--store_dir', type=str, default=None, help='分段帧存储目录，指定后忽略 cache_dir')
+    parser.add_argument('--pipeline', action='store_true', default=False, help='并发流水线模式（不显示窗口）')
+    parser.add_argument('--decode_workers', type=int, default=4, help='流水线模式解码线程数')
+    parser.add_argument('--batch', type=int, default=8, help='流水线模式推理批大小')
+    parser.add_argument('--motion_gate', type=float, default=None,
+                        help='开启运动门控，变化像素占比低于该值时复用上一次检测结果，如 0.01')
+    parser.add_argument('--max_skip', type=int, default=30, help='运动门控下最多连续复用的帧数')
+    parser.add_argument('--detection_dir', type=str, default=None, help='检测结果存储目录，指定时记录每帧的检测结果')
 
     args = parser.parse_args()
+    metrics.configure_from_env()
+    # 缓存回放没有实时时钟，强制刷新按帧数而不是时间计算
+    motion_gate = None
+    if args.motion_gate is not None:
+        motion_gate = {"threshold": args.motion_gate, "max_age": float("inf"), "max_skip": args.max_skip}
 
-
-    predict_from_cache(
-        model_path=args.model,
-        cache_dir=args.cache_dir,
-        save_dir=args.save_dir,
-        save_video=args.save_video,
-        show_window=not args.no_window,
-        conf=args.conf,
-        fps=args.fps
-    )
+    if args.pipeline:
+        predict_from_cache_pipelined(
+            model_path=args.model,
+            cache_dir=args.cache_dir,
+            save_dir=args.save_dir,
+            save_video=args.save_video,
+            conf=args.conf,
+            fps=args.fps,
+            store_dir=args.store_dir,
+            decode_workers=args.decode_workers,
+            batch_size=args.batch,
+            motion_gate=motion_gate,
+            detection_dir=args.detection_dir
+        )
+    else:
+        predict_from_cache(
+            model_path=args.model,
+            cache_dir=args.cache_dir,
+            save_dir=args.save_dir,
+            save_video=args.save_video,
+            show_window=not args.no_window,
+            conf=args.conf,
+            fps=args.fps,
+            store_dir=args.store_dir,
+            motion_gate=motion_gate,
+            detection_dir=args.detection_dir
+        )
@@ -2,8 +2,15 @@ import cv2
 import os
 import argparse
 import threading
-from ultralytics import YOLO
 from utils.data_proc_utils import get_timestamp
+from utils import metrics
+from utils.model_server import ModelServer
+from utils.inference_backends import load_backend
+from utils.motion_gate import GatedPredictor
+from utils.roi import CameraROI
+from utils.detection_store import DetectionStoreWriter
+from utils.birdseye import world_bounds_from_calibration
+from calibration.calibration_store import CalibrationStore
 from utils.predict_utils import (
     predict_single_frame,
     initialize_video_writer
@@ -11,19 +18,28 @@ from utils.predict_utils import (
 
 
 def predict_live(model_path, cam_id=0, save_video=False, save_dir=None,
-                  show_window=True, conf=0.25, fps=20):
+                  show_window=True, conf=0.25, fps=20, model=None, motion_gate=None, roi=None,
+                  detection_store=None):
     """
     实时摄像头推理
-    :param model_path: 模型路径
+    :param model_path: 模型路径，.pt / .onnx / OpenVINO 导出目录
     :param cam_id:
     :param save_video:
     :param save_dir:
     :param show_window:
     :param conf:
     :param fps:
+    :param model: 已加载的模型或 ModelServer，传入时不再单独加载 model_path
+    :param motion_gate: MotionGate 参数字典（如 {"threshold": 0.01, "max_age": 5.0}），
+                        指定时画面无明显变化的帧复用上一次的检测结果
+    :param roi: utils.roi.CameraROI，指定时只对巡检区域在画面中对应的像素区域推理
+    :param detection_store: DetectionStoreWriter，指定时记录每帧的检测结果（可由多个线程共享）
     :return: None
     """
-    model = YOLO(model_path)
+    if model is None:
+        model = load_backend(model_path)
+    if motion_gate is not None:
+        model = GatedPredictor(model, **motion_gate)
     cap = cv2.VideoCapture(cam_id)
 
     if not cap.isOpened():
@@ -53,7 +69,7 @@ def predict_live(model_path, cam_id=0, save_video=False, save_dir=None,
             print(f"{temp_str:-^30}")
             break
 
-        result_frame = predict_single_frame(model, frame, conf)
+        result_frame = predict_single_frame(model, frame, conf, roi, detection_store, cam_id)
 
         if show_window:
             cv2.imshow(f"Live YOLO Camera {cam_id}", result_frame)
@@ -71,15 +87,39 @@ def predict_live(model_path, cam_id=0, save_video=False, save_dir=None,
         writer.release()
     if show_window:
         cv2.destroyAllWindows()
+    if isinstance(model, GatedPredictor):
+        print(f"摄像头 {cam_id} 运动门控：{model.summary()}")
     temp_str = f"摄像头 {cam_id} 推理结束"
     print(f"{temp_str:-^30}")
 
 
 def predict_live_threads(model_path, cam_ids, save_video=False, save_dir=None,
-                           show_window=True, conf=0.25, fps=20):
+                           show_window=True, conf=0.25, fps=20, shared_model=True,
+                           max_batch_size=8, max_latency=0.01, motion_gate=None,
+                           roi_homography=None, world_bounds=None, roi_imgsz=None, detection_dir=None):
     """
     多线程实时推理
+    :param shared_model: 所有摄像头线程共享一个合批推理服务，否则每个线程各自加载模型
+    :param max_batch_size: 共享推理服务单次合批的最大帧数
+    :param max_latency: 共享推理服务凑批的最长等待时间（秒）
+    :param motion_gate: MotionGate 参数字典，每个摄像头线程各自维护门控状态
+    :param roi_homography: 标定文件路径，指定时各摄像头只对巡检区域对应的像素区域推理
+    :param world_bounds: 巡检区域的世界坐标范围 (xmin, ymin, xmax, ymax)，默认由标定参考点推算
+    :param roi_imgsz: 指定时把 ROI letterbox 为该尺寸后再送入模型
+    :param detection_dir: 检测结果存储目录，指定时记录所有摄像头每帧的检测结果
     """
+    rois = {}
+    if roi_homography is not None:
+        if world_bounds is None:
+            world_bounds = world_bounds_from_calibration(roi_homography)
+        for cid, H in CalibrationStore(roi_homography).homographies().items():
+            rois[cid] = CameraROI(H, world_bounds, imgsz=roi_imgsz)
+
+    server = None
+    if shared_model:
+        server = ModelServer(model_path, max_batch_size=max_batch_size, max_latency=max_latency)
+
+    detection_store = DetectionStoreWriter(detection_dir) if detection_dir else None
 
     threads = []
     for cam_id in cam_ids:
@@ -87,13 +127,22 @@ def predict_live_threads(model_path, cam_ids, save_video=False, save_dir=None,
         if not save_dir is None:
             save_dir_temp = os.path.join(save_dir, f"camera_{cam_id}")
         t = threading.Thread(target=predict_live, args=(model_path, cam_id, save_video, save_dir_temp,
-                                                         show_window, conf, fps))
+                                                         show_window, conf, fps, server, motion_gate,
+                                                         rois.get(str(cam_id)), detection_store))
         t.start()
         threads.append(t)
 
     for t in threads:
         t.join()
 
+    if detection_store is not None:
+        detection_store.close()
+        print(f"检测结果已写入：{detection_dir}，共 {detection_store.written} 条记录")
+
+    if server is not None:
+        server.close()
+        print(f"共享推理服务统计：{server.stats()}")
+
     temp_str = f"所有摄像头推理线程完成"
     print(f"{temp_str:-^30}")
 
@@ -102,14 +151,31 @@ def predict_live_threads(model_path, cam_ids, save_video=False, save_dir=None,
 # ---------------------
 def main():
     parser = argparse.ArgumentParser(description="实时摄像头 YOLO 推理")
-    parser.add_argument('--model', type=str, default='../models/yolov11/cmp_best.pt', help='YOLO 模型路径')
+    parser.add_argument('--model', type=str, default='../models/yolov11/cmp_best.pt', help='模型路径：.pt 权重、.onnx 文件或 OpenVINO 导出目录')
     parser.add_argument('--cam_ids', type=int, default=[1], help='摄像头编号')
     parser.add_argument('--save_video', action='store_true', default=False, help='是否保存视频')
     parser.add_argument('--save_dir', type=str, default=None, help='视频保存目录')
     parser.add_argument('--no_window', action='store_true', default=False, help='不显示窗口')
     parser.add_argument('--conf', type=float, default=0.4, help='YOLO 置信度阈值')
     parser.add_argument('--fps', type=int, default=20, help='保存视频帧率')
+    parser.add_argument('--no_shared_model', action='store_true', default=False, help='每个摄像头线程单独加载模型')
+    parser.add_argument('--max_batch', type=int, default=8, help='共享推理服务最大合批帧数')
+    parser.add_argument('--max_latency_ms', type=float, default=10, help='共享推理服务凑批最长等待时间（毫秒）')
+    parser.add_argument('--motion_gate', type=float, default=None,
+                        help='开启运动门控，变化像素占比低于该值时复用上一次检测结果，如 0.01')
+    parser.add_argument('--max_age', type=float, default=5.0, help='运动门控下复用检测结果的最长时间（秒）')
+    parser.add_argument('--roi_homography', type=str, default=None,
+                        help='标定文件路径，指定时只对巡检区域在画面中对应的像素区域推理')
+    parser.add_argument('--world_bounds', type=float, nargs=4, default=None,
+                        metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'), help='巡检区域世界坐标范围，默认由标定参考点推算')
+    parser.add_argument('--roi_imgsz', type=int, default=None, help='ROI letterbox 后送入模型的尺寸')
+    parser.add_argument('--detection_dir', type=str, default=None, help='检测结果存储目录，指定时记录每帧的检测结果')
     args = parser.parse_args()
+    metrics.configure_from_env()
+
+    motion_gate = None
+    if args.motion_gate is not None:
+        motion_gate = {"threshold": args.motion_gate, "max_age": args.max_age}
 
     predict_live_threads(
         model_path=args.model,
@@ -118,7 +184,15 @@ def main():
         save_dir=args.save_dir,
         show_window=not args.no_window,
         conf=args.conf,
-        fps=args.fps
+        fps=args.fps,
+        shared_model=not args.no_shared_model,
+        max_batch_size=args.max_batch,
+        max_latency=args.max_latency_ms / 1000,
+        motion_gate=motion_gate,
+        roi_homography=args.roi_homography,
+        world_bounds=args.world_bounds,
+        roi_imgsz=args.roi_imgsz,
+        detection_dir=args.detection_dir
     )
 
 if __name__ == '__main__':
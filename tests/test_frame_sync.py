@@ -0,0 +1,52 @@
+import os
+
+from utils.data_proc_utils import format_timestamp
+from utils.frame_sync import FrameSynchronizer
+
+BASE_MS = 1760000000000
+OFFSETS = {0: 0, 1: 30, 2: -40}  # 三个摄像头的相位差（毫秒）
+
+
+def _write_frames(cache_dir, cam_id, stamps):
+    directory = os.path.join(cache_dir, f"camera_{cam_id}")
+    os.makedirs(directory, exist_ok=True)
+    for t in stamps:
+        open(os.path.join(directory, f"{format_timestamp(t)}_cam{cam_id}.jpg"), "wb").close()
+
+
+def _offset_cameras(cache_dir, frames=10, period_ms=1000, skip=None, extra=None):
+    """每个摄像头每 period_ms 一帧，skip={cam: 帧序号} 丢弃某一帧，extra={cam: 时间} 追加一帧"""
+    for cid, offset in OFFSETS.items():
+        stamps = [BASE_MS + i * period_ms + offset for i in range(frames) if (skip or {}).get(cid) != i]
+        if extra and cid in extra:
+            stamps.append(extra[cid])
+        _write_frames(cache_dir, cid, stamps)
+
+
+def test_latest_walks_back_to_newest_valid_snapshot(tmp_path):
+    # 摄像头 1 丢了最后一个周期的帧，之后又写入一帧很晚的帧：各摄像头最新帧中最早的时刻已凑不齐
+    _offset_cameras(str(tmp_path), skip={1: 9}, extra={1: BASE_MS + 20000})
+    sync = FrameSynchronizer(str(tmp_path), tolerance_ms=80)
+
+    snapshots = list(sync.iter_snapshots())
+    latest = sync.latest()
+    assert snapshots and latest is not None
+    assert latest.timestamps == snapshots[-1].timestamps
+    assert latest.timestamps[0] == BASE_MS + 8000
+
+
+def test_skew_within_tolerance(tmp_path):
+    # 0 / +30 / -40 ms 的相位差下三帧最多相差 70 ms，超过 50 ms 的容差
+    _offset_cameras(str(tmp_path))
+    sync = FrameSynchronizer(str(tmp_path), tolerance_ms=50)
+    assert list(sync.iter_snapshots()) == []
+    assert sync.latest() is None
+
+    sync = FrameSynchronizer(str(tmp_path), tolerance_ms=50, min_cameras=2)
+    snapshots = list(sync.iter_snapshots())
+    latest = sync.latest()
+    assert snapshots and latest is not None
+    assert all(s.skew_ms <= 50 and len(s.paths) >= 2 for s in snapshots)
+    assert latest.skew_ms <= 50
+    assert latest.timestamps == snapshots[-1].timestamps
+    assert max(latest.timestamps.values()) >= BASE_MS + 9000 - 40
@@ -0,0 +1,220 @@
+import json
+
+import cv2
+import numpy as np
+
+from utils.projector import project_points
+
+
+def load_homographies(path="camera_homography.json"):
+    """读取标定文件，返回 {cam_id: 3x3 单应矩阵}"""
+    with open(path, "r") as f:
+        data = json.load(f)
+    return {int(k): np.array(v["H"], dtype=np.float64).reshape(3, 3) for k, v in data.items()}
+
+
+def world_bounds_from_frames(homographies, frame_shapes):
+    """将各摄像头图像四角投影到世界坐标，返回覆盖所有视野的 (xmin, ymin, xmax, ymax)，无可用摄像头时返回 None"""
+    corners = []
+    for cam_id, (h, w) in frame_shapes.items():
+        if cam_id not in homographies:
+            continue
+        pts = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype=np.float64)
+        corners.append(project_points(homographies[cam_id], pts))
+    if not corners:
+        return None
+    corners = np.concatenate(corners, axis=0)
+    corners = corners[np.all(np.isfinite(corners), axis=1)]
+    if len(corners) == 0:
+        return None
+    xmin, ymin = corners.min(axis=0)
+    xmax, ymax = corners.max(axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def world_bounds_from_calibration(path="camera_homography.json", margin=0.5):
+    """
+    由标定时录入的世界坐标参考点（dst）推算巡检区域范围，
+    margin 为在参考点外接矩形基础上向四周扩展的比例
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    pts = np.array([p for v in data.values() for p in v.get("dst", [])], dtype=np.float64)
+    xmin, ymin = pts.min(axis=0)
+    xmax, ymax = pts.max(axis=0)
+    dx, dy = (xmax - xmin) * margin, (ymax - ymin) * margin
+    return float(xmin - dx), float(ymin - dy), float(xmax + dx), float(ymax + dy)
+
+
+class BirdEyeView:
+    """
+    鸟瞰图拼接：
+    每个摄像头根据单应矩阵预先生成一次 remap 查找表（世界坐标画布像素 -> 图像像素），
+    此后每帧只需 cv2.remap。查找表以单应矩阵和帧尺寸为键缓存，标定变化时自动重建。
+    多摄像头重叠区域按到各自视野边缘的距离羽化融合。
+    """
+
+    def __init__(self, homographies, world_bounds=None, scale=2.0, max_size=1600, feather=True):
+        """
+        :param homographies: {cam_id: H}，H 将图像像素映射到世界坐标
+        :param world_bounds: 画布覆盖的世界坐标范围 (xmin, ymin, xmax, ymax)，None 时由首批帧自动推算
+        :param scale: 每个世界坐标单位对应的画布像素数
+        :param max_size: 画布最长边上限，超出时自动降低 scale
+        :param feather: 重叠区域是否羽化融合，否则等权平均
+        """
+        self.homographies = dict(homographies)
+        self.world_bounds = world_bounds
+        self.scale = scale
+        self.max_size = max_size
+        self.feather = feather
+        self._maps = {}         # cam_id -> (key, roi, map1, map2, weight)
+        self._norm_weights = {}  # 参与拼接的摄像头组合 -> {cam_id: 归一化权重}
+        if world_bounds is not None:
+            self._clamp_scale()
+
+    @property
+    def canvas_size(self):
+        xmin, ymin, xmax, ymax = self.world_bounds
+        return (max(1, int(np.ceil((xmax - xmin) * self.scale))),
+                max(1, int(np.ceil((ymax - ymin) * self.scale))))
+
+    def _fit_bounds(self, frames):
+        bounds = world_bounds_from_frames(
+            self.homographies, {cid: f.shape[:2] for cid, f in frames.items()})
+        if bounds is not None:
+            self.world_bounds = bounds
+            self._clamp_scale()
+
+    def _clamp_scale(self):
+        """画布最长边超过 max_size 时降低 scale（查找表以 scale 为键，随之重建）"""
+        w, h = self.canvas_size
+        if self.max_size and max(w, h) > self.max_size:
+            self.scale *= self.max_size / max(w, h)
+
+    def update_homographies(self, homographies):
+        """更新单应矩阵；未变化的摄像头继续使用已缓存的查找表"""
+        self.homographies = dict(homographies)
+        self._norm_weights.clear()
+        if self.world_bounds is not None:
+            self._clamp_scale()
+
+    def world_to_canvas(self, world_points):
+        """世界坐标 (N, 2) 转画布像素坐标 (N, 2)"""
+        xmin, ymin, _, _ = self.world_bounds
+        return (np.asarray(world_points, dtype=np.float64) - [xmin, ymin]) * self.scale
+
+    def _build(self, cam_id, H, frame_shape):
+        h, w = frame_shape
+        cw, ch = self.canvas_size
+        xmin, ymin, _, _ = self.world_bounds
+
+        # 画布每个像素中心对应的世界坐标，经 H^-1 得到图像像素坐标
+        u, v = np.meshgrid(np.arange(cw, dtype=np.float64), np.arange(ch, dtype=np.float64))
+        X = xmin + (u + 0.5) / self.scale
+        Y = ymin + (v + 0.5) / self.scale
+        Hi = np.linalg.inv(H)
+        den = Hi[2, 0] * X + Hi[2, 1] * Y + Hi[2, 2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            map_x = (Hi[0, 0] * X + Hi[0, 1] * Y + Hi[0, 2]) / den
+            map_y = (Hi[1, 0] * X + Hi[1, 1] * Y + Hi[1, 2]) / den
+
+        # 地平面在相机后方（den <= 0）或超出图像的像素不参与拼接
+        valid = (den > 0) & (map_x >= 0) & (map_x <= w - 1) & (map_y >= 0) & (map_y <= h - 1)
+
+        # 只保留该摄像头可见区域的外接矩形，remap 与融合都只在该范围内进行
+        rows, cols = np.any(valid, axis=1), np.any(valid, axis=0)
+        if not rows.any():
+            roi = (0, 0, 0, 0)
+        else:
+            y0, y1 = np.argmax(rows), len(rows) - np.argmax(rows[::-1])
+            x0, x1 = np.argmax(cols), len(cols) - np.argmax(cols[::-1])
+            roi = (int(x0), int(y0), int(x1), int(y1))
+        x0, y0, x1, y1 = roi
+        valid, map_x, map_y = valid[y0:y1, x0:x1], map_x[y0:y1, x0:x1], map_y[y0:y1, x0:x1]
+
+        map_x = np.where(valid, map_x, -1).astype(np.float32)
+        map_y = np.where(valid, map_y, -1).astype(np.float32)
+        map1, map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+        mask = valid.astype(np.uint8)
+        if self.feather:
+            # 外扩一圈 0 再求距离，使贴着外接矩形边缘的视野边界同样被羽化
+            padded = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+            weight = cv2.distanceTransform(padded, cv2.DIST_L2, 3)[1:-1, 1:-1].astype(np.float32)
+        else:
+            weight = mask.astype(np.float32)
+        return roi, map1, map2, weight
+
+    def _lookup(self, cam_id, frame_shape):
+        H = self.homographies[cam_id]
+        key = (H.tobytes(), tuple(frame_shape), self.world_bounds, self.scale)
+        cached = self._maps.get(cam_id)
+        if cached is None or cached[0] != key:
+            cached = (key, *self._build(cam_id, H, frame_shape))
+            self._maps[cam_id] = cached
+            self._norm_weights.clear()
+        return cached[1:]
+
+    def _warp_roi(self, cam_id, frame):
+        roi, map1, map2, _ = self._lookup(cam_id, frame.shape[:2])
+        if roi[2] <= roi[0] or roi[3] <= roi[1]:
+            return roi, None
+        patch = cv2.remap(frame, map1, map2, cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        return roi, patch
+
+    def warp(self, cam_id, frame):
+        """将单个摄像头画面变换到世界坐标画布"""
+        if self.world_bounds is None:
+            self._fit_bounds({cam_id: frame})
+        cw, ch = self.canvas_size
+        canvas = np.zeros((ch, cw) + frame.shape[2:], dtype=frame.dtype)
+        (x0, y0, x1, y1), patch = self._warp_roi(cam_id, frame)
+        if patch is not None:
+            canvas[y0:y1, x0:x1] = patch
+        return canvas
+
+    def _normalized_weights(self, cam_ids):
+        key = tuple(cam_ids)
+        weights = self._norm_weights.get(key)
+        if weights is None:
+            total = np.zeros(self.canvas_size[::-1], dtype=np.float32)
+            for cid in cam_ids:
+                x0, y0, x1, y1 = self._maps[cid][1]
+                total[y0:y1, x0:x1] += self._maps[cid][4]
+            total[total == 0] = 1.0
+            weights = {}
+            for cid in cam_ids:
+                x0, y0, x1, y1 = self._maps[cid][1]
+                if x1 <= x0 or y1 <= y0:
+                    continue
+                weights[cid] = cv2.merge([self._maps[cid][4] / total[y0:y1, x0:x1]] * 3)
+            self._norm_weights[key] = weights
+        return weights
+
+    def mosaic(self, frames):
+        """
+        拼接多个摄像头画面
+        :param frames: {cam_id: BGR 图像}，未标定的摄像头会被忽略
+        :return: 画布尺寸的 BGR 图像；画布范围尚未确定且没有可用画面时返回 1x1 黑色占位图
+        """
+        frames = {cid: f for cid, f in frames.items() if f is not None and cid in self.homographies}
+        if self.world_bounds is None and frames:
+            self._fit_bounds(frames)
+        if self.world_bounds is None:
+            return np.zeros((1, 1, 3), dtype=np.uint8)
+        cw, ch = self.canvas_size
+        if not frames:
+            return np.zeros((ch, cw, 3), dtype=np.uint8)
+
+        cam_ids = sorted(frames)
+        warped = {cid: self._warp_roi(cid, frames[cid]) for cid in cam_ids}
+        weights = self._normalized_weights(cam_ids)
+
+        acc = np.zeros((ch, cw, 3), dtype=np.float32)
+        for cid in cam_ids:
+            (x0, y0, x1, y1), patch = warped[cid]
+            if patch is None:
+                continue
+            acc[y0:y1, x0:x1] += cv2.multiply(patch, weights[cid], dtype=cv2.CV_32F)
+        return cv2.convertScaleAbs(acc)
@@ -1,6 +1,36 @@
 import os
+import re
 import shutil
 import argparse
+import heapq
+import threading
+import time
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+_SEGMENT_RE = re.compile(r"^(seg_\d{6})\.(bin|idx)$")
+
+
+def _resolve_cache_dir(cache_dir):
+    """绝对路径原样返回（仅规范化）；相对路径以项目根目录为基准"""
+    if os.path.isabs(cache_dir):
+        return os.path.normpath(cache_dir)
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', cache_dir))
+
+
+def _iter_files(path):
+    """递归 scandir，产出 (DirEntry, stat)，stat 信息复用目录遍历结果，不再逐文件 getsize"""
+    try:
+        entries = list(os.scandir(path))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry, entry.stat(follow_symlinks=False)
+        except OSError:
+            continue
 
 def clean_cache(
     cache_dir='Cache',
@@ -17,7 +47,7 @@ def clean_cache(
         delete_images_only (bool): 是否只删除图像文件
         verbose (bool): 是否打印日志
     """
-    abs_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', cache_dir))
+    abs_path = _resolve_cache_dir(cache_dir)
     if not os.path.exists(abs_path):
         if verbose:
             print(f"缓存目录 {abs_path} 不存在")
@@ -28,12 +58,7 @@ def clean_cache(
 
     if delete_all:
         # 统计整个目录大小
-        for root, _, files in os.walk(abs_path):
-            for file in files:
-                try:
-                    total_bytes += os.path.getsize(os.path.join(root, file))
-                except:
-                    continue
+        total_bytes = sum(st.st_size for _, st in _iter_files(abs_path))
         shutil.rmtree(abs_path)
         if verbose:
             print(f"已删除整个缓存目录：{abs_path}")
@@ -41,17 +66,15 @@ def clean_cache(
         return
 
     # 仅删除图像文件
-    for root, _, files in os.walk(abs_path):
-        for file in files:
-            if delete_images_only and not file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                continue
-            file_path = os.path.join(root, file)
-            try:
-                total_bytes += os.path.getsize(file_path)
-                os.remove(file_path)
-                deleted_files += 1
-            except:
-                continue
+    for entry, st in _iter_files(abs_path):
+        if delete_images_only and not entry.name.lower().endswith(IMAGE_EXTS):
+            continue
+        try:
+            os.remove(entry.path)
+            total_bytes += st.st_size
+            deleted_files += 1
+        except OSError:
+            continue
 
     if verbose:
         print(f"共清理 {deleted_files} 个图像文件")
@@ -66,6 +89,168 @@ def _format_size(bytes_num):
     else:
         return f"{bytes_num} B"
 
+def parse_size(text):
+    """'500M' / '20G' / '1024' -> 字节数"""
+    units = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    m = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?)B?\s*", str(text).upper())
+    if not m:
+        raise ValueError(f"无法解析的容量: {text}")
+    return int(float(m.group(1)) * units[m.group(2)])
+
+
+def parse_duration(text):
+    """'90s' / '30m' / '12h' / '7d' / '3600' -> 秒数"""
+    units = {'': 1, 'S': 1, 'M': 60, 'H': 3600, 'D': 86400}
+    m = re.fullmatch(r"\s*([\d.]+)\s*([SMHD]?)\s*", str(text).upper())
+    if not m:
+        raise ValueError(f"无法解析的时长: {text}")
+    return float(m.group(1)) * units[m.group(2)]
+
+
+def _scan_cache(abs_path):
+    """
+    按摄像头（所在目录）分组收集可淘汰的缓存单元，每组按修改时间升序：
+    图像文件各自为一个单元，帧存储的 seg_XXXXXX.bin/.idx 作为一个单元整体淘汰
+    :return: {目录: [(mtime, size, [paths])]}
+    """
+    groups = {}
+    segments = {}
+    for entry, st in _iter_files(abs_path):
+        parent = os.path.dirname(entry.path)
+        if entry.name.lower().endswith(IMAGE_EXTS):
+            groups.setdefault(parent, []).append((st.st_mtime, st.st_size, [entry.path]))
+            continue
+        m = _SEGMENT_RE.match(entry.name)
+        if m:
+            seg = segments.setdefault((parent, m.group(1)), [0.0, 0, []])
+            seg[0] = max(seg[0], st.st_mtime)
+            seg[1] += st.st_size
+            seg[2].append(entry.path)
+    for (parent, _), (mtime, size, paths) in sorted(segments.items()):
+        groups.setdefault(parent, []).append((mtime, size, paths))
+    for units in groups.values():
+        units.sort(key=lambda u: u[0])
+    return groups
+
+
+def enforce_retention(cache_dir='Cache', max_bytes=None, max_age=None, keep_latest=1,
+                      min_age=2.0, verbose=True):
+    """
+    按容量上限与最长保留时间清理缓存，不删除整个目录：
+    1. 超过 max_age 秒的帧直接删除
+    2. 剩余总量仍超过 max_bytes 时，每次从当前占用最大的摄像头目录中删除其最旧的帧，直至低于上限；
+       各摄像头按时间从旧到新淘汰，繁忙的摄像头不会挤掉其他摄像头的历史帧
+    每个摄像头目录最新的 keep_latest 个单元（HomographyProjector 读取的最新帧、正在写入的帧存储段）
+    以及 min_age 秒内刚写入的文件始终保留，因此可与采集进程并行运行。
+
+    :return: (删除文件数, 释放字节数)
+    """
+    abs_path = _resolve_cache_dir(cache_dir)
+    if not os.path.isdir(abs_path):
+        return 0, 0
+
+    now = time.time()
+    groups = _scan_cache(abs_path)
+    total_bytes = sum(size for units in groups.values() for _, size, _ in units)
+
+    deleted_files, freed = 0, 0
+
+    def remove(unit):
+        nonlocal deleted_files, freed
+        for path in unit[2]:
+            try:
+                os.remove(path)
+                deleted_files += 1
+            except OSError:
+                continue
+        freed += unit[1]
+
+    # 各目录可淘汰的单元（按时间升序）与当前占用
+    candidates, usage = {}, {}
+    for parent, units in groups.items():
+        evictable = units[:-keep_latest] if keep_latest > 0 else units
+        candidates[parent] = [u for u in evictable if now - u[0] >= min_age]
+        usage[parent] = sum(size for _, size, _ in units)
+
+    if max_age is not None:
+        for parent, units in candidates.items():
+            expired = 0
+            while expired < len(units) and now - units[expired][0] > max_age:
+                remove(units[expired])
+                usage[parent] -= units[expired][1]
+                expired += 1
+            candidates[parent] = units[expired:]
+
+    if max_bytes is not None and total_bytes - freed > max_bytes:
+        heap = [(-usage[parent], parent, 0) for parent, units in candidates.items() if units]
+        heapq.heapify(heap)
+        while heap and total_bytes - freed > max_bytes:
+            _, parent, i = heapq.heappop(heap)
+            unit = candidates[parent][i]
+            remove(unit)
+            usage[parent] -= unit[1]
+            if i + 1 < len(candidates[parent]):
+                heapq.heappush(heap, (-usage[parent], parent, i + 1))
+
+    if verbose and deleted_files:
+        print(f"缓存保留策略：删除 {deleted_files} 个文件，释放 {_format_size(freed)}，"
+              f"当前占用 {_format_size(total_bytes - freed)}")
+    return deleted_files, freed
+
+
+class CacheRetentionDaemon:
+    """
+    后台缓存保留线程：每 interval 秒执行一次 enforce_retention。
+    只删除旧文件、不持有任何写端资源，采集线程无需等待。
+    """
+
+    def __init__(self, cache_dir='Cache', max_bytes=None, max_age=None, interval=30.0,
+                 keep_latest=1, verbose=True):
+        if max_bytes is None and max_age is None:
+            raise ValueError("max_bytes 与 max_age 至少需要指定一个")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.keep_latest = keep_latest
+        self.verbose = verbose
+        self.deleted_files = 0
+        self.freed_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="cache-retention", daemon=True)
+
+    def run_once(self):
+        deleted, freed = enforce_retention(self.cache_dir, self.max_bytes, self.max_age,
+                                           self.keep_latest, verbose=self.verbose)
+        self.deleted_files += deleted
+        self.freed_bytes += freed
+        return deleted, freed
+
+    def _loop(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"缓存保留线程出错: {e}")
+            if self._stop.wait(self.interval):
+                break
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
 # ------------------------
 # CLI 入口函数
 # ------------------------
@@ -73,11 +258,33 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="清理缓存目录")
     parser.add_argument('--delete_all', action='store_true', help='删除整个 Cache 文件夹')
     parser.add_argument('--dir', type=str, default='Cache', help='要清理的缓存目录')
+    parser.add_argument('--max_size', type=str, default=None, help='容量上限，如 500M、20G')
+    parser.add_argument('--max_age', type=str, default=None, help='最长保留时间，如 30m、12h、7d')
+    parser.add_argument('--keep_latest', type=int, default=1, help='每个摄像头始终保留的最新帧数')
+    parser.add_argument('--daemon', action='store_true', help='常驻运行，按 --interval 周期执行保留策略')
+    parser.add_argument('--interval', type=float, default=30.0, help='常驻模式下的检查间隔（秒）')
+    parser.add_argument('--yes', action='store_true', help='跳过确认提示')
     args = parser.parse_args()
 
-    confirm = input(f"确定清理缓存目录 '{args.dir}'？(y/[n]): ")
-    if confirm.lower() == 'y':
-        clean_cache(cache_dir=args.dir, delete_all=args.delete_all)
+    max_bytes = parse_size(args.max_size) if args.max_size else None
+    max_age = parse_duration(args.max_age) if args.max_age else None
+
+    if args.daemon:
+        daemon = CacheRetentionDaemon(args.dir, max_bytes, max_age, args.interval, args.keep_latest)
+        print(f"缓存保留线程已启动：{_resolve_cache_dir(args.dir)}，Ctrl+C 退出")
+        daemon.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            daemon.stop()
+            print(f"共删除 {daemon.deleted_files} 个文件，释放 {_format_size(daemon.freed_bytes)}")
+    elif max_bytes is not None or max_age is not None:
+        enforce_retention(args.dir, max_bytes, max_age, args.keep_latest)
     else:
-        print("清理操作已取消")
+        confirm = 'y' if args.yes else input(f"确定清理缓存目录 '{args.dir}'？(y/[n]): ")
+        if confirm.lower() == 'y':
+            clean_cache(cache_dir=args.dir, delete_all=args.delete_all)
+        else:
+            print("清理操作已取消")
 
@@ -3,4 +3,18 @@ from datetime import datetime
 def get_timestamp():
     """返回当前时间字符串，格式：YYYYMMDD_HHMMSS_mmm"""
     now = datetime.now()
-    return now.strftime('%Y%m%d_%H%M%S_') + f"{int(now.microsecond / 1000):03d}"
\ No newline at end of file
+    return now.strftime('%Y%m%d_%H%M%S_') + f"{int(now.microsecond / 1000):03d}"
+
+def get_timestamp_ms():
+    """返回当前时间的毫秒级 Unix 时间戳"""
+    return int(datetime.now().timestamp() * 1000)
+
+def parse_timestamp(ts):
+    """将 get_timestamp() 格式的字符串（YYYYMMDD_HHMMSS_mmm）转换为毫秒级 Unix 时间戳"""
+    base = datetime.strptime(ts[:15], '%Y%m%d_%H%M%S')
+    return int(base.timestamp()) * 1000 + int(ts[16:19])
+
+def format_timestamp(ms):
+    """将毫秒级 Unix 时间戳转换为 get_timestamp() 格式的字符串"""
+    dt = datetime.fromtimestamp(ms / 1000)
+    return dt.strftime('%Y%m%d_%H%M%S_') + f"{int(ms % 1000):03d}"
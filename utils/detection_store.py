@@ -0,0 +1,304 @@
+import argparse
+import os
+import re
+import threading
+
+import numpy as np
+
+from utils.data_proc_utils import get_timestamp_ms, parse_timestamp, format_timestamp
+from utils.projector import boxes_to_arrays, project_detections
+
+# 每个检测框一条定长记录；cls 为 -1 的记录表示该帧已推理但没有检测结果
+DETECTION_DTYPE = np.dtype([
+    ("timestamp", "<i8"),   # 毫秒级 Unix 时间戳
+    ("camera", "<i4"),
+    ("cls", "<i2"),
+    ("conf", "<f4"),
+    ("x1", "<f4"),
+    ("y1", "<f4"),
+    ("x2", "<f4"),
+    ("y2", "<f4"),
+])
+
+# 块写满（或写入端关闭）时追加一条块索引，读取时据此跳过时间范围或摄像头不相关的块
+CHUNK_DTYPE = np.dtype([
+    ("chunk", "<i4"),
+    ("rows", "<i8"),
+    ("t_min", "<i8"),
+    ("t_max", "<i8"),
+    ("cameras", "<u8"),     # 摄像头位图，编号 >= 63 的摄像头都记在最高位
+])
+
+INDEX_FILE = "chunks.idx"
+_CHUNK_RE = re.compile(r"^det_(\d{6})\.rec$")
+_FRAME_NAME_RE = re.compile(r"^(\d{8}_\d{6}_\d{3})_cam(-?\d+)\.")
+
+
+def _chunk_path(root, chunk_id):
+    return os.path.join(root, f"det_{chunk_id:06d}.rec")
+
+
+def list_chunks(root):
+    """按编号升序返回目录中的所有块编号"""
+    if not os.path.isdir(root):
+        return []
+    ids = []
+    for entry in os.scandir(root):
+        m = _CHUNK_RE.match(entry.name)
+        if m:
+            ids.append(int(m.group(1)))
+    return sorted(ids)
+
+
+def camera_mask(cam_ids):
+    mask = 0
+    for cid in cam_ids:
+        mask |= 1 << min(max(int(cid), 0), 63)
+    return mask
+
+
+def parse_frame_name(filename):
+    """
+    解析 capture_to_cache 的帧文件名 {YYYYMMDD_HHMMSS_mmm}_cam{id}.jpg
+    :return: (timestamp_ms, cam_id)，不符合格式时返回 (None, None)
+    """
+    m = _FRAME_NAME_RE.match(os.path.basename(filename))
+    if not m:
+        return None, None
+    return parse_timestamp(m.group(1)), int(m.group(2))
+
+
+def make_records(cam_id, timestamp_ms, cls, conf, xyxy):
+    """把一帧的检测结果转换为记录数组，没有检测时返回一条 cls=-1 的占位记录"""
+    cls = np.asarray(cls).reshape(-1)
+    n = len(cls)
+    records = np.zeros(max(n, 1), dtype=DETECTION_DTYPE)
+    records["timestamp"] = timestamp_ms
+    records["camera"] = cam_id
+    if n == 0:
+        records["cls"] = -1
+        return records
+    xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+    records["cls"] = cls
+    records["conf"] = np.asarray(conf).reshape(-1)
+    records["x1"], records["y1"], records["x2"], records["y2"] = xyxy.T
+    return records
+
+
+class DetectionStoreWriter:
+    """
+    追加写入的检测结果存储：
+    记录顺序写入 det_XXXXXX.rec，每块满 chunk_rows 条后切换到新块，
+    并在 chunks.idx 中追加该块的时间范围与摄像头位图。多个线程可共享同一实例。
+    """
+
+    def __init__(self, root, chunk_rows=65536):
+        self.root = root
+        self.chunk_rows = chunk_rows
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        chunks = list_chunks(root)
+        # 总是从新块开始写，已有块保持只读
+        self._chunk_id = chunks[-1] + 1 if chunks else 0
+        self._file = None
+        self._open_chunk()
+        self.written = 0
+
+    def _open_chunk(self):
+        self._file = open(_chunk_path(self.root, self._chunk_id), "ab")
+        self._rows = 0
+        self._t_min = np.iinfo(np.int64).max
+        self._t_max = np.iinfo(np.int64).min
+        self._cameras = 0
+
+    def _seal(self):
+        """关闭当前块并写入块索引，空块直接删除"""
+        self._file.close()
+        if self._rows == 0:
+            os.remove(_chunk_path(self.root, self._chunk_id))
+            return
+        entry = np.zeros(1, dtype=CHUNK_DTYPE)
+        entry[0] = (self._chunk_id, self._rows, self._t_min, self._t_max, self._cameras)
+        with open(os.path.join(self.root, INDEX_FILE), "ab") as f:
+            f.write(entry.tobytes())
+
+    def append_records(self, records):
+        with self._lock:
+            if self._rows > 0 and self._rows + len(records) > self.chunk_rows:
+                self._seal()
+                self._chunk_id += 1
+                self._open_chunk()
+            self._file.write(records.tobytes())
+            self._file.flush()
+            self._rows += len(records)
+            self._t_min = min(self._t_min, int(records["timestamp"].min()))
+            self._t_max = max(self._t_max, int(records["timestamp"].max()))
+            self._cameras |= camera_mask(np.unique(records["camera"]))
+            self.written += len(records)
+
+    def append(self, cam_id, cls, conf, xyxy, timestamp_ms=None):
+        """追加一帧的检测结果，timestamp_ms 默认当前时间"""
+        timestamp_ms = get_timestamp_ms() if timestamp_ms is None else int(timestamp_ms)
+        self.append_records(make_records(cam_id, timestamp_ms, cls, conf, xyxy))
+
+    def append_result(self, cam_id, result, timestamp_ms=None):
+        """追加一个 YOLO Results（整帧坐标）"""
+        cls, conf, xyxy = boxes_to_arrays(result.boxes)
+        self.append(cam_id, cls, conf, xyxy, timestamp_ms)
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._seal()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DetectionStoreReader:
+    """
+    检测结果存储的读取端：只载入块索引，
+    查询时按时间范围与摄像头位图筛选块，再通过 np.memmap 读取命中块中的记录。
+    写入端仍在写的块（尚无块索引）每次查询都会完整扫描。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.chunks = np.zeros(0, dtype=CHUNK_DTYPE)
+        self.open_chunks = []
+        self.refresh()
+
+    def refresh(self):
+        """重新读取块索引，返回块总数"""
+        index_path = os.path.join(self.root, INDEX_FILE)
+        if os.path.exists(index_path):
+            self.chunks = np.fromfile(index_path, dtype=CHUNK_DTYPE,
+                                      count=os.path.getsize(index_path) // CHUNK_DTYPE.itemsize)
+        sealed = set(self.chunks["chunk"].tolist())
+        self.open_chunks = [c for c in list_chunks(self.root) if c not in sealed]
+        return len(self.chunks) + len(self.open_chunks)
+
+    def _load(self, chunk_id, rows=None):
+        path = _chunk_path(self.root, chunk_id)
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        if rows is None:
+            # 丢弃尚未完整写入的末尾记录
+            rows = os.path.getsize(path) // DETECTION_DTYPE.itemsize
+        if rows == 0:
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        return np.memmap(path, dtype=DETECTION_DTYPE, mode="r", shape=(int(rows),))
+
+    def _candidates(self, start_ms, end_ms, cam_ids):
+        keep = np.ones(len(self.chunks), dtype=bool)
+        if start_ms is not None:
+            keep &= self.chunks["t_max"] >= start_ms
+        if end_ms is not None:
+            keep &= self.chunks["t_min"] < end_ms
+        if cam_ids is not None:
+            keep &= (self.chunks["cameras"] & np.uint64(camera_mask(cam_ids))) != 0
+        sealed = [(int(c), int(n)) for c, n in zip(self.chunks["chunk"][keep], self.chunks["rows"][keep])]
+        return sealed + [(c, None) for c in self.open_chunks]
+
+    def query(self, start_ms=None, end_ms=None, cam_ids=None, include_empty=False):
+        """
+        返回时间范围 [start_ms, end_ms) 内、属于 cam_ids 的记录，按时间升序
+        :param include_empty: 是否包含 cls=-1 的无检测占位记录
+        """
+        parts = []
+        for chunk_id, rows in self._candidates(start_ms, end_ms, cam_ids):
+            records = self._load(chunk_id, rows)
+            if not len(records):
+                continue
+            ts = records["timestamp"]
+            mask = np.ones(len(records), dtype=bool)
+            if start_ms is not None:
+                mask &= ts >= start_ms
+            if end_ms is not None:
+                mask &= ts < end_ms
+            if cam_ids is not None:
+                mask &= np.isin(records["camera"], list(cam_ids))
+            if not include_empty:
+                mask &= records["cls"] >= 0
+            parts.append(np.array(records[mask]))
+        if not parts:
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        records = np.concatenate(parts)
+        return records[np.argsort(records["timestamp"], kind="stable")]
+
+    def cameras(self):
+        cams = set()
+        for chunk_id, rows in self._candidates(None, None, None):
+            cams.update(np.unique(self._load(chunk_id, rows)["camera"]).tolist())
+        return sorted(cams)
+
+    def time_range(self):
+        lo = self.chunks["t_min"].min() if len(self.chunks) else None
+        hi = self.chunks["t_max"].max() if len(self.chunks) else None
+        for chunk_id in self.open_chunks:
+            ts = self._load(chunk_id)["timestamp"]
+            if len(ts):
+                lo = ts.min() if lo is None else min(lo, ts.min())
+                hi = ts.max() if hi is None else max(hi, ts.max())
+        return None if lo is None else (int(lo), int(hi))
+
+    def iter_frames(self, start_ms=None, end_ms=None, cam_ids=None):
+        """按时间顺序逐帧产出 (timestamp_ms, cam_id, 该帧的记录)，包含无检测的帧"""
+        records = self.query(start_ms, end_ms, cam_ids, include_empty=True)
+        if not len(records):
+            return
+        order = np.lexsort((records["camera"], records["timestamp"]))
+        records = records[order]
+        key = records["timestamp"] * 1024 + records["camera"]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+        for s, e in zip(starts, np.r_[starts[1:], len(records)]):
+            frame = records[s:e]
+            yield int(frame["timestamp"][0]), int(frame["camera"][0]), frame[frame["cls"] >= 0]
+
+
+def records_to_arrays(records):
+    """记录数组转为 cls (N,), conf (N,), xyxy (N, 4)，与 boxes_to_arrays 的返回一致"""
+    xyxy = np.stack([records["x1"], records["y1"], records["x2"], records["y2"]], axis=1).astype(np.float64)
+    return records["cls"].astype(np.float64), records["conf"].astype(np.float64), xyxy
+
+
+def project_records(records, homographies, conf_thresh=0.0):
+    """
+    按摄像头把记录投影到世界坐标
+    :param homographies: {cam_id(str): {"H": 3x3 H}}，与 HomographyProjector.homographies 结构相同
+    :return: (N, 4) [cls, x, y, conf]
+    """
+    records = records[records["cls"] >= 0]
+    projected = []
+    for cam_id in np.unique(records["camera"]):
+        entry = homographies.get(str(int(cam_id)))
+        if entry is None:
+            continue
+        cls, conf, xyxy = records_to_arrays(records[records["camera"] == cam_id])
+        projected.append(project_detections(entry["H"], cls, conf, xyxy, conf_thresh))
+    if not projected:
+        return np.empty((0, 4))
+    return np.concatenate(projected, axis=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检测结果存储统计")
+    parser.add_argument('--root', type=str, default='Detections', help='检测结果存储目录')
+    args = parser.parse_args()
+
+    reader = DetectionStoreReader(args.root)
+    time_range = reader.time_range()
+    if time_range is None:
+        print("存储中没有记录")
+    else:
+        records = reader.query(include_empty=True)
+        print(f"块 {len(reader.chunks)} 个（写入中 {len(reader.open_chunks)} 个），记录 {len(records)} 条")
+        print(f"时间范围：{format_timestamp(time_range[0])} ~ {format_timestamp(time_range[1])}")
+        for cid in np.unique(records["camera"]):
+            cam = records[records["camera"] == cid]
+            frames = len(np.unique(cam["timestamp"]))
+            print(f"摄像头 {cid}: {frames} 帧，检测 {int(np.sum(cam['cls'] >= 0))} 个")
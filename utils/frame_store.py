@@ -0,0 +1,214 @@
+import os
+import re
+import threading
+
+import cv2
+import numpy as np
+
+from utils.data_proc_utils import get_timestamp_ms
+
+CODEC_RAW = 0
+CODEC_JPEG = 1
+CODEC_PNG = 2
+CODECS = {"raw": CODEC_RAW, "jpeg": CODEC_JPEG, "png": CODEC_PNG}
+
+# 每帧一条定长索引记录，直接追加写入 .idx 文件，读取时 np.fromfile 即可还原
+INDEX_DTYPE = np.dtype([
+    ("timestamp", "<i8"),   # 毫秒级 Unix 时间戳
+    ("camera", "<i4"),
+    ("codec", "u1"),
+    ("offset", "<i8"),      # 帧数据在 .bin 中的起始字节
+    ("length", "<i8"),
+    ("height", "<i4"),
+    ("width", "<i4"),
+    ("channels", "<i4"),
+])
+
+_SEGMENT_RE = re.compile(r"^seg_(\d{6})\.bin$")
+
+
+def _segment_paths(root, seg_id):
+    base = os.path.join(root, f"seg_{seg_id:06d}")
+    return base + ".bin", base + ".idx"
+
+
+def list_segments(root):
+    """按编号升序返回目录中的所有段编号"""
+    if not os.path.isdir(root):
+        return []
+    ids = []
+    for entry in os.scandir(root):
+        m = _SEGMENT_RE.match(entry.name)
+        if m:
+            ids.append(int(m.group(1)))
+    return sorted(ids)
+
+
+class FrameStoreWriter:
+    """
+    追加写入的分段帧存储：
+    帧数据顺序写入 seg_XXXXXX.bin，每帧的时间戳/摄像头/偏移写入同名 .idx，
+    单段超过 segment_bytes 后切换到新段，便于按段整体清理。
+    """
+
+    def __init__(self, root, codec="jpeg", segment_bytes=256 * 1024 ** 2, jpeg_quality=95):
+        if codec not in CODECS:
+            raise ValueError(f"未知的帧编码格式: {codec}，可选 {list(CODECS)}")
+        self.root = root
+        self.codec = codec
+        self.segment_bytes = segment_bytes
+        self.jpeg_quality = jpeg_quality
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        segments = list_segments(root)
+        # 总是从新段开始写，已有段保持只读
+        self._seg_id = segments[-1] + 1 if segments else 0
+        self._bin = None
+        self._idx = None
+        self._size = 0
+        self._open_segment()
+
+    def _open_segment(self):
+        bin_path, idx_path = _segment_paths(self.root, self._seg_id)
+        self._bin = open(bin_path, "ab")
+        self._idx = open(idx_path, "ab")
+        self._size = self._bin.tell()
+
+    def _roll(self):
+        self._bin.close()
+        self._idx.close()
+        self._seg_id += 1
+        self._open_segment()
+
+    def encode(self, frame):
+        """按存储格式编码单帧，可在写入线程之外预先调用"""
+        if self.codec == "raw":
+            return np.ascontiguousarray(frame).tobytes()
+        ext = ".jpg" if self.codec == "jpeg" else ".png"
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), int(self.jpeg_quality)] if self.codec == "jpeg" else []
+        ok, buf = cv2.imencode(ext, frame, params)
+        if not ok:
+            raise RuntimeError(f"{self.codec} 编码失败")
+        return buf.tobytes()
+
+    def append(self, cam_id, frame, timestamp_ms=None, encoded=None):
+        """
+        追加一帧
+        :param frame: BGR 图像，用于记录尺寸（encoded 为空时同时用于编码）
+        :param timestamp_ms: 毫秒级时间戳，默认当前时间
+        :param encoded: 已通过 encode() 编码好的字节串
+        """
+        data = encoded if encoded is not None else self.encode(frame)
+        timestamp_ms = get_timestamp_ms() if timestamp_ms is None else int(timestamp_ms)
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+
+        with self._lock:
+            if self._size > 0 and self._size + len(data) > self.segment_bytes:
+                self._roll()
+            record = np.zeros(1, dtype=INDEX_DTYPE)
+            record[0] = (timestamp_ms, cam_id, CODECS[self.codec], self._size, len(data), h, w, c)
+            # 先写数据再写索引，读端只会看到数据已完整落盘的记录
+            self._bin.write(data)
+            self._bin.flush()
+            self._idx.write(record.tobytes())
+            self._idx.flush()
+            self._size += len(data)
+
+    def close(self):
+        with self._lock:
+            self._bin.close()
+            self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FrameStoreReader:
+    """
+    分段帧存储的读取端：索引全部载入内存并按时间排序，
+    帧数据通过 np.memmap 按需映射，raw 格式直接返回映射视图（零拷贝）
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.segments = np.zeros(0, dtype=np.int32)
+        self._maps = {}
+        self.refresh()
+
+    def refresh(self):
+        """重新扫描段文件，载入新增的索引记录（适用于写入端仍在运行的情况）"""
+        indexes, segments = [], []
+        for seg_id in list_segments(self.root):
+            bin_path, idx_path = _segment_paths(self.root, seg_id)
+            if not os.path.exists(idx_path):
+                continue
+            records = np.fromfile(idx_path, dtype=INDEX_DTYPE,
+                                  count=os.path.getsize(idx_path) // INDEX_DTYPE.itemsize)
+            # 丢弃数据尚未完整写入的记录
+            records = records[records["offset"] + records["length"] <= os.path.getsize(bin_path)]
+            indexes.append(records)
+            segments.append(np.full(len(records), seg_id, dtype=np.int32))
+
+        if indexes:
+            index = np.concatenate(indexes)
+            segs = np.concatenate(segments)
+            order = np.argsort(index["timestamp"], kind="stable")
+            self.index, self.segments = index[order], segs[order]
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+            self.segments = np.zeros(0, dtype=np.int32)
+        return len(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def cameras(self):
+        return sorted(np.unique(self.index["camera"]).tolist())
+
+    def time_range(self):
+        if not len(self.index):
+            return None
+        return int(self.index["timestamp"][0]), int(self.index["timestamp"][-1])
+
+    def query(self, start_ms=None, end_ms=None, cam_ids=None):
+        """返回时间范围 [start_ms, end_ms) 内、属于 cam_ids 的帧在 self.index 中的下标"""
+        ts = self.index["timestamp"]
+        lo = 0 if start_ms is None else np.searchsorted(ts, start_ms, side="left")
+        hi = len(ts) if end_ms is None else np.searchsorted(ts, end_ms, side="left")
+        rows = np.arange(lo, hi)
+        if cam_ids is not None:
+            rows = rows[np.isin(self.index["camera"][lo:hi], list(cam_ids))]
+        return rows
+
+    def _map(self, seg_id, needed):
+        mm = self._maps.get(seg_id)
+        if mm is None or len(mm) < needed:
+            bin_path, _ = _segment_paths(self.root, seg_id)
+            mm = np.memmap(bin_path, dtype=np.uint8, mode="r")
+            self._maps[seg_id] = mm
+        return mm
+
+    def read(self, row):
+        """读取 self.index[row] 对应的帧；raw 格式返回只读的内存映射视图"""
+        rec = self.index[row]
+        offset, length = int(rec["offset"]), int(rec["length"])
+        buf = self._map(int(self.segments[row]), offset + length)[offset:offset + length]
+        if rec["codec"] == CODEC_RAW:
+            shape = (int(rec["height"]), int(rec["width"]), int(rec["channels"]))
+            return buf.reshape(shape if shape[2] > 1 else shape[:2])
+        return cv2.imdecode(np.asarray(buf), cv2.IMREAD_COLOR)
+
+    def iter_frames(self, start_ms=None, end_ms=None, cam_ids=None):
+        """按时间顺序逐帧产出 (timestamp_ms, cam_id, frame)"""
+        for row in self.query(start_ms, end_ms, cam_ids):
+            rec = self.index[row]
+            yield int(rec["timestamp"]), int(rec["camera"]), self.read(row)
+
+    def close(self):
+        self._maps.clear()
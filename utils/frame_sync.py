@@ -0,0 +1,273 @@
+import argparse
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+
+from utils.data_proc_utils import format_timestamp
+
+# capture_to_cache 写入的文件名：{YYYYMMDD_HHMMSS_mmm}_cam{id}.jpg
+_FRAME_RE = re.compile(r"^(\d{8}_\d{6})_(\d{3})_cam(-?\d+)\.jpg$")
+_CAMERA_DIR_RE = re.compile(r"^camera_(-?\d+)$")
+
+
+class CameraIndex:
+    """
+    单个摄像头目录的时间戳索引：时间戳（毫秒）升序存放在 numpy 数组中，
+    查找最近帧只需一次 searchsorted。refresh() 只解析新增的文件名；
+    多个写盘线程可能乱序落盘，因此最新帧之前 lookback_ms 内迟到的帧同样会被补入。
+    """
+
+    def __init__(self, cam_id, directory, lookback_ms=5000):
+        self.cam_id = cam_id
+        self.directory = directory
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.names = []
+        self.lookback_ms = lookback_ms
+        self._seconds_cache = {}
+        self.refresh()
+
+    def _parse(self, prefix, millis):
+        # 同一秒内的多帧共用一次 strptime
+        base = self._seconds_cache.get(prefix)
+        if base is None:
+            base = int(datetime.strptime(prefix, '%Y%m%d_%H%M%S').timestamp()) * 1000
+            self._seconds_cache[prefix] = base
+        return base + int(millis)
+
+    def refresh(self):
+        """增量扫描目录，返回新增帧数"""
+        # 文件名以定宽时间戳开头，字符串比较即时间比较
+        cutoff, recent = "", set()
+        if self.names:
+            cutoff_ms = int(self.timestamps[-1]) - self.lookback_ms
+            cutoff = format_timestamp(cutoff_ms)
+            recent = set(self.names[np.searchsorted(self.timestamps, cutoff_ms):])
+
+        new = []
+        try:
+            entries = os.scandir(self.directory)
+        except OSError:
+            return 0
+        with entries:
+            for entry in entries:
+                if entry.name < cutoff or entry.name in recent:
+                    continue
+                m = _FRAME_RE.match(entry.name)
+                if m:
+                    new.append((self._parse(m.group(1), m.group(2)), entry.name))
+        if not new:
+            # 已被缓存清理删除的帧仍留在索引中，读取失败时由调用方跳过
+            return 0
+
+        new.sort()
+        late = self.names and new[0][0] < self.timestamps[-1]
+        self.timestamps = np.concatenate([self.timestamps, np.array([t for t, _ in new], dtype=np.int64)])
+        self.names.extend(name for _, name in new)
+        if late:
+            order = np.argsort(self.timestamps, kind="stable")
+            self.timestamps = self.timestamps[order]
+            self.names = [self.names[i] for i in order]
+        return len(new)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def path(self, i):
+        return os.path.join(self.directory, self.names[i])
+
+    def nearest(self, t_ms):
+        """
+        批量查找距离 t_ms 最近的帧
+        :param t_ms: 标量或数组
+        :return: (下标数组, 时间差绝对值数组)，无帧时下标为 -1
+        """
+        t = np.atleast_1d(np.asarray(t_ms, dtype=np.int64))
+        n = len(self.timestamps)
+        if n == 0:
+            return np.full(len(t), -1), np.full(len(t), np.iinfo(np.int64).max)
+        right = np.clip(np.searchsorted(self.timestamps, t), 0, n - 1)
+        left = np.clip(right - 1, 0, n - 1)
+        d_right = np.abs(self.timestamps[right] - t)
+        d_left = np.abs(self.timestamps[left] - t)
+        use_left = d_left <= d_right
+        return np.where(use_left, left, right), np.where(use_left, d_left, d_right)
+
+
+class SyncedFrameSet:
+    """同一时刻的多摄像头帧集合"""
+    __slots__ = ("timestamp", "paths", "timestamps")
+
+    def __init__(self, timestamp, paths, timestamps):
+        self.timestamp = timestamp    # 参考时刻（毫秒）
+        self.paths = paths            # {cam_id: 图像路径}
+        self.timestamps = timestamps  # {cam_id: 实际帧时间戳}
+
+    @property
+    def skew_ms(self):
+        """集合内各帧的最大时间差"""
+        ts = list(self.timestamps.values())
+        return max(ts) - min(ts) if ts else 0
+
+    def __repr__(self):
+        return (f"SyncedFrameSet({format_timestamp(self.timestamp)}, "
+                f"cams={sorted(self.paths)}, skew={self.skew_ms}ms)")
+
+
+class FrameSynchronizer:
+    """
+    多摄像头帧同步：
+    为 Cache/camera_{id}/ 各目录建立时间戳索引，以参考时间轴上的每个时刻
+    在各摄像头中查找 tolerance_ms 以内的最近帧，组成时间一致的多摄像头快照，
+    快照内任意两帧的时间差不超过 tolerance_ms
+    """
+
+    def __init__(self, cache_dir="Cache", cam_ids=None, tolerance_ms=100, min_cameras=None):
+        """
+        :param cam_ids: 参与同步的摄像头，None 时使用目录下所有 camera_{id}
+        :param tolerance_ms: 同一快照内各帧之间（以及各帧与参考时刻）的最大时间差
+        :param min_cameras: 快照至少包含的摄像头数，None 表示要求全部摄像头
+        """
+        self.cache_dir = cache_dir
+        self.tolerance_ms = tolerance_ms
+        self.min_cameras = min_cameras
+        if cam_ids is None:
+            cam_ids = sorted(int(m.group(1)) for m in
+                             (_CAMERA_DIR_RE.match(e.name) for e in os.scandir(cache_dir) if e.is_dir())
+                             if m)
+        self.indexes = {cid: CameraIndex(cid, os.path.join(cache_dir, f"camera_{cid}")) for cid in cam_ids}
+
+    def refresh(self):
+        """重新扫描所有摄像头目录，返回新增帧总数"""
+        return sum(index.refresh() for index in self.indexes.values())
+
+    def _required(self):
+        return len(self.indexes) if self.min_cameras is None else self.min_cameras
+
+    def _reference_times(self, start_ms, end_ms, step_ms):
+        if step_ms:
+            ranges = [(idx.timestamps[0], idx.timestamps[-1]) for idx in self.indexes.values() if len(idx)]
+            if not ranges:
+                return np.zeros(0, dtype=np.int64)
+            lo = max(r[0] for r in ranges) if start_ms is None else start_ms
+            hi = min(r[1] for r in ranges) if end_ms is None else end_ms
+            return np.arange(lo, hi + 1, step_ms, dtype=np.int64)
+        # 默认以帧数最少的摄像头为参考，每个参考帧至多生成一个快照
+        ref = min((idx for idx in self.indexes.values() if len(idx)), key=len, default=None)
+        if ref is None:
+            return np.zeros(0, dtype=np.int64)
+        ts = ref.timestamps
+        lo = 0 if start_ms is None else np.searchsorted(ts, start_ms, side="left")
+        hi = len(ts) if end_ms is None else np.searchsorted(ts, end_ms, side="left")
+        return ts[lo:hi]
+
+    def _match(self, times):
+        """
+        对一组参考时刻批量匹配所有摄像头，返回 {cam_id: (下标, 是否入选)}
+        先取各摄像头距参考时刻 tolerance_ms 以内的最近帧，这些帧两两之间最多相差 2 * tolerance_ms，
+        再从中选出宽度为 tolerance_ms、包含帧数最多的时间窗（并列时取中心离参考时刻最近的），
+        只保留窗内的帧
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=np.int64))
+        tol = self.tolerance_ms
+        cids = list(self.indexes)
+        indices, stamps = [], np.full((len(times), len(cids)), np.nan)
+        for k, cid in enumerate(cids):
+            index = self.indexes[cid]
+            idx, dt = index.nearest(times)
+            ok = (idx >= 0) & (dt <= tol)
+            if ok.any():
+                stamps[ok, k] = index.timestamps[idx[ok]]
+            indices.append(idx)
+
+        # in_window[b, j, k]：第 k 个摄像头的帧落在以第 j 个摄像头的帧为起点的时间窗内（NaN 比较均为 False）
+        start = stamps[:, :, None]
+        in_window = (stamps[:, None, :] >= start) & (stamps[:, None, :] <= start + tol)
+        count = in_window.sum(axis=2)
+        offset = np.abs(np.nan_to_num(stamps + tol / 2.0, nan=0.0) - times[:, None])
+        best = np.argmax(count * (2 * tol + 1) - np.minimum(offset, 2 * tol), axis=1)
+        chosen = in_window[np.arange(len(times)), best]
+        return {cid: (indices[k], chosen[:, k]) for k, cid in enumerate(cids)}
+
+    def _build(self, t, i, matched):
+        paths, stamps = {}, {}
+        for cid, (idx, ok) in matched.items():
+            if ok[i]:
+                index = self.indexes[cid]
+                paths[cid] = index.path(idx[i])
+                stamps[cid] = int(index.timestamps[idx[i]])
+        return SyncedFrameSet(int(t), paths, stamps)
+
+    def snapshot_at(self, t_ms):
+        """返回 t_ms 时刻的多摄像头快照，摄像头数不足时返回 None"""
+        matched = self._match([t_ms])
+        if sum(int(ok[0]) for _, ok in matched.values()) < self._required():
+            return None
+        return self._build(t_ms, 0, matched)
+
+    def latest(self, chunk=256):
+        """
+        最近一个满足要求的快照：从至少 min_cameras 个摄像头都已有帧的最晚时刻（加上容差）起，
+        沿参考时间轴（与 iter_snapshots 相同）向前查找，返回第一个摄像头数足够的快照，没有时返回 None
+        """
+        required = self._required()
+        lasts = sorted((int(idx.timestamps[-1]) for idx in self.indexes.values() if len(idx)), reverse=True)
+        if not lasts or len(lasts) < required:
+            return None
+        # 参考时刻最多晚于该时刻 tolerance_ms 仍可能匹配到这些摄像头的最新帧
+        times = self._reference_times(None, lasts[max(required, 1) - 1] + self.tolerance_ms + 1, None)
+        for stop in range(len(times), 0, -chunk):
+            block = times[max(stop - chunk, 0):stop]
+            matched = self._match(block)
+            count = sum(ok.astype(np.int64) for _, ok in matched.values())
+            hits = np.nonzero(count >= required)[0]
+            if len(hits):
+                return self._build(block[hits[-1]], hits[-1], matched)
+        return None
+
+    def iter_snapshots(self, start_ms=None, end_ms=None, step_ms=None, chunk=4096):
+        """
+        按时间顺序产出快照
+        :param step_ms: 参考时间轴的步长，None 时以帧数最少的摄像头的帧时间为参考
+        :param chunk: 每批向量化匹配的参考时刻数
+        """
+        times = self._reference_times(start_ms, end_ms, step_ms)
+        required = self._required()
+        for s in range(0, len(times), chunk):
+            block = times[s:s + chunk]
+            matched = self._match(block)
+            count = sum(ok.astype(np.int64) for _, ok in matched.values())
+            for i in np.nonzero(count >= required)[0]:
+                yield self._build(block[i], i, matched)
+
+
+def stream_world_points(synchronizer, projector, merger=None, conf_thresh=0.4,
+                        start_ms=None, end_ms=None, step_ms=None):
+    """
+    按时间顺序把同步快照送入投影器（及合并器）
+    :param projector: HomographyProjector
+    :param merger: PointMerger / IncrementalPointMerger，None 时只投影
+    :return: 生成器，产出 (快照, 投影结果, 合并结果或 None)
+    """
+    for frame_set in synchronizer.iter_snapshots(start_ms, end_ms, step_ms):
+        points = projector.run(conf_thresh=conf_thresh, image_paths=frame_set.paths)
+        merged = merger.merge(points) if merger is not None else None
+        yield frame_set, points, merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多摄像头帧时间同步统计")
+    parser.add_argument('--cache_dir', type=str, default='Cache')
+    parser.add_argument('--tolerance', type=int, default=100, help='同步容差（毫秒）')
+    parser.add_argument('--min_cameras', type=int, default=None)
+    args = parser.parse_args()
+
+    sync = FrameSynchronizer(args.cache_dir, tolerance_ms=args.tolerance, min_cameras=args.min_cameras)
+    for cid, index in sync.indexes.items():
+        print(f"摄像头 {cid}: {len(index)} 帧")
+    skews = [s.skew_ms for s in sync.iter_snapshots()]
+    if skews:
+        print(f"同步快照 {len(skews)} 组，平均时间差 {np.mean(skews):.1f}ms，最大 {max(skews)}ms")
+    else:
+        print("没有满足容差的同步快照")
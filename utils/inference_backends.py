@@ -0,0 +1,296 @@
+import ast
+import glob
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+from utils.inference_cache import Detections
+from utils.roi import letterbox
+
+BACKENDS = ("auto", "pytorch", "onnx", "openvino")
+
+
+# ---------------- 前后处理 ----------------
+def preprocess(frames, imgsz):
+    """
+    letterbox 到 imgsz x imgsz，BGR -> RGB，归一化为 NCHW float32
+    :return: (输入张量, [(缩放比例, (左侧填充, 上方填充)), ...])
+    """
+    batch = np.empty((len(frames), 3, imgsz, imgsz), dtype=np.float32)
+    transforms = []
+    for i, frame in enumerate(frames):
+        img, scale, pad = letterbox(frame, imgsz)
+        batch[i] = img[:, :, ::-1].transpose(2, 0, 1)
+        transforms.append((scale, pad))
+    batch *= 1.0 / 255.0
+    return batch, transforms
+
+
+def postprocess(output, transform, frame_shape, conf=0.25, iou=0.7, max_det=300):
+    """
+    解析单张图像的原始输出并映射回原图坐标
+    :param output: YOLOv8/11 格式 (4 + nc, N)，或端到端导出（YOLOv10）的 (N, 6) [x1, y1, x2, y2, score, cls]
+    :return: cls (M,), conf (M,), xyxy (M, 4)
+    """
+    output = np.asarray(output, dtype=np.float32)
+    if output.ndim == 2 and output.shape[1] == 6 and output.shape[0] != 6:
+        keep = output[:, 4] >= conf
+        xyxy, scores, cls = output[keep, :4], output[keep, 4], output[keep, 5]
+    else:
+        pred = output.T                               # (N, 4 + nc)
+        class_scores = pred[:, 4:]
+        cls = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(pred)), cls]
+        keep = scores >= conf
+        boxes, scores, cls = pred[keep, :4], scores[keep], cls[keep]
+        xyxy = np.concatenate([boxes[:, :2] - boxes[:, 2:] / 2, boxes[:, :2] + boxes[:, 2:] / 2], axis=1)
+        if len(xyxy):
+            # 按类别分别做 NMS
+            xywh = np.concatenate([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+            idx = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), cls.tolist(), conf, iou)
+            idx = np.asarray(idx, dtype=np.int64).reshape(-1)[:max_det]
+            xyxy, scores, cls = xyxy[idx], scores[idx], cls[idx]
+
+    scale, (px, py) = transform
+    xyxy = xyxy.astype(np.float64)
+    xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - px) / scale).clip(0, frame_shape[1])
+    xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - py) / scale).clip(0, frame_shape[0])
+    return cls.astype(np.float64), scores.astype(np.float64), xyxy
+
+
+def _parse_names(names):
+    """ultralytics 导出时把类别名写为字典的字符串形式"""
+    if isinstance(names, str):
+        names = ast.literal_eval(names)
+    return {int(k): v for k, v in (names or {}).items()}
+
+
+class _ExportedBackend:
+    """导出模型后端的公共部分：批量前处理 -> 推理 -> 逐帧后处理"""
+
+    def __init__(self, path, imgsz=None, names=None, metadata=None):
+        metadata = metadata or {}
+        self.path = path
+        self.imgsz = int(imgsz or ast.literal_eval(str(metadata.get("imgsz", "[640]")))[0])
+        self.names = _parse_names(names or metadata.get("names"))
+        self.batch = int(metadata.get("batch", 1))
+        self.ckpt_path = path
+
+    def _infer(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, source, conf=0.25, iou=0.7, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        outputs = []
+        # 静态形状导出的模型只能按导出时的 batch 推理
+        step = self.batch if self.batch > 0 else len(frames)
+        for start in range(0, len(frames), step):
+            chunk = frames[start:start + step]
+            batch, transforms = preprocess(chunk, self.imgsz)
+            if len(chunk) < step:
+                batch = np.concatenate([batch, np.zeros((step - len(chunk),) + batch.shape[1:], batch.dtype)])
+            raw = self._infer(batch)
+            for frame, out, tr in zip(chunk, raw, transforms):
+                cls, scores, xyxy = postprocess(out, tr, frame.shape, conf, iou)
+                outputs.append(Detections(cls, scores, xyxy, frame.shape[:2], self.names, frame))
+        return outputs
+
+    def predict(self, frame, conf=0.25, **kwargs):
+        return self(frame, conf, **kwargs)[0]
+
+
+class OnnxBackend(_ExportedBackend):
+    """ONNX Runtime CPU 推理"""
+
+    def __init__(self, path, imgsz=None, names=None, threads=None, providers=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        self.session = ort.InferenceSession(path, options, providers=providers or ["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        shape = self.session.get_inputs()[0].shape
+        if isinstance(shape[0], int):
+            metadata = {**metadata, "batch": shape[0]}
+        else:
+            metadata = {**metadata, "batch": 0}  # 动态 batch
+        super().__init__(path, imgsz, names, metadata)
+
+    def _infer(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVINOBackend(_ExportedBackend):
+    """OpenVINO CPU 推理，path 为 ultralytics 导出的 *_openvino_model 目录或其中的 .xml"""
+
+    def __init__(self, path, imgsz=None, names=None, threads=None, hint="LATENCY"):
+        import openvino as ov
+
+        xml = path
+        if os.path.isdir(path):
+            xml = glob.glob(os.path.join(path, "*.xml"))[0]
+        metadata = {}
+        meta_path = os.path.join(os.path.dirname(xml), "metadata.yaml")
+        if os.path.exists(meta_path):
+            import yaml
+            with open(meta_path, "r", encoding="utf-8") as f:
+                metadata = yaml.safe_load(f) or {}
+        core = ov.Core()
+        config = {"PERFORMANCE_HINT": hint}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = int(threads)
+        model = core.read_model(xml)
+        shape = model.inputs[0].get_partial_shape()
+        metadata["batch"] = shape[0].get_length() if shape[0].is_static else 0
+        self.compiled = core.compile_model(model, "CPU", config)
+        self.request = self.compiled.create_infer_request()
+        super().__init__(path, imgsz, names, metadata)
+
+    def _infer(self, batch):
+        return self.request.infer({0: batch})[self.compiled.output(0)]
+
+
+class UltralyticsBackend:
+    """PyTorch 基线：ultralytics YOLO，结果统一转换为 Detections"""
+
+    def __init__(self, path, imgsz=None, **kwargs):
+        from ultralytics import YOLO
+
+        self.model = YOLO(path)
+        self.path = self.ckpt_path = path
+        self.imgsz = imgsz
+        self.names = getattr(self.model, "names", {})
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        kwargs.pop("verbose", None)
+        if self.imgsz:
+            kwargs.setdefault("imgsz", self.imgsz)
+        results = self.model(source, conf=conf, verbose=False, **kwargs)
+        return [Detections.from_result(r) for r in results]
+
+    def predict(self, frame, conf=0.25, **kwargs):
+        return self(frame, conf, **kwargs)[0]
+
+
+def detect_backend(path):
+    """按文件扩展名判断后端"""
+    p = path.rstrip("/\\")
+    if p.endswith(".onnx"):
+        return "onnx"
+    if p.endswith(".xml") or p.endswith("_openvino_model"):
+        return "openvino"
+    return "pytorch"
+
+
+def load_backend(path, backend="auto", imgsz=None, **kwargs):
+    """
+    加载推理后端，返回值的调用方式与 YOLO 模型一致：backend(frames, conf=0.25) -> [Detections]；
+    ONNX Runtime 与 OpenVINO 后端只依赖各自的运行时与 OpenCV，不需要安装 PyTorch
+    :param path: .pt 权重、.onnx 文件或 OpenVINO 导出目录
+    :param backend: auto 时按 path 判断
+    :param imgsz: 输入尺寸，导出模型默认读取导出时写入的元数据
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的推理后端: {backend}，可选 {list(BACKENDS)}")
+    if backend == "auto":
+        backend = detect_backend(path)
+    if backend == "onnx":
+        return OnnxBackend(path, imgsz, **kwargs)
+    if backend == "openvino":
+        return OpenVINOBackend(path, imgsz, **kwargs)
+    return UltralyticsBackend(path, imgsz)
+
+
+# ---------------- 导出与量化 ----------------
+def dataset_yaml(dataset_root, names, path=None):
+    """
+    为本地数据集目录生成 ultralytics 数据配置（configs/data.yaml 中的 path 为绝对路径，换机器后不可用）
+    :return: yaml 文件路径
+    """
+    import yaml
+
+    path = path or os.path.join(tempfile.mkdtemp(prefix="smsp_data_"), "data.yaml")
+    config = {"path": os.path.abspath(dataset_root), "train": "images/train", "val": "images/val",
+              "test": "images/test", "nc": len(names), "names": list(names)}
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return path
+
+
+def list_images(image_dir, limit=None):
+    paths = sorted(p for p in glob.glob(os.path.join(image_dir, "*"))
+                   if p.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+    return paths[:limit] if limit else paths
+
+
+class _CalibrationReader:
+    """onnxruntime 静态量化的校准数据读取器"""
+
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.image_paths:
+            img = cv2.imread(path)
+            if img is not None:
+                return {self.input_name: preprocess([img], self.imgsz)[0]}
+        return None
+
+
+def quantize_onnx_int8(onnx_path, calib_dir, imgsz=640, num_images=100, output=None):
+    """
+    用校准图像对 ONNX 模型做静态 INT8 量化（QDQ 格式，按通道量化权重）
+    :param calib_dir: 校准图像目录，如 datasets/cmp_dataset/images/train
+    :return: 量化后的模型路径
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output = output or onnx_path.replace(".onnx", "_int8.onnx")
+    prepared = onnx_path.replace(".onnx", "_prep.onnx")
+    quant_pre_process(onnx_path, prepared)
+    input_name = ort.InferenceSession(prepared, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    reader = _CalibrationReader(input_name, list_images(calib_dir, num_images), imgsz)
+    quantize_static(prepared, output, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                    calibrate_method=CalibrationMethod.MinMax)
+    os.remove(prepared)
+    # 量化会丢失 ultralytics 写入的元数据（类别名、输入尺寸），从原模型拷回
+    import onnx
+
+    src, dst = onnx.load(onnx_path, load_external_data=False), onnx.load(output)
+    dst.metadata_props.extend(src.metadata_props)
+    onnx.save(dst, output)
+    return output
+
+
+def export_model(weights, fmt="onnx", imgsz=640, int8=False, dataset_root=None, names=None,
+                 num_calib=100):
+    """
+    导出 .pt 权重为 ONNX / OpenVINO 模型
+    :param int8: ONNX 使用 onnxruntime 静态量化，OpenVINO 使用 ultralytics 内置的 NNCF 量化，
+                 两者都以 dataset_root 下的训练集图像作为校准数据
+    :return: 导出模型路径
+    """
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    if fmt == "onnx":
+        path = model.export(format="onnx", imgsz=imgsz, simplify=True, dynamic=False)
+        if int8:
+            path = quantize_onnx_int8(path, os.path.join(dataset_root, "images", "train"), imgsz, num_calib)
+        return path
+    if fmt == "openvino":
+        kwargs = {}
+        if int8:
+            kwargs = {"int8": True, "data": dataset_yaml(dataset_root, names or list(model.names.values()))}
+        return model.export(format="openvino", imgsz=imgsz, **kwargs)
+    raise ValueError(f"不支持的导出格式: {fmt}")
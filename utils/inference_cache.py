@@ -0,0 +1,275 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from utils import metrics
+from utils.projector import boxes_to_arrays
+from utils.renderer import CLASS_COLORS
+
+
+class Detections:
+    """
+    与推理后端无关的单帧检测结果：cls (N,)、conf (N,)、xyxy (N, 4) 均为 numpy 数组。
+    同时提供 boxes 属性与 plot()，可替代 ultralytics Results 传给 boxes_to_arrays、predict_single_frame 等函数。
+    """
+
+    def __init__(self, cls, conf, xyxy, orig_shape=None, names=None, orig_img=None):
+        self.cls = np.asarray(cls, dtype=np.float32).reshape(-1)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        self.orig_shape = tuple(orig_shape) if orig_shape is not None else None
+        self.names = names or {}
+        self.orig_img = orig_img
+
+    @classmethod
+    def from_result(cls, result):
+        """由 ultralytics Results 转换"""
+        c, conf, xyxy = boxes_to_arrays(result.boxes)
+        return cls(c, conf, xyxy, getattr(result, "orig_shape", None),
+                   getattr(result, "names", None), getattr(result, "orig_img", None))
+
+    @property
+    def boxes(self):
+        return self
+
+    def __len__(self):
+        return len(self.cls)
+
+    def plot(self, line_width=2):
+        """在 orig_img 的拷贝上绘制检测框与类别、置信度"""
+        canvas = self.orig_img.copy()
+        for c, conf, (x1, y1, x2, y2) in zip(self.cls.astype(int), self.conf, self.xyxy.astype(int)):
+            color = CLASS_COLORS[c % len(CLASS_COLORS)]
+            cv2.rectangle(canvas, (x1, y1), (x2, y2), color, line_width)
+            label = f"{self.names.get(c, c)} {conf:.2f}"
+            cv2.putText(canvas, label, (x1, max(y1 - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        return canvas
+
+
+# ---------------- 缓存键 ----------------
+_weights_lock = threading.Lock()
+_weights_fingerprints = {}
+
+
+def weights_fingerprint(path):
+    """
+    模型权重文件内容的哈希，按 (路径, 大小, 修改时间) 记忆，同一文件只读一次；
+    path 为目录（如 OpenVINO 导出目录）时依次哈希目录下的所有文件
+    """
+    files = [path]
+    if os.path.isdir(path):
+        files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if os.path.isfile(os.path.join(path, name)))
+    stat_key = tuple((os.path.abspath(p), os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in files)
+    with _weights_lock:
+        digest = _weights_fingerprints.get(stat_key)
+    if digest is None:
+        h = hashlib.blake2b(digest_size=16)
+        for p in files:
+            with open(p, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        digest = h.hexdigest()
+        with _weights_lock:
+            _weights_fingerprints[stat_key] = digest
+    return digest
+
+
+def frame_key(frame, model_id, params):
+    """
+    单帧推理结果的缓存键：图像像素、尺寸与类型 + 模型标识 + 推理参数
+    :param params: 影响推理结果的参数字典，如 {"conf": 0.25, "imgsz": 640}
+    """
+    frame = np.ascontiguousarray(frame)
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{frame.shape}|{frame.dtype}|{model_id}|".encode())
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(memoryview(frame).cast("B"))
+    return h.hexdigest()
+
+
+# ---------------- 缓存 ----------------
+class InferenceCache:
+    """
+    两级检测结果缓存：
+    内存中保留最近 memory_items 个结果（LRU），磁盘上每个结果一个 .npz，
+    总大小超过 max_bytes 时按最近访问时间淘汰最旧的文件。
+    """
+
+    def __init__(self, cache_dir=".inference_cache", max_bytes=512 * 1024 ** 2, memory_items=256):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._disk_bytes = sum(size for _, _, size in self._scan())
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".npz")
+
+    def _scan(self):
+        """返回磁盘上所有缓存文件 [(最近访问时间, 路径, 字节数)]"""
+        files = []
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir():
+                continue
+            for entry in os.scandir(sub.path):
+                if entry.name.endswith(".npz"):
+                    st = entry.stat()
+                    files.append((st.st_mtime, entry.path, st.st_size))
+        return files
+
+    def _remember(self, key, det):
+        with self._lock:
+            self._memory[key] = det
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        """命中时返回 Detections（不含 orig_img），否则返回 None"""
+        with self._lock:
+            det = self._memory.get(key)
+            if det is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+        if det is not None:
+            metrics.inc("inference_cache_hits", tier="memory")
+            return det
+
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                names = json.loads(str(data["names"]))
+                det = Detections(data["cls"], data["conf"], data["xyxy"], data["orig_shape"],
+                                 {int(k): v for k, v in names.items()})
+            os.utime(path)  # 以修改时间记录最近访问，用于 LRU 淘汰
+        except (OSError, KeyError, ValueError):
+            with self._lock:
+                self.misses += 1
+            metrics.inc("inference_cache_misses")
+            return None
+        with self._lock:
+            self.hits_disk += 1
+        metrics.inc("inference_cache_hits", tier="disk")
+        self._remember(key, det)
+        return det
+
+    def put(self, key, det):
+        self._remember(key, Detections(det.cls, det.conf, det.xyxy, det.orig_shape, det.names))
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, cls=det.cls, conf=det.conf, xyxy=det.xyxy,
+                     orig_shape=np.asarray(det.orig_shape or (0, 0)),
+                     names=json.dumps({str(k): v for k, v in det.names.items()}, ensure_ascii=False))
+        size = os.path.getsize(tmp)
+        os.replace(tmp, path)
+        with self._lock:
+            self._disk_bytes += size
+            over = self._disk_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def evict(self, target_ratio=0.9):
+        """淘汰最久未访问的文件，直到总大小不超过 max_bytes * target_ratio，返回淘汰文件数"""
+        files = sorted(self._scan())
+        total = sum(size for _, _, size in files)
+        removed = 0
+        for _, path, size in files:
+            if total <= self.max_bytes * target_ratio:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        with self._lock:
+            self._disk_bytes = total
+        return removed
+
+    def stats(self):
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hit_ratio": (self.hits_memory + self.hits_disk) / lookups if lookups else 0.0,
+            "disk_bytes": self._disk_bytes,
+        }
+
+
+class CachedModel:
+    """
+    带结果缓存的模型包装：接口与 YOLO 模型一致（model(frames, conf=...) -> [Detections]），
+    未命中的帧合成一批送入模型，命中的帧不再推理。
+    """
+
+    def __init__(self, model, cache, weights=None, model_id=None, **params):
+        """
+        :param model: YOLO 模型、推理后端、ModelServer 或模型路径（路径在首次未命中时才经
+                      utils.inference_backends.load_backend 加载，全部命中时不加载模型）
+        :param cache: InferenceCache 或缓存目录
+        :param weights: 权重文件路径，用于计算模型标识；默认取 model.ckpt_path
+        :param model_id: 直接指定模型标识（无权重文件的模型，如桩检测器）
+        :param params: 每次推理固定传给模型的参数，如 imgsz，同时计入缓存键
+        """
+        if isinstance(model, str):
+            weights = weights or model
+        self._model = model
+        self.cache = cache if isinstance(cache, InferenceCache) else InferenceCache(cache)
+        if model_id is None:
+            weights = weights or getattr(model, "ckpt_path", None)
+            if not weights:
+                raise ValueError("无法确定模型权重文件，请指定 weights 或 model_id")
+            model_id = weights_fingerprint(weights)
+        self.model_id = model_id
+        self.params = params
+
+    @property
+    def model(self):
+        if isinstance(self._model, str):
+            from utils.inference_backends import load_backend
+            self._model = load_backend(self._model)
+        return self._model
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        kwargs.pop("verbose", None)
+        params = {**self.params, **kwargs, "conf": conf}
+        keys = [frame_key(frame, self.model_id, params) for frame in frames]
+
+        outputs = [None] * len(frames)
+        missing = []
+        for i, key in enumerate(keys):
+            det = self.cache.get(key)
+            if det is None:
+                missing.append(i)
+            else:
+                outputs[i] = Detections(det.cls, det.conf, det.xyxy, det.orig_shape, det.names, frames[i])
+
+        if missing:
+            results = self.model([frames[i] for i in missing], conf=conf, verbose=False,
+                                 **self.params, **kwargs)
+            for i, result in zip(missing, results):
+                det = Detections.from_result(result)
+                det.orig_img = frames[i]
+                if det.orig_shape is None:
+                    det.orig_shape = frames[i].shape[:2]
+                self.cache.put(keys[i], det)
+                outputs[i] = det
+        return outputs
+
+    def predict(self, frame, conf=0.25, **kwargs):
+        return self(frame, conf, **kwargs)[0]
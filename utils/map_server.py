@@ -0,0 +1,499 @@
+import argparse
+import asyncio
+import base64
+import csv
+import hashlib
+import json
+import os
+import struct
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from utils import metrics
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+WS_MAX_PAYLOAD = 1 << 20
+
+_STATUS_TEXT = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed"}
+
+
+def _json_default(obj):
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def _dumps(obj):
+    """紧凑 JSON（无缩进、无多余空格），返回 UTF-8 字节"""
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_json_default).encode("utf-8")
+
+
+def parse_classes(values):
+    """解析查询参数中的类别过滤：?cls=1&cls=2 或 ?cls=1,2，返回排好序的元组，未指定时返回 None"""
+    if not values:
+        return None
+    classes = {int(c) for v in values for c in v.split(",") if c.strip()}
+    return tuple(sorted(classes)) or None
+
+
+# -------------------------------
+# 地图视图
+# -------------------------------
+class MapView:
+    """
+    某一版本地图的只读视图，版本不变时内容不变，
+    各接口的序列化结果在首次请求时生成并缓存，之后直接返回同一份字节串
+    """
+
+    def __init__(self, version, timestamp, points, ids=None, route=(), stats=None, epoch=""):
+        """
+        :param points: (N, 4) [cls, x, y, confidence]，cls 为 -1 的点（路径起终点）只出现在路径中
+        :param ids: 每个点的稳定编号（跨版本不变），默认取行号
+        :param route: 路径经过的点的行号顺序
+        :param epoch: 服务实例标识，计入 ETag，避免服务重启后版本号重复导致客户端误用旧缓存
+        """
+        self.version = version
+        self.timestamp = timestamp
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 4)
+        self.ids = (np.arange(len(self.points)) if ids is None
+                    else np.asarray(ids, dtype=np.int64).reshape(-1))
+        self.route = [int(i) for i in route]
+        self.route_ids = [int(self.ids[i]) for i in self.route]
+        self.stats = stats or {}
+        self.epoch = epoch
+        self._encoded = {}
+        self._index = {}
+
+    def etag(self, name):
+        return f'"{self.epoch}-{self.version}-{name}"'
+
+    def _rows(self, indices):
+        return [{"id": int(self.ids[i]), "class": int(self.points[i, 0]),
+                 "x": round(float(self.points[i, 1]), 3), "y": round(float(self.points[i, 2]), 3),
+                 "confidence": round(float(self.points[i, 3]), 4)} for i in indices]
+
+    def _select(self, classes=None):
+        cls = self.points[:, 0].astype(int)
+        mask = cls >= 0
+        if classes is not None:
+            mask &= np.isin(cls, classes)
+        return np.nonzero(mask)[0]
+
+    def encoded(self, name, build):
+        """返回 (ETag, 字节串)，同一视图同一名称只序列化一次"""
+        item = self._encoded.get(name)
+        if item is None:
+            item = self._encoded[name] = (self.etag(name), _dumps(build()))
+        return item
+
+    def map_body(self, classes=None):
+        name = "map" if classes is None else "map-" + "_".join(str(c) for c in classes)
+        return self.encoded(name, lambda: {"version": self.version, "timestamp": self.timestamp,
+                                           "classes": classes, "points": self._rows(self._select(classes))})
+
+    def route_body(self):
+        return self.encoded("route", lambda: {"version": self.version, "timestamp": self.timestamp,
+                                              "length": self.stats.get("length"), "ids": self.route_ids,
+                                              "points": self._rows(self.route)})
+
+    def status_body(self):
+        return self.encoded("status", lambda: {"version": self.version, "timestamp": self.timestamp,
+                                               "num_points": int(len(self._select())), "stats": self.stats})
+
+    def version_body(self):
+        return self.encoded("version", lambda: {"version": self.version, "timestamp": self.timestamp})
+
+    def snapshot_message(self, classes=None):
+        """WebSocket 连接建立时发送的完整状态"""
+        name = "ws-snapshot" if classes is None else "ws-snapshot-" + "_".join(str(c) for c in classes)
+        return self.encoded(name, lambda: {"type": "snapshot", "version": self.version,
+                                           "timestamp": self.timestamp, "classes": classes,
+                                           "points": self._rows(self._select(classes)),
+                                           "route": self.route_ids})[1]
+
+    def index(self, classes=None):
+        """{id: (cls, x, y, confidence)}，用于计算两个版本之间的差异"""
+        index = self._index.get(classes)
+        if index is None:
+            index = self._index[classes] = {int(self.ids[i]): tuple(np.round(self.points[i], 3))
+                                            for i in self._select(classes)}
+        return index
+
+
+def map_diff(old, new, classes=None):
+    """
+    两个版本之间的差异：新增点、删除点的编号、位置/类别/置信度变化的点，
+    路径顺序变化时附带新的路径（点编号列表）
+    """
+    old_index, new_index = old.index(classes), new.index(classes)
+    added, changed = [], []
+    for i in new._select(classes):
+        pid = int(new.ids[i])
+        before = old_index.get(pid)
+        if before is None:
+            added.append(i)
+        elif before != new_index[pid]:
+            changed.append(i)
+    message = {"type": "diff", "base": old.version, "version": new.version, "timestamp": new.timestamp,
+               "added": new._rows(added), "removed": sorted(set(old_index) - set(new_index)),
+               "changed": new._rows(changed)}
+    if old.route_ids != new.route_ids:
+        message["route"] = new.route_ids
+    return message
+
+
+# -------------------------------
+# 数据来源
+# -------------------------------
+class FileMapSource:
+    """
+    以文件为数据来源：patrol.py 输出的路径文件（index,cls,x,y,confidence）
+    或 patrol_daemon 的快照目录（final_path.txt + status.json），文件变化时版本加一。
+    与 PatrolState 提供相同的属性和 wait_update()，可直接交给 MapServer。
+    """
+
+    def __init__(self, path, poll=1.0):
+        if os.path.isdir(path):
+            self.path_file = os.path.join(path, "final_path.txt")
+            self.status_file = os.path.join(path, "status.json")
+        else:
+            self.path_file = path
+            self.status_file = None
+        self.poll = poll
+        self.version = 0
+        self.timestamp = None
+        self.route_points = np.empty((0, 4))
+        self.point_ids = np.empty(0, dtype=np.int64)
+        self.route = []
+        self.stats = {}
+        self._stamp = None
+        self._checked = 0.0
+
+    def _file_stamp(self):
+        stamp = []
+        for path in (self.path_file, self.status_file):
+            try:
+                st = os.stat(path) if path else None
+            except OSError:
+                st = None
+            stamp.append((st.st_mtime_ns, st.st_size) if st else None)
+        return tuple(stamp)
+
+    def _load(self):
+        ids, points, route, positions = [], [], [], {}
+        with open(self.path_file, encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                pid = int(row["index"])
+                if pid not in positions:
+                    positions[pid] = len(points)
+                    ids.append(pid)
+                    points.append([float(row["cls"]), float(row["x"]), float(row["y"]), float(row["confidence"])])
+                route.append(positions[pid])
+        stats = {}
+        if self.status_file and os.path.exists(self.status_file):
+            with open(self.status_file, encoding="utf-8") as f:
+                stats = json.load(f)
+        return np.array(points).reshape(-1, 4), np.array(ids, dtype=np.int64), route, stats
+
+    def refresh(self, force=False):
+        """距上次检查超过 poll 秒（或 force）时检查文件，内容有变化则重新读取，返回是否更新"""
+        now = time.monotonic()
+        if not force and now - self._checked < self.poll:
+            return False
+        self._checked = now
+        stamp = self._file_stamp()
+        if stamp == self._stamp or stamp[0] is None:
+            return False
+        try:
+            points, ids, route, stats = self._load()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"读取 {self.path_file} 失败：{e}")
+            return False
+        self._stamp = stamp
+        self.route_points, self.point_ids, self.route, self.stats = points, ids, route, stats
+        self.timestamp = stats.get("timestamp", time.time())
+        self.version += 1
+        return True
+
+    async def wait_update(self, after_version, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self.refresh(force=True)
+            if self.version > after_version:
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.sleep(self.poll if remaining is None else min(self.poll, remaining))
+
+
+# -------------------------------
+# HTTP / WebSocket 服务
+# -------------------------------
+def _ws_frame(opcode, payload=b""):
+    """服务端发出的 WebSocket 帧（不加掩码）"""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+async def _ws_read_frame(reader):
+    """读取一个客户端帧，返回 (opcode, payload)"""
+    b0, b1 = await reader.readexactly(2)
+    n = b1 & 0x7F
+    if n == 126:
+        n, = struct.unpack("!H", await reader.readexactly(2))
+    elif n == 127:
+        n, = struct.unpack("!Q", await reader.readexactly(8))
+    if n > WS_MAX_PAYLOAD:
+        raise ValueError("WebSocket 帧过大")
+    mask = await reader.readexactly(4) if b1 & 0x80 else None
+    payload = await reader.readexactly(n)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return b0 & 0x0F, payload
+
+
+class MapServer:
+    """
+    本地地图查询服务，数据来自内存中的 PatrolState（或 FileMapSource）：
+        GET /version           当前版本号，适合高频轮询
+        GET /map[?cls=1,2]     合并后的地图（可按类别过滤）
+        GET /route             当前路径（按巡检顺序的点）
+        GET /status            最近一次规划的统计信息
+        GET /ws[?cls=1,2]      WebSocket：连接后先推送完整状态，之后每次地图更新推送差异
+    每个版本的各种视图只序列化一次；响应带 ETag，客户端携带 If-None-Match 且地图未变化时返回 304，
+    附加 ?wait=秒 时先等待地图更新（长轮询），超时仍未变化再返回 304。
+    """
+
+    def __init__(self, source, host="127.0.0.1", port=8765, ping_interval=20.0, max_wait=60.0):
+        """
+        :param source: 提供 version / timestamp / route_points / route / stats（可选 point_ids）
+                       属性与 wait_update(after_version, timeout) 协程的对象，如 PatrolState
+        :param ping_interval: WebSocket 空闲时发送 ping 的间隔（秒）
+        :param max_wait: 长轮询的最长等待时间（秒）
+        """
+        self.source = source
+        self.host = host
+        self.port = port
+        self.ping_interval = ping_interval
+        self.max_wait = max_wait
+        self.epoch = format(int(time.time() * 1000) & 0xFFFFFFFF, "x")
+        self._view = None
+        self._diffs = OrderedDict()
+        self._server = None
+        self._clients = set()
+
+    # ---------------- 视图 ----------------
+    def view(self):
+        """当前版本的视图，来源版本变化时重新生成"""
+        refresh = getattr(self.source, "refresh", None)
+        if refresh is not None:
+            refresh()
+        source = self.source
+        if self._view is None or self._view.version != source.version:
+            self._view = MapView(source.version, source.timestamp, source.route_points,
+                                 getattr(source, "point_ids", None), source.route, source.stats, self.epoch)
+        return self._view
+
+    def diff_message(self, old, new, classes=None):
+        """两个版本之间的差异消息（字节串），同一对版本只计算一次，供所有 WebSocket 客户端共用"""
+        key = (old.version, new.version, classes)
+        message = self._diffs.get(key)
+        if message is None:
+            message = self._diffs[key] = _dumps(map_diff(old, new, classes))
+            while len(self._diffs) > 64:
+                self._diffs.popitem(last=False)
+        return message
+
+    # ---------------- HTTP ----------------
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, version = line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return method, target, version, headers
+
+    async def _respond(self, writer, status, body=b"", etag=None, keep_alive=True, head=False):
+        lines = [f"HTTP/1.1 {status} {_STATUS_TEXT.get(status, '')}",
+                 "Content-Type: application/json; charset=utf-8",
+                 f"Content-Length: {len(body) if status != 304 else 0}",
+                 "Cache-Control: no-cache",
+                 "Access-Control-Allow-Origin: *",
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if etag:
+            lines.append(f"ETag: {etag}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        if status != 304 and not head:
+            writer.write(body)
+        await writer.drain()
+
+    @staticmethod
+    def _not_modified(etag, headers):
+        tags = [t.strip() for t in headers.get("if-none-match", "").split(",")]
+        return etag in tags or "*" in tags
+
+    async def _handle_get(self, path, query, headers):
+        """返回 (状态码, 字节串, ETag)"""
+        builders = {
+            "/version": lambda v: v.version_body(),
+            "/map": lambda v: v.map_body(parse_classes(query.get("cls"))),
+            "/route": lambda v: v.route_body(),
+            "/status": lambda v: v.status_body(),
+        }
+        build = builders.get(path.rstrip("/") or "/version")
+        if build is None:
+            return 404, _dumps({"error": f"未知路径 {path}"}), None
+        view = self.view()
+        etag, body = build(view)
+        if self._not_modified(etag, headers):
+            wait = min(float(query.get("wait", ["0"])[0]), self.max_wait)
+            if wait <= 0 or not await self.source.wait_update(view.version, wait):
+                return 304, b"", etag
+            etag, body = build(self.view())
+        return 200, body, etag
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, version, headers = request
+                url = urlsplit(target)
+                query = parse_qs(url.query)
+                if url.path.rstrip("/") == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers, query)
+                    break
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                if method not in ("GET", "HEAD"):
+                    status, body, etag = 405, _dumps({"error": "只支持 GET"}), None
+                else:
+                    try:
+                        status, body, etag = await self._handle_get(url.path, query, headers)
+                    except ValueError as e:
+                        status, body, etag = 400, _dumps({"error": str(e)}), None
+                metrics.inc("map_server_requests", path=url.path if status != 404 else "other", status=status)
+                await self._respond(writer, status, body, etag, keep_alive, head=method == "HEAD")
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # ---------------- WebSocket ----------------
+    async def _websocket(self, reader, writer, headers, query):
+        key = headers.get("sec-websocket-key")
+        if not key:
+            await self._respond(writer, 400, _dumps({"error": "缺少 Sec-WebSocket-Key"}), keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        classes = parse_classes(query.get("cls"))
+        closed = asyncio.Event()
+        reader_task = asyncio.create_task(self._ws_reader(reader, writer, closed))
+        closed_task = asyncio.create_task(closed.wait())
+        self._clients.add(writer)
+        metrics.set_gauge("map_server_ws_clients", len(self._clients))
+        try:
+            view = self.view()
+            writer.write(_ws_frame(0x1, view.snapshot_message(classes)))
+            await writer.drain()
+            while not closed.is_set():
+                update = asyncio.create_task(self.source.wait_update(view.version, self.ping_interval))
+                await asyncio.wait({update, closed_task}, return_when=asyncio.FIRST_COMPLETED)
+                if closed.is_set():
+                    update.cancel()
+                    break
+                if not update.result():
+                    writer.write(_ws_frame(0x9))
+                else:
+                    # 发送较慢的客户端可能跳过中间版本，差异总是相对其已收到的最后一个版本
+                    new = self.view()
+                    writer.write(_ws_frame(0x1, self.diff_message(view, new, classes)))
+                    view = new
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            metrics.set_gauge("map_server_ws_clients", len(self._clients))
+            reader_task.cancel()
+            closed_task.cancel()
+
+    @staticmethod
+    async def _ws_reader(reader, writer, closed):
+        """处理客户端发来的控制帧：close 回应后结束，ping 回应 pong，其余消息忽略"""
+        try:
+            while True:
+                opcode, payload = await _ws_read_frame(reader)
+                if opcode == 0x8:
+                    writer.write(_ws_frame(0x8, payload[:2]))
+                    break
+                if opcode == 0x9:
+                    writer.write(_ws_frame(0xA, payload))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            closed.set()
+
+    # ---------------- 启停 ----------------
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        print(f"地图查询服务已启动：http://{self.host}:{self.port}/map  ws://{self.host}:{self.port}/ws")
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._clients):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="以 HTTP / WebSocket 提供路径文件或巡检快照目录中的地图与路径")
+    parser.add_argument('--path', type=str, default='patrol_snapshot',
+                        help='patrol_daemon 快照目录，或 patrol.py 输出的路径文件')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--poll', type=float, default=1.0, help='检查文件变化的间隔（秒）')
+    args = parser.parse_args()
+
+    server = MapServer(FileMapSource(args.path, poll=args.poll), host=args.host, port=args.port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        print("地图查询服务已退出")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# 延迟直方图桶上界（秒），0.1ms ~ 60s 近似按 1-2.5-5 递增
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+_enabled = False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class Gauge:
+    """瞬时值，如队列深度"""
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram:
+    """固定桶直方图，分位数在桶内线性插值估计"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        with self._lock:
+            counts, total, vmax = list(self.counts), self.count, self.max
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lo = self.buckets[i - 1] if i > 0 else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else vmax
+                return min(lo + (hi - lo) * (rank - seen) / c, vmax)
+            seen += c
+        return vmax
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def _get(self, table, factory, name, labels):
+        key = _key(name, labels)
+        metric = table.get(key)
+        if metric is None:
+            with self._lock:
+                metric = table.setdefault(key, factory())
+        return metric
+
+    def counter(self, name, **labels):
+        return self._get(self.counters, Counter, name, labels)
+
+    def gauge(self, name, **labels):
+        return self._get(self.gauges, Gauge, name, labels)
+
+    def histogram(self, name, **labels):
+        return self._get(self.histograms, Histogram, name, labels)
+
+    def _items(self, table):
+        # 拷贝后排序，避免落盘时其他线程新建指标导致字典在遍历中改变
+        with self._lock:
+            items = list(table.items())
+        return sorted(items, key=lambda kv: (kv[0][0], str(kv[0][1])))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """返回可 JSON 序列化的全部指标"""
+        def rows(table, value_fn):
+            return [{"name": name, "labels": dict(labels), **value_fn(m)}
+                    for (name, labels), m in self._items(table)]
+        return {
+            "timestamp": time.time(),
+            "counters": rows(self.counters, lambda m: {"value": m.value}),
+            "gauges": rows(self.gauges, lambda m: {"value": m.value}),
+            "histograms": rows(self.histograms, lambda m: m.summary()),
+        }
+
+    def to_prometheus(self, prefix="smsp_"):
+        """导出为 Prometheus 文本格式"""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+        lines = []
+        for (name, labels), m in self._items(self.counters):
+            lines.append(f"{prefix}{name}_total{fmt_labels(labels)} {m.value}")
+        for (name, labels), m in self._items(self.gauges):
+            lines.append(f"{prefix}{name}{fmt_labels(labels)} {m.value}")
+        for (name, labels), m in self._items(self.histograms):
+            cumulative = 0
+            for bound, c in zip(list(m.buckets) + ["+Inf"], m.counts):
+                cumulative += c
+                lines.append(f"{prefix}{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{prefix}{name}_sum{fmt_labels(labels)} {m.sum}")
+            lines.append(f"{prefix}{name}_count{fmt_labels(labels)} {m.count}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+# ---------------- 埋点接口（关闭时近似零开销） ----------------
+def inc(name, n=1, **labels):
+    if _enabled:
+        REGISTRY.counter(name, **labels).inc(n)
+
+
+def set_gauge(name, value, **labels):
+    if _enabled:
+        REGISTRY.gauge(name, **labels).set(value)
+
+
+def observe(name, seconds, **labels):
+    if _enabled:
+        REGISTRY.histogram(name, **labels).observe(seconds)
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """with timer("stage_seconds", stage="merge"): ... 记录代码块耗时"""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(REGISTRY.histogram(name, **labels))
+
+
+def timed(stage):
+    """函数装饰器：按阶段记录调用耗时（stage_seconds）与调用次数（stage_calls）"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                REGISTRY.histogram("stage_seconds", stage=stage).observe(time.perf_counter() - start)
+                REGISTRY.counter("stage_calls", stage=stage).inc()
+        return wrapper
+    return decorator
+
+
+# ---------------- 定期落盘 ----------------
+class MetricsFlusher:
+    """
+    后台线程每 interval 秒将指标写入文件（原子替换），
+    JSON 格式额外给出各计数器在最近一个周期内的速率（如帧率）
+    """
+
+    def __init__(self, path, interval=5.0, fmt=None, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt or ("prometheus" if path.endswith(".prom") else "json")
+        self.registry = registry
+        self._last_values = {}
+        self._last_time = time.time()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="metrics-flusher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _render(self):
+        if self.fmt == "prometheus":
+            return self.registry.to_prometheus()
+        snap = self.registry.snapshot()
+        elapsed = max(snap["timestamp"] - self._last_time, 1e-9)
+        for row in snap["counters"]:
+            key = _key(row["name"], row["labels"])
+            row["rate"] = (row["value"] - self._last_values.get(key, 0)) / elapsed
+            self._last_values[key] = row["value"]
+        self._last_time = snap["timestamp"]
+        return json.dumps(snap, indent=2, ensure_ascii=False)
+
+    def flush(self):
+        text = self._render()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"指标写入失败: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+
+def start_flusher(path, interval=5.0, fmt=None):
+    """开启埋点并启动定期落盘，进程退出时写入最后一次"""
+    enable()
+    flusher = MetricsFlusher(path, interval, fmt).start()
+    atexit.register(flusher.close)
+    return flusher
+
+
+def configure_from_env():
+    """
+    由入口脚本在启动时调用：设置了 SMSP_METRICS_FILE（metrics.json 或 .prom）时开启埋点并定期落盘，
+    SMSP_METRICS_INTERVAL 指定落盘间隔（秒）。埋点默认关闭，关闭时各埋点函数只做一次全局开关判断
+    """
+    path = os.environ.get("SMSP_METRICS_FILE")
+    if path:
+        return start_flusher(path, float(os.environ.get("SMSP_METRICS_INTERVAL", "5")))
+    return None
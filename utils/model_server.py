@@ -0,0 +1,144 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from utils import metrics
+from utils.inference_backends import load_backend
+
+
+class ModelServer:
+    """
+    进程内共享的推理服务：
+    各摄像头线程提交单帧，后台线程在 max_batch_size 或 max_latency 先到者触发时合批推理，
+    再把结果分发回各调用方。整个进程只保留一份模型权重。
+
+    实例可以像 YOLO 模型一样调用：server(frame, conf=0.25) 返回 [Results]，
+    因此可直接传给 predict_single_frame 等接受模型的函数。
+    """
+
+    def __init__(self, model, max_batch_size=8, max_latency=0.01, **predict_kwargs):
+        """
+        :param model: 模型路径（.pt / .onnx / OpenVINO 目录，见 utils.inference_backends）或已加载的模型
+        :param max_batch_size: 单次推理的最大帧数
+        :param max_latency: 首帧到达后等待凑批的最长时间（秒）
+        :param predict_kwargs: 每次推理固定传给模型的参数，如 imgsz
+        """
+        self.model = load_backend(model) if isinstance(model, str) else model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_latency = max_latency
+        self.predict_kwargs = predict_kwargs
+
+        self._queue = queue.Queue()
+        self._running = True
+        self._lock = threading.Lock()
+        self.num_batches = 0
+        self.num_frames = 0
+        self.busy_time = 0.0
+
+        self._thread = threading.Thread(target=self._loop, name="model-server", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, conf=0.25, **kwargs):
+        """
+        提交一帧，返回 Future，结果为该帧的 Results
+        :param kwargs: 本次推理的额外参数（如 imgsz），覆盖构造时的 predict_kwargs；参数不同的请求分开推理
+        """
+        if not self._running:
+            raise RuntimeError("推理服务已关闭")
+        kwargs.pop("verbose", None)
+        future = Future()
+        self._queue.put((frame, conf, kwargs, future))
+        return future
+
+    def predict(self, frame, conf=0.25, timeout=None, **kwargs):
+        """提交一帧并等待结果"""
+        return self.submit(frame, conf, **kwargs).result(timeout=timeout)
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        futures = [self.submit(frame, conf, **kwargs) for frame in frames]
+        return [f.result() for f in futures]
+
+    def _collect_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        metrics.set_gauge("model_server_queue_depth", self._queue.qsize())
+        batch = [item]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # 把停止信号放回，处理完当前批次后再退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run_batch(self, batch):
+        # 置信度阈值或推理参数不同的请求分开推理
+        groups = {}
+        for frame, conf, kwargs, future in batch:
+            key = (conf, json.dumps(kwargs, sort_keys=True, default=str))
+            groups.setdefault(key, (kwargs, []))[1].append((frame, future))
+
+        for (conf, _), (kwargs, items) in groups.items():
+            start = time.perf_counter()
+            try:
+                results = self.model([frame for frame, _ in items], conf=conf,
+                                     verbose=False, **{**self.predict_kwargs, **kwargs})
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(items, results):
+                future.set_result(result)
+            elapsed = time.perf_counter() - start
+            metrics.observe("stage_seconds", elapsed, stage="server_batch")
+            metrics.inc("inference_frames", len(items))
+            with self._lock:
+                self.busy_time += elapsed
+                self.num_batches += 1
+                self.num_frames += len(items)
+
+    def _loop(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+            self._run_batch(batch)
+
+        # 取消关闭后仍未处理的请求
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[3].cancel()
+
+    def stats(self):
+        with self._lock:
+            mean_batch = self.num_frames / self.num_batches if self.num_batches else 0.0
+            fps = self.num_frames / self.busy_time if self.busy_time > 0 else 0.0
+            return {
+                "batches": self.num_batches,
+                "frames": self.num_frames,
+                "mean_batch_size": mean_batch,
+                "inference_fps": fps
+            }
+
+    def close(self):
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,146 @@
+import copy
+import threading
+import time
+
+import cv2
+
+
+def reuse_result(result, frame):
+    """复用上一帧的检测结果，但绘制在当前帧上（Results.plot() 使用 orig_img 作为底图）"""
+    reused = copy.copy(result)
+    reused.orig_img = frame
+    return reused
+
+
+class MotionGate:
+    """
+    运动门控：把每帧缩小为灰度小图，与上一次推理时的小图比较，
+    变化像素比例低于 threshold 时认为画面未变化，可复用上次的检测结果；
+    距上次推理超过 max_age 秒或连续跳过 max_skip 帧时强制推理。
+    """
+
+    def __init__(self, threshold=0.01, pixel_delta=20, max_age=5.0, max_skip=None, size=(96, 54)):
+        """
+        :param threshold: 变化像素占比阈值，超过则重新推理
+        :param pixel_delta: 单个像素灰度差超过该值才计为变化（过滤噪声）
+        :param max_age: 复用结果的最长时间（秒）
+        :param max_skip: 最多连续跳过的帧数，None 不限制
+        :param size: 比较用小图的尺寸 (宽, 高)
+        """
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_age = max_age
+        self.max_skip = max_skip
+        self.size = size
+        self._reference = None
+        self._reference_time = 0.0
+        self._skipped_in_row = 0
+        self.last_change = 0.0
+
+        self.frames = 0
+        self.inferred = 0
+        self.skipped = 0
+        self.gate_time = 0.0
+
+    def _thumbnail(self, frame):
+        # 先按步长抽样到目标尺寸的约两倍，再做区域平均缩放，开销约为直接 INTER_AREA 的 1/4
+        w, h = self.size
+        step = max(1, min(frame.shape[0] // (2 * h), frame.shape[1] // (2 * w)))
+        small = cv2.resize(frame[::step, ::step], self.size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (3, 3), 0)
+
+    def change_ratio(self, small):
+        """小图与参考小图之间变化像素的占比"""
+        diff = cv2.absdiff(small, self._reference)
+        _, mask = cv2.threshold(diff, self.pixel_delta, 255, cv2.THRESH_BINARY)
+        return cv2.countNonZero(mask) / mask.size
+
+    def should_infer(self, frame):
+        """判断当前帧是否需要推理；返回 True 时该帧成为新的参考帧"""
+        start = time.perf_counter()
+        self.frames += 1
+        small = self._thumbnail(frame)
+        now = time.monotonic()
+
+        if self._reference is None or self._reference.shape != small.shape:
+            infer = True
+        elif now - self._reference_time >= self.max_age:
+            infer = True
+        elif self.max_skip is not None and self._skipped_in_row >= self.max_skip:
+            infer = True
+        else:
+            self.last_change = self.change_ratio(small)
+            infer = self.last_change > self.threshold
+
+        if infer:
+            self._reference = small
+            self._reference_time = now
+            self._skipped_in_row = 0
+            self.inferred += 1
+        else:
+            self._skipped_in_row += 1
+            self.skipped += 1
+        self.gate_time += time.perf_counter() - start
+        return infer
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "inferred": self.inferred,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.frames if self.frames else 0.0,
+            "gate_time": self.gate_time,
+        }
+
+
+class GatedPredictor:
+    """
+    带运动门控的模型包装：接口与 YOLO 模型一致（model(frame, conf=...) -> [Results]），
+    可直接传给 predict_single_frame 等函数。每个摄像头应使用独立实例。
+    """
+
+    def __init__(self, model, gate=None, **gate_kwargs):
+        """
+        :param model: YOLO 模型或 ModelServer
+        :param gate: MotionGate，None 时按 gate_kwargs 新建
+        """
+        self.model = model
+        self.gate = gate or MotionGate(**gate_kwargs)
+        self._last = None
+        self._lock = threading.Lock()
+        self.infer_time = 0.0
+
+    def predict(self, frame, conf=0.25, **kwargs):
+        """返回当前帧的 Results，画面未变化时复用上一次的检测结果"""
+        with self._lock:
+            if self._last is not None and not self.gate.should_infer(frame):
+                return reuse_result(self._last, frame)
+            if self._last is None:
+                self.gate.should_infer(frame)  # 首帧作为参考帧
+            start = time.perf_counter()
+            result = self.model(frame, conf=conf, **kwargs)[0]
+            self.infer_time += time.perf_counter() - start
+            self._last = result
+            return result
+
+    def __call__(self, source, conf=0.25, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        return [self.predict(frame, conf, **kwargs) for frame in frames]
+
+    def stats(self):
+        """门控统计，est_saved_time 为按平均推理耗时估算的节省时间（已扣除门控开销）"""
+        stats = self.gate.stats()
+        mean_infer = self.infer_time / stats["inferred"] if stats["inferred"] else 0.0
+        stats["mean_infer_time"] = mean_infer
+        stats["est_saved_time"] = stats["skipped"] * mean_infer - stats["gate_time"]
+        total = self.infer_time + stats["gate_time"] + stats["skipped"] * mean_infer
+        stats["est_saved_ratio"] = stats["est_saved_time"] / total if total > 0 else 0.0
+        return stats
+
+    def summary(self):
+        s = self.stats()
+        return (f"共 {s['frames']} 帧，推理 {s['inferred']} 帧，跳过 {s['skipped']} 帧"
+                f"（{s['skip_ratio']:.1%}），约节省推理耗时 {s['est_saved_time']:.2f}s"
+                f"（{s['est_saved_ratio']:.1%}）")
@@ -1,24 +1,105 @@
 import os
+import queue
+import threading
 import cv2
 
 from glob import glob
+from utils.metrics import timed
+from utils.roi import remap_result
 
 def get_all_frames_from_directory(directory):
     """从一个文件夹中按时间顺序获取所有图像帧路径"""
     image_paths = sorted(glob(os.path.join(directory, '*.jpg')))
     return image_paths
 
-def predict_single_frame(model, frame, conf=0.25):
-    """对单帧图像进行YOLO推理并返回渲染后的图像"""
-    results = model(frame, conf=conf)
-    return results[0].plot()
+@timed("inference")
+def predict_single_frame(model, frame, conf=0.25, roi=None, detection_store=None, cam_id=0, timestamp_ms=None):
+    """
+    对单帧图像进行YOLO推理并返回渲染后的图像
+    :param roi: utils.roi.CameraROI，指定时只对巡检区域对应的像素区域推理，结果绘制在整帧上
+    :param detection_store: utils.detection_store.DetectionStoreWriter，指定时同时记录该帧的检测结果
+    :param cam_id: 记录检测结果时的摄像头编号
+    :param timestamp_ms: 记录检测结果时的帧时间戳，默认当前时间
+    """
+    if roi is None:
+        result = model(frame, conf=conf)[0]
+    else:
+        patch, transform = roi.crop(frame)
+        if patch is None:
+            if detection_store is not None:
+                detection_store.append(cam_id, [], [], [], timestamp_ms)
+            return frame.copy()
+        result = remap_result(model(patch, conf=conf)[0], frame, transform)
+    if detection_store is not None:
+        detection_store.append_result(cam_id, result, timestamp_ms)
+    return result.plot()
 
 def save_frame_as_image(frame, save_path):
-    """保存单帧图像到指定路径"""
-    cv2.imwrite(save_path, frame)
+    """保存单帧图像到指定路径，返回是否成功"""
+    return cv2.imwrite(save_path, frame)
 
 def initialize_video_writer(example_frame, output_path, fps=20):
     """根据图像初始化一个视频写入器"""
     h, w = example_frame.shape[:2]
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    return cv2.VideoWriter(output_path, fourcc, fps, (w, h))
\ No newline at end of file
+    return cv2.VideoWriter(output_path, fourcc, fps, (w, h))
+
+class AsyncFrameSink:
+    """
+    异步结果写出：图像保存与视频写入放到后台线程，按提交顺序落盘
+    队列有界，写盘跟不上时 put 会阻塞，从而对上游形成背压
+    后台线程出错后继续取空队列（不再写出），错误在下一次 put 或 close 时重新抛出
+    """
+
+    def __init__(self, image_dir=None, video_path=None, fps=20, max_queue=64):
+        self.image_dir = image_dir
+        self.video_path = video_path
+        self.fps = fps
+        self.writer = None
+        self.written = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=max_queue)
+        if image_dir:
+            os.makedirs(image_dir, exist_ok=True)
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"结果写出失败: {self.error}") from self.error
+
+    def put(self, filename, frame):
+        self._raise_error()
+        self._queue.put((filename, frame))
+
+    def _write(self, filename, frame):
+        if self.image_dir:
+            path = os.path.join(self.image_dir, filename)
+            if not save_frame_as_image(frame, path):
+                raise OSError(f"图像保存失败: {path}")
+        if self.video_path:
+            if self.writer is None:
+                self.writer = initialize_video_writer(frame, self.video_path, self.fps)
+                if not self.writer.isOpened():
+                    raise OSError(f"无法创建视频文件: {self.video_path}")
+            self.writer.write(frame)
+        self.written += 1
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self.error is not None:
+                continue  # 已出错：只取出队列项，避免 put 永久阻塞
+            try:
+                self._write(*item)
+            except Exception as e:
+                self.error = e
+        if self.writer:
+            self.writer.release()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
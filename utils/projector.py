@@ -5,8 +5,45 @@ def project_points(H, pixel_points):
     """
     输入像素坐标点 (N, 2)，输出世界坐标点 (N, 2)
     """
-    pixel_points = np.array(pixel_points, dtype=np.float32)
-    pixel_points = np.concatenate([pixel_points, np.ones((len(pixel_points), 1))], axis=1)
-    world_points = (H @ pixel_points.T).T
-    world_points /= world_points[:, 2:3]
-    return world_points[:, :2]
+    pixel_points = np.asarray(pixel_points, dtype=np.float64).reshape(-1, 2)
+    H = np.asarray(H, dtype=np.float64)
+    # 齐次坐标的最后一维恒为 1，直接拆成线性部分与平移部分，避免拼接临时数组
+    world_points = pixel_points @ H[:, :2].T + H[:, 2]
+    return world_points[:, :2] / world_points[:, 2:3]
+
+def _to_numpy(x):
+    """torch.Tensor / numpy 数组统一转为 numpy 数组"""
+    if hasattr(x, "cpu"):
+        x = x.cpu().numpy()
+    return np.asarray(x)
+
+def boxes_to_arrays(boxes):
+    """
+    将一个 YOLO Boxes 对象整体转换为 numpy 数组（每个属性只做一次设备拷贝）
+    返回: cls (N,), conf (N,), xyxy (N, 4)
+    """
+    if boxes is None or len(boxes) == 0:
+        return np.empty(0), np.empty(0), np.empty((0, 4))
+    cls = _to_numpy(boxes.cls).reshape(-1).astype(np.float64)
+    conf = _to_numpy(boxes.conf).reshape(-1).astype(np.float64)
+    xyxy = _to_numpy(boxes.xyxy).reshape(-1, 4).astype(np.float64)
+    return cls, conf, xyxy
+
+def ground_points(xyxy):
+    """由检测框 (N, 4) 计算用于投影的像素点 (N, 2)，当前取框中心"""
+    xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+    return np.stack([(xyxy[:, 0] + xyxy[:, 2]) / 2,
+                     (xyxy[:, 1] + xyxy[:, 3]) / 2], axis=1)
+
+def project_detections(H, cls, conf, xyxy, conf_thresh=0.0):
+    """
+    一次性完成置信度过滤、地面点计算与单应投影
+    返回 (M, 4) 数组，每行为 [cls, x, y, conf]
+    """
+    cls = np.asarray(cls, dtype=np.float64).reshape(-1)
+    conf = np.asarray(conf, dtype=np.float64).reshape(-1)
+    keep = conf >= conf_thresh
+    if not np.any(keep):
+        return np.empty((0, 4))
+    world = project_points(H, ground_points(np.asarray(xyxy)[keep]))
+    return np.column_stack([cls[keep], world, conf[keep]])
@@ -0,0 +1,243 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+# 各类别的绘制颜色（BGR），类别数超出时循环使用
+CLASS_COLORS = [
+    (180, 119, 31), (14, 127, 255), (44, 160, 44), (40, 39, 214), (189, 103, 148),
+    (75, 86, 140), (194, 119, 227), (127, 127, 127), (34, 189, 188), (207, 190, 23),
+]
+
+
+# 类别编码：0 为空白，1..len(CLASS_COLORS) 为各类别，最后一个编码用于 cls < 0 的点（黑色）
+_NEGATIVE_CODE = len(CLASS_COLORS) + 1
+_COLOR_LUT = np.zeros((256, 1, 3), dtype=np.uint8)
+_COLOR_LUT[1:_NEGATIVE_CODE, 0] = CLASS_COLORS
+
+
+class WorldMapRenderer:
+    """
+    世界坐标地图的离屏渲染：
+    背景与网格只绘制一次，每帧把背景拷贝到预分配的画布，
+    所有点先以类别编码写入预分配的标签图，再经一次膨胀 + 查色表整体绘制，
+    不创建任何 GUI 窗口，可在无显示器的服务器上运行。
+    """
+
+    def __init__(self, world_bounds, size=(800, 600), flip_y=True, grid_step=None,
+                 point_radius=4, max_fps=10, background=(255, 255, 255)):
+        """
+        :param world_bounds: 画布覆盖的世界坐标范围 (xmin, ymin, xmax, ymax)
+        :param size: 画布尺寸 (宽, 高)
+        :param flip_y: 世界坐标 Y 轴朝上（与 matplotlib 一致）
+        :param grid_step: 网格间距（世界坐标单位），None 不绘制网格
+        :param max_fps: render() 的帧率上限
+        """
+        self.world_bounds = tuple(float(v) for v in world_bounds)
+        self.width, self.height = size
+        self.flip_y = flip_y
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self._kernel = cv2.getStructuringElement(
+            cv2.MORPH_ELLIPSE, (2 * int(point_radius) + 1, 2 * int(point_radius) + 1))
+        self._last_render = 0.0
+        self._last_input = None
+
+        self._background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._background[:] = background
+        if grid_step:
+            self._draw_grid(grid_step)
+        self.canvas = self._background.copy()
+        self._labels = np.zeros((self.height, self.width), dtype=np.uint8)
+
+    def _draw_grid(self, step):
+        xmin, ymin, xmax, ymax = self.world_bounds
+        for x in np.arange(np.ceil(xmin / step) * step, xmax, step):
+            px = int(self.world_to_pixel([[x, ymin]])[0, 0])
+            cv2.line(self._background, (px, 0), (px, self.height - 1), (225, 225, 225), 1)
+        for y in np.arange(np.ceil(ymin / step) * step, ymax, step):
+            py = int(self.world_to_pixel([[xmin, y]])[0, 1])
+            cv2.line(self._background, (0, py), (self.width - 1, py), (225, 225, 225), 1)
+
+    def world_to_pixel(self, world_points):
+        """世界坐标 (N, 2) 转画布像素坐标 (N, 2)"""
+        xmin, ymin, xmax, ymax = self.world_bounds
+        pts = np.asarray(world_points, dtype=np.float64).reshape(-1, 2)
+        u = (pts[:, 0] - xmin) / (xmax - xmin) * (self.width - 1)
+        v = (pts[:, 1] - ymin) / (ymax - ymin) * (self.height - 1)
+        if self.flip_y:
+            v = (self.height - 1) - v
+        return np.stack([u, v], axis=1)
+
+    def due(self):
+        """距上一帧是否已超过帧率上限对应的间隔"""
+        return time.monotonic() - self._last_render >= self.min_interval
+
+    def _stamp(self, pixels, codes):
+        """一次性绘制所有点：圆心写入标签图，膨胀成圆盘后按色表着色并覆盖到画布"""
+        self._labels.fill(0)
+        centers = np.rint(pixels).astype(np.int64)
+        keep = ((centers[:, 0] >= 0) & (centers[:, 0] < self.width) &
+                (centers[:, 1] >= 0) & (centers[:, 1] < self.height))
+        self._labels[centers[keep, 1], centers[keep, 0]] = codes[keep]
+        labels = cv2.dilate(self._labels, self._kernel)
+        colored = cv2.LUT(cv2.merge([labels, labels, labels]), _COLOR_LUT)
+        cv2.copyTo(colored, labels, self.canvas)
+
+    def draw(self, points_array, route=None, labels=False):
+        """
+        重绘地图
+        :param points_array: (N, 4) [cls, x, y, conf]，cls 为负数的点（如原点）绘制为黑色
+        :param route: 点下标序列，绘制为折线
+        :param labels: True 标注点下标，或传入与点一一对应的文字序列（逐点 putText，点很多时较慢）
+        """
+        np.copyto(self.canvas, self._background)
+        points_array = np.asarray(points_array, dtype=np.float64).reshape(-1, 4)
+        if len(points_array) == 0:
+            return self.canvas
+
+        pixels = self.world_to_pixel(points_array[:, 1:3])
+        if route is not None and len(route) > 1:
+            path = np.rint(pixels[np.asarray(route)]).astype(np.int32)
+            cv2.polylines(self.canvas, [path], False, (200, 80, 0), 1, cv2.LINE_AA)
+
+        cls = points_array[:, 0].astype(np.int64)
+        codes = np.where(cls < 0, _NEGATIVE_CODE, cls % len(CLASS_COLORS) + 1).astype(np.uint8)
+        self._stamp(pixels, codes)
+
+        if labels is not False and labels is not None:
+            texts = range(len(pixels)) if labels is True else labels
+            for text, (u, v) in zip(texts, pixels):
+                cv2.putText(self.canvas, str(text), (int(u) + 5, int(v) - 5),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 1)
+        return self.canvas
+
+    def render(self, points_array, route=None, labels=False, force=False):
+        """
+        按帧率上限渲染：未到时间或输入与上一帧相同时返回 None，否则返回画布
+        """
+        if not force and not self.due():
+            return None
+        key = (np.asarray(points_array), None if route is None else tuple(route),
+               labels if isinstance(labels, bool) or labels is None else tuple(labels))
+        if not force and self._last_input is not None and key[1:] == self._last_input[1:] \
+                and np.array_equal(key[0], self._last_input[0]):
+            return None
+        self._last_input = (key[0].copy(), key[1], key[2])
+        self._last_render = time.monotonic()
+        return self.draw(points_array, route, labels)
+
+
+# ---------------- 输出 ----------------
+class PNGSnapshotSink:
+    """每帧覆盖写入同一张图片（原子替换），供网页或其他进程读取最新画面"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, canvas):
+        ext = os.path.splitext(self.path)[1]
+        ok, buf = cv2.imencode(ext, canvas)
+        if not ok:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.tobytes())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        pass
+
+
+class MJPEGSink:
+    """把每帧 JPEG 顺序追加到 .mjpeg 文件（ffplay / VLC 可直接播放）"""
+
+    def __init__(self, path, quality=80):
+        self.quality = quality
+        self._f = open(path, "wb")
+
+    def write(self, canvas):
+        ok, buf = cv2.imencode(".jpg", canvas, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if ok:
+            self._f.write(buf.tobytes())
+            self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+
+class VideoSink:
+    """写入 MP4/AVI 视频"""
+
+    def __init__(self, path, fps=10):
+        self.path = path
+        self.fps = fps
+        self._writer = None
+
+    def write(self, canvas):
+        if self._writer is None:
+            h, w = canvas.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*("mp4v" if self.path.endswith(".mp4") else "XVID"))
+            self._writer = cv2.VideoWriter(self.path, fourcc, self.fps, (w, h))
+        self._writer.write(canvas)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.release()
+
+
+class DisplaySink:
+    """有显示器时的窗口输出"""
+
+    def __init__(self, window="世界坐标地图"):
+        self.window = window
+
+    def write(self, canvas):
+        cv2.imshow(self.window, canvas)
+        cv2.waitKey(1)
+
+    def close(self):
+        cv2.destroyWindow(self.window)
+
+
+def open_sink(path=None, fps=10):
+    """按文件扩展名选择输出：.png/.jpg 快照、.mjpeg 流、.mp4/.avi 视频，None 为窗口显示"""
+    if path is None:
+        return DisplaySink()
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".png", ".jpg", ".jpeg"):
+        return PNGSnapshotSink(path)
+    if ext in (".mjpeg", ".mjpg"):
+        return MJPEGSink(path)
+    if ext in (".mp4", ".avi"):
+        return VideoSink(path, fps)
+    raise ValueError(f"不支持的输出格式: {path}")
+
+
+class LiveMapPublisher:
+    """渲染器 + 多个输出：publish() 在帧率上限内渲染并写入所有输出"""
+
+    def __init__(self, renderer, sinks):
+        self.renderer = renderer
+        self.sinks = list(sinks)
+        self.frames = 0
+
+    def publish(self, points_array, route=None, labels=False, force=False):
+        canvas = self.renderer.render(points_array, route, labels, force)
+        if canvas is None:
+            return False
+        for sink in self.sinks:
+            sink.write(canvas)
+        self.frames += 1
+        return True
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,150 @@
+import cv2
+import numpy as np
+
+from utils.projector import project_points
+
+
+def world_roi(H, world_bounds, frame_shape, margin=16, samples=64):
+    """
+    计算世界坐标范围在图像中对应的像素区域
+    将世界矩形边界密集采样后经 H^-1 映射到图像（只保留位于相机前方的点），
+    再加上投影落在世界范围内的图像角点，取外接矩形并裁剪到图像内
+    :param H: 图像像素 -> 世界坐标的单应矩阵
+    :param world_bounds: (xmin, ymin, xmax, ymax)
+    :param frame_shape: (高, 宽)
+    :param margin: 外扩像素，避免裁掉跨越边界的目标
+    :return: (x0, y0, x1, y1)，世界范围不可见时返回 None
+    """
+    h, w = frame_shape[:2]
+    xmin, ymin, xmax, ymax = world_bounds
+    H = np.asarray(H, dtype=np.float64)
+    # 单应矩阵只确定到相差一个非零倍数，画面底部中点必在地面上，以其齐次坐标的符号作为"相机前方"
+    front = np.sign(H[2] @ np.array([(w - 1) / 2.0, h - 1, 1.0])) or 1.0
+
+    t = np.linspace(0.0, 1.0, samples)
+    edges = np.concatenate([
+        np.stack([xmin + (xmax - xmin) * t, np.full_like(t, ymin)], axis=1),
+        np.stack([np.full_like(t, xmax), ymin + (ymax - ymin) * t], axis=1),
+        np.stack([xmin + (xmax - xmin) * t, np.full_like(t, ymax)], axis=1),
+        np.stack([np.full_like(t, xmin), ymin + (ymax - ymin) * t], axis=1),
+    ])
+    Hi = np.linalg.inv(H)
+    img = edges @ Hi[:, :2].T + Hi[:, 2]
+    visible = img[:, 2] * front > 0
+    pts = img[visible, :2] / img[visible, 2:3]
+
+    corners = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype=np.float64)
+    world = project_points(H, corners)
+    inside = ((corners @ H[2, :2] + H[2, 2]) * front > 0) & \
+             (world[:, 0] >= xmin) & (world[:, 0] <= xmax) & \
+             (world[:, 1] >= ymin) & (world[:, 1] <= ymax)
+    pts = np.concatenate([pts, corners[inside]])
+    # 只保留落在图像内的采样点；世界矩形完全包住图像时由角点给出整幅图像
+    pts = pts[(pts[:, 0] >= -margin) & (pts[:, 0] <= w - 1 + margin) &
+              (pts[:, 1] >= -margin) & (pts[:, 1] <= h - 1 + margin)]
+    if len(pts) == 0:
+        return None
+
+    x0, y0 = np.floor(pts.min(axis=0)) - margin
+    x1, y1 = np.ceil(pts.max(axis=0)) + margin + 1
+    x0, y0 = int(max(0, x0)), int(max(0, y0))
+    x1, y1 = int(min(w, x1)), int(min(h, y1))
+    if x1 - x0 < 2 or y1 - y0 < 2:
+        return None
+    return x0, y0, x1, y1
+
+
+def letterbox(image, size, color=(114, 114, 114)):
+    """
+    等比缩放后填充为 size x size 的方形图像
+    :return: (图像, 缩放比例, (左侧填充, 上方填充))
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = int(round(h * scale)), int(round(w * scale))
+    resized = cv2.resize(image, (nw, nh), interpolation=cv2.INTER_LINEAR) if scale != 1 else image
+    top, left = (size - nh) // 2, (size - nw) // 2
+    out = cv2.copyMakeBorder(resized, top, size - nh - top, left, size - nw - left,
+                             cv2.BORDER_CONSTANT, value=color)
+    return out, scale, (left, top)
+
+
+class CameraROI:
+    """
+    单个摄像头的推理感兴趣区域：
+    区域由世界范围与单应矩阵推算，按帧尺寸缓存，只在首帧或标定变化时计算
+    """
+
+    def __init__(self, H, world_bounds, margin=16, imgsz=None):
+        """
+        :param imgsz: 指定时裁剪区域再 letterbox 为 imgsz x imgsz，否则只裁剪（由模型自行缩放）
+        """
+        self.H = np.asarray(H, dtype=np.float64)
+        self.world_bounds = tuple(world_bounds)
+        self.margin = margin
+        self.imgsz = imgsz
+        self._rects = {}
+
+    def update(self, H):
+        """更新单应矩阵（标定热更新后调用）"""
+        H = np.asarray(H, dtype=np.float64)
+        if not np.array_equal(H, self.H):
+            self.H = H
+            self._rects.clear()
+
+    def rect(self, frame_shape):
+        key = tuple(frame_shape[:2])
+        if key not in self._rects:
+            self._rects[key] = world_roi(self.H, self.world_bounds, key, self.margin)
+        return self._rects[key]
+
+    def crop(self, frame):
+        """
+        :return: (送入模型的图像, 变换参数)，世界范围在该摄像头中不可见时返回 (None, None)
+        """
+        rect = self.rect(frame.shape)
+        if rect is None:
+            return None, None
+        x0, y0, x1, y1 = rect
+        patch = frame[y0:y1, x0:x1]
+        if self.imgsz is None:
+            return patch, (1.0, (0, 0), (x0, y0))
+        patch, scale, pad = letterbox(patch, self.imgsz)
+        return patch, (scale, pad, (x0, y0))
+
+    @staticmethod
+    def to_full(xyxy, transform):
+        """把模型输入图像上的检测框 (N, 4) 映射回原始整帧坐标"""
+        scale, (px, py), (x0, y0) = transform
+        xyxy = np.asarray(xyxy, dtype=np.float64).reshape(-1, 4).copy()
+        xyxy[:, [0, 2]] = (xyxy[:, [0, 2]] - px) / scale + x0
+        xyxy[:, [1, 3]] = (xyxy[:, [1, 3]] - py) / scale + y0
+        return xyxy
+
+    def pixel_fraction(self, frame_shape):
+        """ROI 像素数占整帧的比例"""
+        rect = self.rect(frame_shape)
+        if rect is None:
+            return 0.0
+        x0, y0, x1, y1 = rect
+        return (x1 - x0) * (y1 - y0) / float(frame_shape[0] * frame_shape[1])
+
+
+def remap_result(result, frame, transform):
+    """
+    把在 ROI 图像上得到的 YOLO Results 转换为整帧上的 Results，
+    便于直接调用 plot() 在原始画面上绘制
+    """
+    from utils.inference_cache import Detections
+
+    if isinstance(result, Detections):
+        return Detections(result.cls, result.conf, CameraROI.to_full(result.xyxy, transform),
+                          frame.shape[:2], result.names, frame)
+
+    from ultralytics.engine.results import Results
+
+    boxes = result.boxes
+    data = boxes.data.cpu().numpy().copy() if hasattr(boxes.data, "cpu") else np.array(boxes.data)
+    if len(data):
+        data[:, :4] = CameraROI.to_full(data[:, :4], transform)
+    return Results(frame, path=result.path, names=result.names, boxes=data)
@@ -1,25 +1,71 @@
+import time
 import cv2
 import numpy as np
 from camera.capture import capture_frame
+from camera.camera_pool import get_default_pool
 from utils.projector import project_points
+from utils.birdseye import BirdEyeView, world_bounds_from_calibration
+from calibration.calibration_store import CalibrationStore
+from utils.renderer import WorldMapRenderer, LiveMapPublisher, open_sink
 
-def show_projected_points(cam_ids, H_matrices):
-    while True:
-        canvas = np.ones((600, 800, 3), dtype=np.uint8) * 255
-        for cam_id in cam_ids:
-            frame = capture_frame(cam_id)
-            # 模拟检测框（此处应由YOLO调用替换）
-            center = (frame.shape[1]//2, frame.shape[0]//2)
-            points = [center]
+def show_projected_points(cam_ids, H_matrices, pool=None, output=None, fps=2, max_frames=None):
+    """
+    :param output: None 时窗口显示；指定 .png/.mjpeg/.mp4 路径时离屏渲染写入文件，无需显示器
+    :param max_frames: 离屏模式下输出的帧数上限，None 表示一直运行
+    """
+    # 摄像头句柄常驻，避免每次循环重新打开设备
+    pool = pool or get_default_pool()
+    # 画布 800x600，每个世界坐标单位 100 像素，Y 轴朝下
+    renderer = WorldMapRenderer((0, 0, 7.99, 5.99), size=(800, 600), flip_y=False,
+                                point_radius=8, max_fps=fps)
+    publisher = LiveMapPublisher(renderer, [] if output is None else [open_sink(output, fps)])
+    try:
+        while max_frames is None or publisher.frames < max_frames:
+            rows = []
+            for cam_id in cam_ids:
+                frame = capture_frame(cam_id, pool=pool)
+                # 模拟检测框（此处应由YOLO调用替换）
+                center = (frame.shape[1]//2, frame.shape[0]//2)
+                projected = project_points(H_matrices[cam_id], [center])
+                rows.extend([3, x, y, 1.0] for x, y in projected)
+
+            points = np.array(rows, dtype=np.float64).reshape(-1, 4)
+            labels = [f"({x:.2f}, {y:.2f})" for x, y in points[:, 1:3]]
+            publisher.publish(points, labels=labels, force=True)
+            if output is None:
+                cv2.imshow("绝对坐标投影图", renderer.canvas)
+                if cv2.waitKey(int(1000 / fps)) & 0xFF == 27:
+                    break
+            else:
+                time.sleep(1.0 / fps)
+    finally:
+        publisher.close()
+        if output is None:
+            cv2.destroyAllWindows()
 
-            H = H_matrices[cam_id]
-            projected = project_points(H, points)
-            for x, y in projected:
-                cv2.circle(canvas, (int(x * 100), int(y * 100)), 8, (0, 0, 255), -1)
-                cv2.putText(canvas, f"({x:.2f}, {y:.2f})", (int(x*100)+5, int(y*100)-5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0,0,0), 1)
+def show_birdseye_mosaic(cam_ids, homography_path="camera_homography.json", pool=None,
+                         fps=10, scale=2.0, world_bounds=None):
+    """
+    实时鸟瞰拼接监控：所有摄像头画面按单应矩阵变换到世界坐标后拼接到同一画面
+    每个摄像头的 remap 查找表只在首帧（或标定变化时）生成一次，重新标定后无需重启
+    """
+    store = CalibrationStore(homography_path)
+    if world_bounds is None:
+        world_bounds = world_bounds_from_calibration(homography_path)
+    view = BirdEyeView({int(k): H for k, H in store.homographies().items()},
+                       world_bounds=world_bounds, scale=scale)
+    pool = pool or get_default_pool()
+    interval = 1.0 / fps
+
+    while True:
+        start = time.monotonic()
+        if store.reload_if_changed():
+            view.update_homographies({int(k): H for k, H in store.homographies().items()})
+        frames = {cam_id: pool.read(cam_id, timeout=interval) for cam_id in cam_ids}
+        cv2.imshow("鸟瞰拼接图", view.mosaic(frames))
 
-        cv2.imshow("绝对坐标投影图", canvas)
-        if cv2.waitKey(500) & 0xFF == 27:
+        # 按目标帧率限速，剩余时间交给 waitKey
+        wait_ms = max(1, int((interval - (time.monotonic() - start)) * 1000))
+        if cv2.waitKey(wait_ms) & 0xFF == 27:
             break
     cv2.destroyAllWindows()